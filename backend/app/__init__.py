@@ -1,25 +1,83 @@
-from flask import Flask
+import os
+import time
+
+from flask import Flask, Response
 from flask_cors import CORS
-from app.extensions import db
+from app.extensions import db, metrics, database, cache, single_flight, conditional, serialization, columnar, filter_compiler, auth, summaries
 from app.config import Config
+from app.commands import register_commands
+from app import lifecycle
 
 #Rotas
 from app.routes.auth import auth_bp
 from app.routes.diagnostics import diagnostics_bp
+from app.routes.locations import locations_bp
 
-def create_app():
+def create_app(config=None):
+    """Cria a aplicação; config substitui valores do Config (ex.: nos testes)"""
     app = Flask(__name__)
     app.config.from_object(Config)
+    if config:
+        app.config.update(config)
     
     db.init_app(app)
+    metrics.init_app(app)
+    database.init_app(app)
+    cache.init_app(app)
+    single_flight.init_app(app)
+    conditional.init_app(app)
+    serialization.init_app(app)
+    columnar.init_app(app)
+    filter_compiler.init_app(app)
+    auth.init_app(app)
+    summaries.init_app(app)
     CORS(app)
+    register_commands(app)
 
     app.register_blueprint(auth_bp, url_prefix='/api')
     app.register_blueprint(diagnostics_bp, url_prefix='/api')
+    app.register_blueprint(locations_bp, url_prefix='/api')
 
     @app.route('/api/health', methods=['GET'])
+    @auth.public
     def health_check():
-        return {'status': 'healthy'}, 200
+        started = time.perf_counter()
+        try:
+            db.session.execute(db.text("SELECT 1")).scalar()
+        except Exception as e:
+            app.logger.error(f'Health check: banco indisponível: {str(e)}')
+            return {'status': 'unhealthy', 'database': {'status': 'error'}}, 503
+
+        latency_ms = round((time.perf_counter() - started) * 1000, 3)
+        return {'status': 'healthy', 'database': {'status': 'ok', 'latency_ms': latency_ms}}, 200
+
+    @app.route('/api/health/live', methods=['GET'])
+    @auth.public
+    def liveness_check():
+        """Liveness: o processo responde (não consulta o banco)"""
+        return {'status': 'alive', 'pid': os.getpid()}, 200
+
+    @app.route('/api/health/ready', methods=['GET'])
+    @auth.public
+    def readiness_check():
+        """Readiness: banco acessível e schema na versão do código (503 enquanto não)"""
+        try:
+            ready, checks = lifecycle.readiness()
+        except Exception as e:
+            app.logger.error(f'Readiness: banco indisponível: {str(e)}')
+            return {'status': 'not_ready', 'database': {'status': 'error'}}, 503
+
+        return dict(checks, status='ready' if ready else 'not_ready'), 200 if ready else 503
+
+    @app.route('/api/metrics', methods=['GET'])
+    def get_metrics():
+        """Métricas do processo no formato texto do Prometheus"""
+        if not metrics.enabled:
+            return {'error': 'Métricas desabilitadas (METRICS_ENABLED)'}, 404
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+    if app.config.get('METRICS_PUBLIC'):
+        auth.public(get_metrics)
 
     return app
 
@@ -0,0 +1,305 @@
+"""
+Modo de execução ASGI
+
+create_asgi_app() envolve a aplicação Flask num callable ASGI (ex.: uvicorn):
+
+    - as leituras de ASYNC_ENDPOINTS executam as próprias views Flask dentro
+      de AsyncConnection.run_sync(), com a sessão do DiagnosticsService ligada
+      a uma conexão aiosqlite: enquanto o SQLite trabalha o event loop segue
+      atendendo outras requisições;
+    - as demais rotas (login, ingestão, exportação em streaming, ...) rodam no
+      WSGI original num pool de threads;
+    - cada endpoint tem um limite de requisições simultâneas (ASGI_CONCURRENCY,
+      ou ASGI_HEAVY_CONCURRENCY para HEAVY_ENDPOINTS); quem espera mais que
+      ASGI_QUEUE_TIMEOUT recebe 503.
+
+As rotas, a autenticação e os formatos de resposta são os mesmos do modo WSGI.
+Requer os pacotes aiosqlite e uvicorn (ou outro servidor ASGI).
+"""
+import asyncio
+import contextvars
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from flask import request
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from werkzeug.exceptions import HTTPException
+
+from app.database import install_pragmas, pragma_statements
+from app.extensions import db, database
+
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine
+except ImportError:  # pragma: no cover - requer greenlet
+    create_async_engine = None
+
+
+# Leituras executadas pela conexão assíncrona
+ASYNC_ENDPOINTS = {
+    'diagnostics.get_diagnostics',
+    'diagnostics.get_diagnostic',
+    'diagnostics.get_aggregated',
+    'diagnostics.get_statistics',
+    'diagnostics.get_dashboard',
+}
+
+# Endpoints caros, limitados a ASGI_HEAVY_CONCURRENCY execuções simultâneas
+HEAVY_ENDPOINTS = {
+    'diagnostics.get_aggregated',
+    'diagnostics.get_statistics',
+    'diagnostics.get_dashboard',
+    'diagnostics.export_diagnostics',
+    'diagnostics.create_diagnostics_batch',
+}
+
+# Chave do environ com a conexão (fachada síncrona) da requisição assíncrona
+CONNECTION_KEY = 'net_diagnostics.connection'
+
+# Corpo de requisição mantido em memória antes de ir para disco
+_SPOOL_SIZE = 1 << 20
+
+
+def _async_url(url):
+    if url.get_backend_name() != 'sqlite':
+        raise RuntimeError("O modo ASGI suporta apenas bancos SQLite (driver aiosqlite)")
+    return url.set(drivername='sqlite+aiosqlite')
+
+
+def _environ(scope: Dict, body) -> Dict:
+    """Monta o environ WSGI (PEP 3333) de uma requisição HTTP ASGI"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+
+        environ[name] = environ[name] + ',' + value if name in environ else value
+
+    return environ
+
+
+def _start(app, environ: Dict) -> Tuple[List, object]:
+    """Chama a aplicação WSGI; retorna ([status, headers, escritas], iterável do corpo)"""
+    response = []
+
+    def start_response(status, headers, exc_info=None):
+        response[:] = [status, headers, []]
+        return response[2].append
+
+    body = app(environ, start_response)
+    return response, body
+
+
+def _close(body) -> None:
+    if hasattr(body, 'close'):
+        body.close()
+
+
+def _call_buffered(app, environ: Dict, connection=None) -> Tuple[List, bytes]:
+    """Executa a requisição inteira e devolve o corpo completo"""
+    if connection is not None:
+        environ[CONNECTION_KEY] = connection
+
+    response, body = _start(app, environ)
+    try:
+        return response, b''.join(response[2]) + b''.join(body)
+    finally:
+        _close(body)
+
+
+async def _send_start(send, response: List) -> None:
+    status, headers = response[0], response[1]
+    await send({
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+
+
+class AsgiAdapter:
+    """Callable ASGI sobre a aplicação Flask"""
+
+    def __init__(self, app):
+        self.app = app
+        self.concurrency = app.config.get('ASGI_CONCURRENCY', 16)
+        self.heavy_concurrency = app.config.get('ASGI_HEAVY_CONCURRENCY', 1)
+        self.queue_timeout = app.config.get('ASGI_QUEUE_TIMEOUT', 10)
+        self.pool_size = app.config.get('ASGI_POOL_SIZE', 8)
+        self.executor = ThreadPoolExecutor(app.config.get('ASGI_THREADS', 16), thread_name_prefix='wsgi')
+        self.adapter = app.url_map.bind('localhost')
+        self.engine = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+        if create_async_engine is None:
+            raise RuntimeError("O modo ASGI requer SQLAlchemy com suporte a asyncio (greenlet)")
+
+        with app.app_context():
+            self.url = _async_url(db.engine.url)
+
+        app.before_request(self._bind_connection)
+
+    @staticmethod
+    def _bind_connection():
+        """Liga a sessão da requisição à conexão assíncrona, quando houver"""
+        connection = request.environ.get(CONNECTION_KEY)
+        if connection is not None:
+            # Sessão simples: a do Flask-SQLAlchemy escolhe o engine síncrono
+            db.session.registry.set(Session(bind=connection))
+
+    def _endpoint(self, scope: Dict) -> Optional[str]:
+        try:
+            endpoint, _ = self.adapter.match(scope['path'], scope['method'])
+        except HTTPException:
+            return None
+        return endpoint
+
+    def _semaphore(self, endpoint: Optional[str]) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(endpoint)
+        if semaphore is None:
+            limit = self.heavy_concurrency if endpoint in HEAVY_ENDPOINTS else self.concurrency
+            semaphore = self._semaphores[endpoint] = asyncio.Semaphore(limit)
+        return semaphore
+
+    def _engine(self):
+        if self.engine is None:
+            # O dialeto aiosqlite usa NullPool por padrão para arquivos
+            self.engine = create_async_engine(
+                self.url, poolclass=AsyncAdaptedQueuePool,
+                pool_size=self.pool_size, max_overflow=0, pool_timeout=self.queue_timeout
+            )
+            # As leituras assíncronas usam os mesmos PRAGMAs do pool somente leitura
+            install_pragmas(self.engine.sync_engine, pragma_statements(self.app.config, read_only=True))
+            database.watch('asgi', self.engine.sync_engine)
+        return self.engine
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"Tipo de conexão ASGI não suportado: {scope['type']}")
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                self._engine()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.engine is not None:
+                    await self.engine.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, receive):
+        body = tempfile.SpooledTemporaryFile(max_size=_SPOOL_SIZE)
+        more = True
+
+        while more:
+            message = await receive()
+            body.write(message.get('body', b''))
+            more = message.get('more_body', False)
+
+        body.seek(0)
+        return body
+
+    async def _http(self, scope, receive, send) -> None:
+        endpoint = self._endpoint(scope)
+        semaphore = self._semaphore(endpoint)
+        body = await self._read_body(receive)
+
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            body.close()
+            await _send_start(send, ['503 Service Unavailable', [('Content-Type', 'application/json'), ('Retry-After', '1')]])
+            await send({'type': 'http.response.body', 'body': b'{"error": "Servidor ocupado, tente novamente"}'})
+            return
+
+        try:
+            environ = _environ(scope, body)
+
+            if endpoint in ASYNC_ENDPOINTS and scope['method'] in ('GET', 'HEAD'):
+                await self._run_async(environ, send)
+            else:
+                await self._run_threaded(environ, send)
+        finally:
+            semaphore.release()
+            body.close()
+
+    async def _run_async(self, environ: Dict, send) -> None:
+        async with self._engine().connect() as connection:
+            response, content = await connection.run_sync(lambda sync_connection: _call_buffered(self.app, environ, sync_connection))
+            await connection.rollback()
+
+        await _send_start(send, response)
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def _run_threaded(self, environ: Dict, send) -> None:
+        loop = asyncio.get_running_loop()
+
+        # Cada passo roda numa thread qualquer do pool, mas sempre no mesmo
+        # contexto: stream_with_context depende das variáveis de contexto do Flask
+        context = contextvars.copy_context()
+
+        def run(func, *args):
+            return loop.run_in_executor(self.executor, context.run, func, *args)
+
+        response, body = await run(_start, self.app, environ)
+        chunks = iter(body)
+
+        try:
+            # Lê o primeiro bloco antes de enviar o status, que o iterável
+            # ainda pode alterar (ex.: erro antes do primeiro yield)
+            chunk = await run(next, chunks, None)
+            await _send_start(send, response)
+
+            pending = b''.join(response[2])
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': pending + chunk, 'more_body': True})
+                    pending = b''
+                chunk = await run(next, chunks, None)
+
+            await send({'type': 'http.response.body', 'body': pending})
+        finally:
+            await run(_close, body)
+
+
+def create_asgi_app(app=None) -> AsgiAdapter:
+    """Cria o callable ASGI; sem argumento, usa create_app()"""
+    if app is None:
+        from app import create_app
+        app = create_app()
+
+    return AsgiAdapter(app)
@@ -0,0 +1,148 @@
+from datetime import date
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from app.extensions import db, summaries
+from app.models import anomalies, device_sketches, locations, metric_digests, partitions, schema
+from create_and_populate_db import create_table, populate
+
+
+def _migrate(conn):
+    """Aplica as migrações e alcança os sketches, digests, localidades e médias móveis"""
+    version = schema.migrate(conn)
+    device_sketches.refresh(conn.cursor())
+    metric_digests.refresh(conn.cursor())
+    locations.refresh(conn.cursor())
+    anomalies.refresh(conn.cursor())
+    conn.commit()
+    return version
+
+
+def _run_on_raw_connection(func):
+    """Executa func com a conexão sqlite3 (DB-API) do engine da aplicação"""
+    conn = db.engine.raw_connection()
+    try:
+        return func(conn.driver_connection)
+    finally:
+        conn.close()
+
+
+def init_database(sample: bool = False):
+    """
+    Prepara o banco da aplicação: passo único, antes de servir as requisições
+
+    Um banco sem a tabela diagnostics é criado (e, com sample, populado com os
+    dados de exemplo de create_and_populate_db); em seguida aplica as
+    migrações pendentes e alcança os sketches, digests, localidades e médias
+    móveis.
+
+    Retorna (versão do schema, se o banco foi criado agora).
+    """
+    def prepare(conn):
+        created = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'diagnostics'"
+        ).fetchone() is None
+
+        if created:
+            create_table(conn)
+            if sample:
+                populate(conn)
+
+        return _migrate(conn), created
+
+    return _run_on_raw_connection(prepare)
+
+
+@click.command('init-db')
+@click.option('--sample', is_flag=True, help='Popula com dados de exemplo um banco criado agora')
+@with_appcontext
+def init_db_command(sample):
+    """Cria o banco se necessário e aplica as migrações (antes de iniciar o servidor)"""
+    version, created = init_database(sample)
+    if created:
+        click.echo('Banco criado' + (' e populado com dados de exemplo' if sample else ''))
+    click.echo(f'Schema na versão {version}')
+
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db_command():
+    """Aplica as migrações pendentes do schema"""
+    version = _run_on_raw_connection(_migrate)
+    click.echo(f'Schema na versão {version}')
+
+
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command():
+    """Recalcula o rollup diário, os sketches de dispositivos, os digests de métricas, as localidades e as médias móveis"""
+    total = _run_on_raw_connection(schema.rebuild_rollups)
+    click.echo(f'Rollup diário recalculado: {total} grupos (dia, estado, cidade)')
+    total = _run_on_raw_connection(device_sketches.rebuild)
+    click.echo(f'Sketches de dispositivos recalculados: {total} grupos (dia, estado, cidade)')
+    total = _run_on_raw_connection(metric_digests.rebuild)
+    click.echo(f'Digests de métricas recalculados: {total} grupos (dia, estado, cidade)')
+    total = _run_on_raw_connection(locations.rebuild)
+    click.echo(f'Localidades recalculadas: {total} pares (estado, cidade)')
+    total = _run_on_raw_connection(anomalies.rebuild)
+    click.echo(f'Médias móveis recalculadas: {total} grupos (dispositivos e localidades)')
+
+
+@click.command('refresh-summaries')
+@with_appcontext
+def refresh_summaries_command():
+    """Incorpora aos resumos adiados as linhas gravadas desde a última atualização (SUMMARY_REFRESH=manual)"""
+    for name, added in summaries.run().items():
+        click.echo(f'{name}: {added} linhas novas incorporadas')
+
+
+@click.command('partition-diagnostics')
+@click.option('--interval', type=click.Choice(partitions.INTERVALS), help='Período das partições (padrão: PARTITION_INTERVAL)')
+@click.option('--before', type=click.DateTime(formats=['%Y-%m-%d']), help='Sela só os períodos encerrados até essa data (padrão: hoje)')
+@with_appcontext
+def partition_diagnostics_command(interval, before):
+    """Move os períodos encerrados de diagnostics para partições"""
+    interval = interval or current_app.config['PARTITION_INTERVAL']
+    before = before.date() if before else None
+    sealed = _run_on_raw_connection(lambda conn: partitions.seal(conn, interval, before))
+
+    for partition in sealed:
+        click.echo(f"{partition['name']}: {partition['rows']} linhas ({partition['start_date']} a {partition['end_date']})")
+    click.echo(f'Partições seladas: {len(sealed)}')
+
+
+@click.command('apply-retention')
+@click.option('--days', type=int, help='Dias mantidos (padrão: RETENTION_DAYS)')
+@click.option('--archive-dir', help='Arquiva as partições removidas nesse diretório (padrão: RETENTION_ARCHIVE_DIR)')
+@click.option('--keep-summaries/--drop-summaries', default=None, help='Mantém rollup, sketches e digests dos dias removidos')
+@with_appcontext
+def apply_retention_command(days, archive_dir, keep_summaries):
+    """Sela os períodos encerrados e remove as partições além da retenção"""
+    config = current_app.config
+    days = config['RETENTION_DAYS'] if days is None else days
+    archive_dir = archive_dir or config['RETENTION_ARCHIVE_DIR']
+    keep_summaries = config['RETENTION_KEEP_SUMMARIES'] if keep_summaries is None else keep_summaries
+
+    if days <= 0:
+        raise click.UsageError('Retenção desativada: informe --days ou RETENTION_DAYS')
+
+    dropped = _run_on_raw_connection(lambda conn: partitions.apply_retention(
+        conn, config['PARTITION_INTERVAL'], days, date.today(), archive_dir, keep_summaries
+    ))
+
+    for partition in dropped:
+        destination = f" -> {partition['archive']}" if partition['archive'] else ''
+        click.echo(f"{partition['name']}: {partition['rows']} linhas removidas{destination}")
+    click.echo(f'Partições removidas: {len(dropped)}')
+
+
+def register_commands(app):
+    """Registra os comandos de manutenção no CLI do Flask"""
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(upgrade_db_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(refresh_summaries_command)
+    app.cli.add_command(partition_diagnostics_command)
+    app.cli.add_command(apply_retention_command)
@@ -10,9 +10,129 @@ class Config:
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # PRAGMAs aplicados a cada conexão SQLite (cache_size negativo = KiB)
+    DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL')
+    DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+    DB_CACHE_SIZE = int(os.getenv('DB_CACHE_SIZE', -65536))
+    DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', 268435456))
+    DB_TEMP_STORE = os.getenv('DB_TEMP_STORE', 'MEMORY')
+    DB_BUSY_TIMEOUT = int(os.getenv('DB_BUSY_TIMEOUT', 5000))
+
+    # Pool principal (gravações) e pool somente leitura (0 desabilita)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+    DB_READ_POOL_SIZE = int(os.getenv('DB_READ_POOL_SIZE', 8))
+    DB_READ_MAX_OVERFLOW = int(os.getenv('DB_READ_MAX_OVERFLOW', 8))
+
+    # Bancos em memória usam StaticPool, que não aceita as opções de pool
+    SQLALCHEMY_ENGINE_OPTIONS = {} if SQLALCHEMY_DATABASE_URI in ('sqlite://', 'sqlite:///:memory:') else {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+    }
+
     SECRET_KEY = os.getenv('SECRET_KEY', 'ABC123@#$%')
     JWT_EXPIRATION = timedelta(hours=24)
 
-    DEBUG = os.getenv('FLASK_DEBUG', 'True') == 'True'
+    # Tokens já verificados mantidos em memória (limite de entradas e de segundos)
+    AUTH_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_CACHE_MAX_ENTRIES', 1024))
+    AUTH_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', 300))
+
+    # Validade (segundos) do total reutilizado por count=estimate e máximo de
+    # totais guardados (LRU por filtros)
+    COUNT_ESTIMATE_TTL = int(os.getenv('COUNT_ESTIMATE_TTL', 60))
+    COUNT_ESTIMATE_MAX_ENTRIES = int(os.getenv('COUNT_ESTIMATE_MAX_ENTRIES', 256))
+
+    # Responde /aggregate e /statistics pelo rollup diário quando disponível
+    ROLLUPS_ENABLED = os.getenv('ROLLUPS_ENABLED', 'True') == 'True'
+
+    # Cache das leituras: 'memory' (por processo), 'sqlite' (compartilhado) ou 'none'
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+    CACHE_TTL = int(os.getenv('CACHE_TTL', 30))
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 1024))
+    CACHE_SQLITE_PATH = os.getenv('CACHE_SQLITE_PATH')
+
+    # Leituras idênticas simultâneas esperam a que já está em andamento (até
+    # SINGLE_FLIGHT_TIMEOUT segundos); SINGLE_FLIGHT_LOCK_PATH (arquivo de lock,
+    # fcntl) coordena também os workers, que compartilham o resultado pelo cache 'sqlite'
+    SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', 'True') == 'True'
+    SINGLE_FLIGHT_TIMEOUT = float(os.getenv('SINGLE_FLIGHT_TIMEOUT', 30))
+    SINGLE_FLIGHT_LOCK_PATH = os.getenv('SINGLE_FLIGHT_LOCK_PATH')
+
+    # GET condicional nas leituras: ETag pela versão dos dados (If-None-Match
+    # igual responde 304) e Cache-Control das respostas ('' não envia o cabeçalho)
+    ETAG_ENABLED = os.getenv('ETAG_ENABLED', 'True') == 'True'
+    HTTP_CACHE_CONTROL = os.getenv('HTTP_CACHE_CONTROL', 'private, no-cache')
+
+    # Respostas: JSON pelo 'orjson' ou pelo encoder 'default' do Flask e compressão
+    # gzip/brotli (brotli requer o pacote opcional) dos corpos a partir de COMPRESS_MIN_SIZE bytes
+    JSON_ENGINE = os.getenv('JSON_ENGINE', 'orjson')
+    COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', 'True') == 'True'
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', 6))
+    COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', 5))
+
+    # Formas de filtro (campos, operadores e datas) com a cláusula WHERE compilada em cache
+    FILTER_PLAN_CACHE_SIZE = int(os.getenv('FILTER_PLAN_CACHE_SIZE', 256))
+
+    # Linhas por bloco de validação/executemany em POST /diagnostics/batch
+    INGEST_CHUNK_SIZE = int(os.getenv('INGEST_CHUNK_SIZE', 5000))
+
+    # Resumos atualizados depois do commit da gravação em lote
+    # (app.services.summary_refresh): 'background' (thread, SUMMARY_REFRESH_DELAY
+    # segundos depois), 'inline' (uma vez por lote) ou 'manual' (flask refresh-summaries)
+    SUMMARY_REFRESH = os.getenv('SUMMARY_REFRESH', 'background')
+    SUMMARY_REFRESH_DELAY = float(os.getenv('SUMMARY_REFRESH_DELAY', 1.0))
+
+    # Linhas lidas do cursor por bloco em GET /diagnostics/export
+    EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 1000))
+
+    # Pontos por série em /aggregate?bucket=... quando max_points não é informado
+    AGGREGATE_MAX_POINTS = int(os.getenv('AGGREGATE_MAX_POINTS', 500))
+
+    # Padrões de /diagnostics/anomalies: |z| mínimo da última leitura e
+    # leituras mínimas do grupo (as primeiras ainda formam a média móvel)
+    ANOMALY_MIN_Z = float(os.getenv('ANOMALY_MIN_Z', 3.0))
+    ANOMALY_MIN_SAMPLES = int(os.getenv('ANOMALY_MIN_SAMPLES', 20))
+
+    # Período das partições seladas por `flask partition-diagnostics`: 'month' ou 'week'
+    PARTITION_INTERVAL = os.getenv('PARTITION_INTERVAL', 'month')
+
+    # Retenção aplicada por `flask apply-retention`: partições mais antigas que
+    # RETENTION_DAYS dias (0 desativa) são removidas, arquivadas antes em
+    # RETENTION_ARCHIVE_DIR se definido; RETENTION_KEEP_SUMMARIES mantém o
+    # rollup, os sketches e os digests dos dias removidos
+    RETENTION_DAYS = int(os.getenv('RETENTION_DAYS', 0))
+    RETENTION_ARCHIVE_DIR = os.getenv('RETENTION_ARCHIVE_DIR')
+    RETENTION_KEEP_SUMMARIES = os.getenv('RETENTION_KEEP_SUMMARIES', 'False') == 'True'
+
+    # Motor de /aggregate e /statistics: 'sql' ou 'columnar' (NumPy, colunas em COLUMNAR_PATH)
+    ANALYTICS_ENGINE = os.getenv('ANALYTICS_ENGINE', 'sql')
+    COLUMNAR_PATH = os.getenv('COLUMNAR_PATH')
+
+    # Modo ASGI (asgi.py): requisições simultâneas por endpoint (HEAVY_ENDPOINTS
+    # usam o limite menor, metade dos núcleos), espera máxima na fila antes do
+    # 503 e tamanho dos pools
+    ASGI_CONCURRENCY = int(os.getenv('ASGI_CONCURRENCY', 16))
+    ASGI_HEAVY_CONCURRENCY = int(os.getenv('ASGI_HEAVY_CONCURRENCY', max((os.cpu_count() or 1) // 2, 1)))
+    ASGI_QUEUE_TIMEOUT = float(os.getenv('ASGI_QUEUE_TIMEOUT', 10))
+    ASGI_POOL_SIZE = int(os.getenv('ASGI_POOL_SIZE', 8))
+    ASGI_THREADS = int(os.getenv('ASGI_THREADS', 16))
+
+    # Métricas em /api/metrics (formato Prometheus; METRICS_PUBLIC libera sem
+    # token, para o scraper) e log das consultas SQL acima de SLOW_QUERY_MS
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+    METRICS_PUBLIC = os.getenv('METRICS_PUBLIC', 'False') == 'True'
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+
+    # Diretório compartilhado pelos workers, onde cada um publica as suas
+    # métricas a cada METRICS_FLUSH_INTERVAL segundos para que /api/metrics
+    # devolva a soma de todos (gunicorn.conf.py define um por padrão)
+    METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR')
+    METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1.0))
+
+    # Desligado por padrão: wsgi.py/gunicorn é a entrada de produção; run.py liga
+    DEBUG = os.getenv('FLASK_DEBUG', 'False') == 'True'
     TESTING = False
 
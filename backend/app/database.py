@@ -0,0 +1,258 @@
+"""
+Ajustes do SQLite e pools de conexões
+
+DatabaseTuning aplica os PRAGMAs do Config (journal_mode, synchronous,
+cache_size, mmap_size, temp_store, busy_timeout) a cada conexão aberta pelo
+engine da aplicação e cria um segundo engine, só de leitura, sobre o mesmo
+arquivo: as conexões dele recebem `PRAGMA query_only = ON`.
+
+RoutingSession (a classe de sessão de `db`) envia os SELECTs ao pool de
+leitura enquanto a transação da sessão ainda não usou o engine principal; a
+partir da primeira gravação, as leituras seguem pela mesma conexão e enxergam
+o que ainda não foi confirmado. Em WAL, leitores e o gravador não se bloqueiam.
+"""
+import threading
+import time
+from typing import Dict, List
+
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, literal, select
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.expression import Select, TextClause
+
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+TEMP_STORES = ('DEFAULT', 'FILE', 'MEMORY')
+
+# PRAGMAs devolvidos por stats(), lidos da própria conexão
+REPORTED_PRAGMAS = ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout', 'query_only')
+
+_READ_PREFIXES = ('SELECT', 'WITH')
+
+
+def is_memory_database(url) -> bool:
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def pragma_statements(config, read_only: bool = False) -> List[str]:
+    """
+    Monta os PRAGMAs de uma conexão a partir do Config
+
+    journal_mode é persistente no arquivo e só é definido pelas conexões de
+    escrita; as de leitura recebem query_only.
+    """
+    journal_mode = config.get('DB_JOURNAL_MODE', 'WAL').upper()
+    synchronous = config.get('DB_SYNCHRONOUS', 'NORMAL').upper()
+    temp_store = config.get('DB_TEMP_STORE', 'MEMORY').upper()
+
+    if journal_mode not in JOURNAL_MODES:
+        raise ValueError(f"journal_mode inválido: {journal_mode}")
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f"synchronous inválido: {synchronous}")
+    if temp_store not in TEMP_STORES:
+        raise ValueError(f"temp_store inválido: {temp_store}")
+
+    # PRAGMA não aceita parâmetros; os valores são validados acima ou inteiros
+    statements = [
+        f"PRAGMA busy_timeout = {int(config.get('DB_BUSY_TIMEOUT', 5000))}",
+        f"PRAGMA synchronous = {synchronous}",
+        f"PRAGMA cache_size = {int(config.get('DB_CACHE_SIZE', -65536))}",
+        f"PRAGMA mmap_size = {int(config.get('DB_MMAP_SIZE', 268435456))}",
+        f"PRAGMA temp_store = {temp_store}",
+    ]
+
+    if read_only:
+        statements.append("PRAGMA query_only = ON")
+    else:
+        statements.insert(0, f"PRAGMA journal_mode = {journal_mode}")
+
+    return statements
+
+
+def install_pragmas(engine, statements: List[str]) -> None:
+    """Executa statements em cada conexão nova do engine (síncrono ou sync_engine)"""
+
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+class PoolMonitor:
+    """Contadores de uso de um pool, alimentados pelos eventos do SQLAlchemy"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._counters = {'connects': 0, 'checkouts': 0, 'checkins': 0, 'max_checked_out': 0, 'hold_seconds': 0.0}
+        self._checked_out = 0
+        self._lock = threading.Lock()
+
+        event.listen(engine, 'connect', self._on_connect)
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self._counters['connects'] += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        connection_record.info['checked_out_at'] = time.perf_counter()
+        with self._lock:
+            self._checked_out += 1
+            self._counters['checkouts'] += 1
+            self._counters['max_checked_out'] = max(self._counters['max_checked_out'], self._checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        started = connection_record.info.pop('checked_out_at', None)
+        with self._lock:
+            self._counters['checkins'] += 1
+            if started is not None:
+                self._checked_out -= 1
+                self._counters['hold_seconds'] += time.perf_counter() - started
+
+    def stats(self) -> Dict:
+        pool = self.engine.pool
+        with self._lock:
+            counters = dict(self._counters)
+
+        hold_seconds = counters.pop('hold_seconds')
+        counters['pool'] = type(pool).__name__
+        counters['avg_hold_ms'] = round(hold_seconds * 1000 / counters['checkins'], 3) if counters['checkins'] else 0.0
+
+        if isinstance(pool, QueuePool):
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            counters.update({
+                'size': pool.size(),
+                'max_overflow': pool._max_overflow,
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': max(pool.overflow(), 0),
+                'utilization': round(pool.checkedout() / capacity, 4) if capacity > 0 else 0.0,
+            })
+
+        return counters
+
+
+class RoutingSession(Session):
+    """Sessão que lê pelo pool somente leitura quando ele existe"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self.info.get('uses_primary'):
+            tuning = current_app.extensions.get('database_tuning')
+
+            if tuning is not None and tuning.read_engine is not None and _is_read(clause):
+                return tuning.read_engine
+
+        bind = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        self.info['uses_primary'] = True
+        return bind
+
+
+def _is_read(clause) -> bool:
+    if isinstance(clause, Select):
+        return True
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip().upper().startswith(_READ_PREFIXES)
+    return False
+
+
+def read_connection(session):
+    """Conexão da sessão para leituras: a do pool somente leitura, quando existe"""
+    return session.connection(bind_arguments={'clause': select(literal(1))})
+
+
+def begin_read_snapshot(session) -> None:
+    """
+    Abre a transação de leitura da sessão, para que as consultas seguintes
+    leiam o mesmo snapshot do banco
+
+    O pysqlite só emite BEGIN antes de gravações: sem ele, cada SELECT vê os
+    dados confirmados até o próprio início. A conexão é a do pool de leitura
+    (quando existe) e a transação termina no rollback do fim da requisição.
+    """
+    connection = read_connection(session)
+    if connection.dialect.name != 'sqlite':
+        return
+
+    if not connection.connection.driver_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN")
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _reset_routing(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('uses_primary', None)
+
+
+class DatabaseTuning:
+    """Extensão Flask: PRAGMAs por conexão, pool de leitura e estatísticas dos pools"""
+
+    def __init__(self, app=None):
+        self.read_engine = None
+        self.monitors: Dict[str, PoolMonitor] = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        """Deve ser chamado depois de db.init_app(app)"""
+        with app.app_context():
+            engine = app.extensions['sqlalchemy'].engine
+
+        self.read_engine = None
+        self.monitors = {}
+
+        if engine.url.get_backend_name() != 'sqlite':
+            app.extensions['database_tuning'] = self
+            return
+
+        install_pragmas(engine, pragma_statements(app.config))
+        self.monitors['primary'] = PoolMonitor(engine)
+
+        if not is_memory_database(engine.url):
+            # journal_mode vale para o arquivo: aplica antes da primeira leitura
+            with engine.connect():
+                pass
+
+        read_pool_size = app.config.get('DB_READ_POOL_SIZE', 8)
+
+        # Bancos em memória não são compartilhados entre conexões
+        if read_pool_size > 0 and not is_memory_database(engine.url):
+            self.read_engine = create_engine(
+                engine.url,
+                poolclass=QueuePool,
+                pool_size=read_pool_size,
+                max_overflow=app.config.get('DB_READ_MAX_OVERFLOW', 8),
+                pool_timeout=app.config.get('DB_POOL_TIMEOUT', 30),
+            )
+            install_pragmas(self.read_engine, pragma_statements(app.config, read_only=True))
+            self.monitors['read'] = PoolMonitor(self.read_engine)
+
+        app.extensions['database_tuning'] = self
+
+    def watch(self, name: str, engine) -> None:
+        """Passa a reportar o pool de outro engine (ex.: o assíncrono do modo ASGI)"""
+        self.monitors[name] = PoolMonitor(engine)
+
+    def pragmas(self, engine) -> Dict:
+        """Valores efetivos dos PRAGMAs numa conexão do engine"""
+        values = {}
+        with engine.connect() as conn:
+            for name in REPORTED_PRAGMAS:
+                values[name] = conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+        return values
+
+    def stats(self) -> Dict:
+        data = {name: monitor.stats() for name, monitor in self.monitors.items()}
+
+        for name in ('primary', 'read'):
+            monitor = self.monitors.get(name)
+            if monitor is not None:
+                data[name]['pragmas'] = self.pragmas(monitor.engine)
+
+        return data
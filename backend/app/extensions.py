@@ -1,3 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
+from app.database import DatabaseTuning, RoutingSession
+from app.services.cache import ResponseCache
+from app.services.columnar_engine import ColumnarEngine
+from app.services.conditional import ConditionalRequests
+from app.services.filter_compiler import FilterCompiler
+from app.services.metrics import Metrics
+from app.services.serialization import ResponseSerialization
+from app.services.single_flight import SingleFlight
+from app.services.summary_refresh import SummaryRefresher
+from app.services.token_auth import TokenAuth
 
-db = SQLAlchemy()
\ No newline at end of file
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+metrics = Metrics()
+database = DatabaseTuning()
+cache = ResponseCache()
+single_flight = SingleFlight()
+conditional = ConditionalRequests()
+serialization = ResponseSerialization()
+columnar = ColumnarEngine()
+filter_compiler = FilterCompiler()
+auth = TokenAuth()
+summaries = SummaryRefresher()
@@ -0,0 +1,93 @@
+"""
+Ciclo de vida dos processos do servidor em produção (gunicorn.conf.py)
+
+Com preload_app, o processo mestre importa a aplicação uma vez e os workers
+nascem por fork com ela já carregada, compartilhando as páginas de memória
+(copy-on-write) em vez de importar tudo de novo a cada worker. warm_up()
+completa no mestre o estado somente leitura que os workers herdam (as colunas
+mapeadas do motor colunar) e fecha as conexões abertas nesse passo; workers
+novos, inclusive os que substituem os reciclados, já nascem aquecidos.
+
+after_fork() descarta em cada worker o que não pode ser herdado: as conexões
+SQLite dos pools e a do cache 'sqlite' pertencem ao mestre, e as métricas
+registradas pelo mestre não são do worker, nem o timer da atualização adiada
+dos resumos.
+
+As métricas dos workers são somadas num diretório compartilhado
+(METRICS_MULTIPROC_DIR, app.services.metrics): reset_metrics() o limpa quando
+o mestre inicia, before_exit() publica as do worker que está saindo e
+worker_exited() incorpora, no mestre, os contadores do worker encerrado.
+
+readiness() é a verificação de /api/health/ready: banco acessível e schema
+na versão do código (`flask init-db` já rodou).
+"""
+import time
+from typing import Dict, Tuple
+
+from app.extensions import db, database, cache, columnar, metrics, summaries
+from app.models.schema import SCHEMA_VERSION
+from app.services import metrics as metrics_store
+
+
+def _engines():
+    """Engines SQLAlchemy da aplicação atual (principal e somente leitura)"""
+    engines = [db.engine]
+    if database.read_engine is not None:
+        engines.append(database.read_engine)
+    return engines
+
+
+def warm_up(app) -> None:
+    """Carrega no processo mestre o estado compartilhado pelos workers"""
+    with app.app_context():
+        columnar.load()
+        db.session.remove()
+
+        # Os workers abrem as próprias conexões
+        for engine in _engines():
+            engine.dispose()
+
+
+def after_fork(app) -> None:
+    """Descarta no worker recém-criado os recursos do processo mestre"""
+    with app.app_context():
+        # close=False: as conexões herdadas são do mestre e não são fechadas aqui
+        for engine in _engines():
+            engine.dispose(close=False)
+
+    cache.after_fork()
+    metrics.after_fork()
+    summaries.after_fork()
+
+
+def before_exit(app) -> None:
+    """Worker saindo: publica as métricas ainda não gravadas no diretório compartilhado"""
+    with app.app_context():
+        metrics.flush()
+
+
+def reset_metrics(directory: str) -> None:
+    """Mestre iniciando: descarta as métricas de execuções anteriores"""
+    metrics_store.clear_directory(directory)
+
+
+def worker_exited(directory: str, pid: int) -> None:
+    """Mestre: incorpora os contadores do worker encerrado aos acumulados"""
+    metrics_store.merge_process(directory, pid)
+
+
+def readiness() -> Tuple[bool, Dict]:
+    """
+    Verifica se o worker pode receber tráfego
+
+    Retorna (pronto, detalhes por verificação); falhas do banco propagam.
+    """
+    started = time.perf_counter()
+    version = db.session.execute(db.text("PRAGMA user_version")).scalar()
+    latency_ms = round((time.perf_counter() - started) * 1000, 3)
+    checks = {
+        'database': {'status': 'ok', 'latency_ms': latency_ms},
+        'schema': {'status': 'ok' if version == SCHEMA_VERSION else 'outdated', 'version': version, 'expected': SCHEMA_VERSION},
+    }
+
+    return version == SCHEMA_VERSION, checks
@@ -0,0 +1,262 @@
+"""
+Detecção incremental de anomalias por médias e variâncias móveis (EWMA)
+
+diagnostics_device_ewma (por device_id) e diagnostics_location_ewma (por
+estado e cidade) guardam, de latency_ms, packet_loss e quality_of_service, a
+última leitura, a média e a variância exponencialmente ponderadas na ordem de
+gravação (id) das leituras anteriores a ela e o z-score da última leitura
+contra essa média e esse desvio. Cada linha atualiza os seus dois grupos em
+tempo constante:
+
+    diff = x - média;  z = diff / max(desvio, MIN_STD)
+    peso = max(ALPHA, 1 / n)   (n-ésima leitura do grupo)
+    média += peso * diff;  variância = (1 - peso) * (variância + peso * diff²)
+
+A média e a variância gravadas são as de referência do z (antes da última
+leitura); a leitura seguinte incorpora a última a elas antes de se comparar.
+
+Até 1/ALPHA leituras o peso 1/n dá a média e a variância simples de todas
+elas; a partir daí, as móveis, sem o viés de começar a variância em zero.
+
+score é o maior |z| entre as métricas, indexado para o ranking de
+/api/diagnostics/anomalies. Como os sketches (app.models.device_sketches),
+cobrem as linhas até diagnostics_ewma_state.last_id: refresh() acrescenta as
+novas e, como uma média móvel não permite retirar leituras, os grupos marcados
+pelos triggers de remoção e alteração são recalculados repetindo a sequência
+do início. A gravação em lote deixa refresh() para depois do commit
+(app.services.summaries); até lá, pending() dá às leituras os grupos que ele
+gravaria.
+"""
+import math
+from typing import Dict, Optional, Tuple
+
+from app.models.schema import MAX_ID_SQL
+
+METRICS = ('latency_ms', 'packet_loss', 'quality_of_service')
+
+# Peso da leitura nova: janela efetiva de ~2/ALPHA - 1 = 39 leituras do grupo
+ALPHA = 0.05
+
+# Desvio mínimo por métrica no z-score: grupos de leituras constantes (perda
+# sempre zero) não geram z infinito na primeira variação
+MIN_STD = (1.0, 0.1, 0.1)
+
+# Escopo -> (tabela, colunas da chave, tabela de grupos marcados)
+SCOPES = {
+    'device': ('diagnostics_device_ewma', ('device_id',), 'diagnostics_ewma_device_dirty'),
+    'location': ('diagnostics_location_ewma', ('state', 'city'), 'diagnostics_ewma_location_dirty'),
+}
+
+# Colunas do estado de um grupo, depois da chave
+STATE_COLUMNS = ('samples', 'last_id', 'last_date') + tuple(
+    f'{metric}_{field}' for metric in METRICS for field in ('last', 'mean', 'var', 'z')
+) + ('score',)
+
+_ROW_SQL = "SELECT id, date, latency_ms, packet_loss, quality_of_service FROM diagnostics_all"
+
+
+class _Group:
+    """Estado EWMA de um grupo: [última, média, variância, z] por métrica (média e variância de referência do z)"""
+
+    __slots__ = ('samples', 'last_id', 'last_date', 'metrics')
+
+    def __init__(self, row: Optional[Tuple] = None):
+        if row is None:
+            self.samples, self.last_id, self.last_date = 0, 0, None
+            self.metrics = [[0.0, 0.0, 0.0, 0.0] for _ in METRICS]
+        else:
+            self.samples, self.last_id, self.last_date = row[:3]
+            self.metrics = [list(row[3 + 4 * index:7 + 4 * index]) for index in range(len(METRICS))]
+
+    def add(self, row_id: int, row_date: str, values: Tuple[float, ...]) -> None:
+        """Incorpora uma leitura em tempo constante"""
+        # Peso da leitura anterior, que entra agora na referência
+        weight = max(ALPHA, 1 / self.samples) if self.samples else 1.0
+        self.samples += 1
+
+        for state, value, min_std in zip(self.metrics, values, MIN_STD):
+            last, mean, variance = state[0], state[1], state[2]
+            previous = last - mean
+            mean += weight * previous
+            variance = (1 - weight) * (variance + weight * previous * previous)
+
+            # A primeira leitura não tem referência: ela mesma, com z zero
+            if self.samples == 1:
+                mean, variance = value, 0.0
+
+            state[:] = value, mean, variance, (value - mean) / max(math.sqrt(variance), min_std)
+
+        self.last_id = row_id
+        self.last_date = row_date
+
+    def to_row(self) -> Tuple:
+        score = max(abs(state[3]) for state in self.metrics)
+        return (self.samples, self.last_id, self.last_date) + tuple(value for state in self.metrics for value in state) + (score,)
+
+
+def _upsert_sql(scope: str) -> str:
+    table, key_columns, _ = SCOPES[scope]
+    columns = key_columns + STATE_COLUMNS
+    return f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+
+def _where(key_columns: Tuple[str, ...]) -> str:
+    return ' AND '.join(f'{column} = ?' for column in key_columns)
+
+
+def _load(cursor, scope: str, key: Tuple) -> _Group:
+    """Estado gravado de um grupo (ou vazio, se ainda não tem leituras)"""
+    table, key_columns, _ = SCOPES[scope]
+    row = cursor.execute(
+        f"SELECT {', '.join(STATE_COLUMNS[:-1])} FROM {table} WHERE {_where(key_columns)}", key
+    ).fetchone()
+    return _Group(row)
+
+
+def _replay(cursor, scope: str, key: Tuple, last_id: int) -> _Group:
+    """Recalcula um grupo marcado repetindo as suas leituras até last_id"""
+    _, key_columns, _ = SCOPES[scope]
+    group = _Group()
+    rows = cursor.execute(
+        _ROW_SQL + f" WHERE {_where(key_columns)} AND id <= ? ORDER BY id", key + (last_id,)
+    ).fetchall()
+
+    for row_id, row_date, *values in rows:
+        group.add(row_id, row_date, values)
+
+    return group
+
+
+def _dirty_keys(cursor) -> Dict[str, list]:
+    return {
+        scope: cursor.execute(f"SELECT {', '.join(key_columns)} FROM {dirty_table}").fetchall()
+        for scope, (_, key_columns, dirty_table) in SCOPES.items()
+    }
+
+
+def _advance(cursor, last_id: int, max_id: int, dirty: Dict[str, list]) -> Tuple[Dict[str, Dict[Tuple, _Group]], int]:
+    """
+    Calcula, sem gravar, os grupos alterados pelas linhas last_id < id <= max_id
+    e pelos grupos marcados
+
+    Retorna ({escopo: {chave: grupo}}, quantidade de linhas novas).
+    """
+    groups: Dict[str, Dict[Tuple, _Group]] = {
+        scope: {tuple(key): _replay(cursor, scope, tuple(key), last_id) for key in keys}
+        for scope, keys in dirty.items()
+    }
+    devices, locations = groups['device'], groups['location']
+    added = 0
+
+    # Cursor próprio, lido aos poucos: cursor segue livre para ler o estado dos grupos
+    reader = cursor.connection.cursor()
+    reader.execute(
+        "SELECT id, date, device_id, state, city, latency_ms, packet_loss, quality_of_service"
+        " FROM diagnostics_all WHERE id > ? AND id <= ? ORDER BY id",
+        (last_id, max_id)
+    )
+
+    for row_id, row_date, device_id, state, city, *values in reader:
+        added += 1
+
+        key = (device_id,)
+        group = devices.get(key)
+        if group is None:
+            group = devices[key] = _load(cursor, 'device', key)
+        group.add(row_id, row_date, values)
+
+        key = (state, city)
+        group = locations.get(key)
+        if group is None:
+            group = locations[key] = _load(cursor, 'location', key)
+        group.add(row_id, row_date, values)
+
+    reader.close()
+
+    return groups, added
+
+
+def pending(cursor) -> Tuple[Dict[str, Dict[Tuple, _Group]], int]:
+    """
+    Grupos que refresh() gravaria agora, calculados em memória
+
+    A gravação em lote não atualiza as médias (app.services.summaries o faz
+    depois do commit); as leituras combinam estes grupos com os gravados.
+
+    Retorna ({escopo: {chave: grupo}}, maior id coberto).
+    """
+    last_id = cursor.execute("SELECT last_id FROM diagnostics_ewma_state").fetchone()[0]
+    max_id = cursor.execute(MAX_ID_SQL).fetchone()[0]
+    dirty = _dirty_keys(cursor)
+
+    if max_id <= last_id and not any(dirty.values()):
+        return {scope: {} for scope in SCOPES}, last_id
+
+    groups, _ = _advance(cursor, last_id, max_id, dirty)
+    return groups, max_id
+
+
+def refresh(cursor) -> int:
+    """
+    Atualiza os grupos até o maior id gravado
+
+    Não faz commit: o chamador controla a transação.
+
+    Args:
+        cursor: Cursor DB-API da conexão
+
+    Retorna a quantidade de linhas novas incorporadas.
+    """
+    last_id = cursor.execute("SELECT last_id FROM diagnostics_ewma_state").fetchone()[0]
+    max_id = cursor.execute(MAX_ID_SQL).fetchone()[0]
+    dirty = _dirty_keys(cursor)
+
+    if max_id <= last_id and not any(dirty.values()):
+        return 0
+
+    groups, added = _advance(cursor, last_id, max_id, dirty)
+
+    for scope, (table, key_columns, dirty_table) in SCOPES.items():
+        # Grupos marcados cujas linhas foram todas removidas
+        cursor.executemany(
+            f"DELETE FROM {table} WHERE {_where(key_columns)}",
+            [key for key, group in groups[scope].items() if group.samples == 0]
+        )
+        cursor.executemany(
+            _upsert_sql(scope),
+            [key + group.to_row() for key, group in groups[scope].items() if group.samples > 0]
+        )
+        cursor.execute(f"DELETE FROM {dirty_table}")
+
+    cursor.execute("UPDATE diagnostics_ewma_state SET last_id = ?", (max_id,))
+
+    return added
+
+
+def rebuild(conn) -> int:
+    """
+    Recalcula todos os grupos a partir das linhas brutas
+
+    Args:
+        conn: Conexão sqlite3 (DB-API) com o banco
+
+    Retorna a quantidade de grupos (dispositivos e localidades).
+    """
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    try:
+        for table, _, dirty_table in SCOPES.values():
+            cursor.execute(f"DELETE FROM {table}")
+            cursor.execute(f"DELETE FROM {dirty_table}")
+        cursor.execute("UPDATE diagnostics_ewma_state SET last_id = 0")
+        refresh(cursor)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+    return sum(
+        conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table, _, _ in SCOPES.values()
+    )
+
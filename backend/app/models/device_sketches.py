@@ -0,0 +1,150 @@
+"""
+Manutenção dos sketches HyperLogLog de dispositivos distintos
+
+Os sketches por dia e por (dia, estado, cidade) cobrem as linhas de
+diagnostics até diagnostics_sketch_state.last_id. refresh() acrescenta as
+linhas novas e recalcula os grupos marcados pelos triggers de remoção e
+alteração. É chamado depois da gravação em lote pela atualização adiada
+(app.services.summary_refresh) e pode ser executado a qualquer momento para
+alcançar linhas gravadas por outros caminhos. As linhas são lidas pela view
+diagnostics_all, que inclui as partições seladas.
+"""
+from datetime import date, timedelta
+
+from app.models.schema import MAX_ID_SQL
+from app.utils.hyperloglog import HyperLogLog, position
+
+
+def _next_day(day: str) -> str:
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+
+
+def _load(cursor, sql: str, key: tuple, sketch: HyperLogLog) -> None:
+    """Combina o sketch gravado de um grupo (se houver) com sketch"""
+    row = cursor.execute(sql, key).fetchone()
+    if row is not None:
+        sketch.merge(HyperLogLog(row[0]))
+
+
+def refresh(cursor) -> int:
+    """
+    Atualiza os sketches até o maior id gravado
+
+    Não faz commit: o chamador controla a transação.
+
+    Args:
+        cursor: Cursor DB-API da conexão
+
+    Retorna a quantidade de linhas novas incorporadas.
+    """
+    last_id = cursor.execute("SELECT last_id FROM diagnostics_sketch_state").fetchone()[0]
+    max_id = cursor.execute(MAX_ID_SQL).fetchone()[0]
+    dirty = cursor.execute("SELECT day, state, city FROM diagnostics_sketch_dirty").fetchall()
+
+    if max_id <= last_id and not dirty:
+        return 0
+
+    days = {}
+    locations = {}
+
+    # Grupos com linhas removidas ou alteradas são recalculados do zero
+    for day, state, city in dirty:
+        bounds = (day, _next_day(day))
+
+        if day not in days:
+            days[day] = sketch = HyperLogLog()
+            for (device_id,) in cursor.execute(
+                "SELECT device_id FROM diagnostics_all WHERE date >= ? AND date < ?", bounds
+            ).fetchall():
+                sketch.add(device_id)
+
+        locations[(day, state, city)] = sketch = HyperLogLog()
+        for (device_id,) in cursor.execute(
+            "SELECT device_id FROM diagnostics_all WHERE state = ? AND city = ? AND date >= ? AND date < ?",
+            (state, city) + bounds
+        ).fetchall():
+            sketch.add(device_id)
+
+    rebuilt_days = set(days)
+    rebuilt_locations = set(locations)
+    positions = {}
+
+    added = cursor.execute(
+        "SELECT COUNT(*) FROM diagnostics_all WHERE id > ? AND id <= ?", (last_id, max_id)
+    ).fetchone()[0]
+
+    # Leituras repetidas do dispositivo no mesmo grupo não mudam o sketch
+    rows = cursor.execute(
+        "SELECT DISTINCT DATE(date), state, city, device_id FROM diagnostics_all WHERE id > ? AND id <= ?",
+        (last_id, max_id)
+    )
+
+    for day, state, city, device_id in rows:
+        hashed = positions.get(device_id)
+        if hashed is None:
+            hashed = positions[device_id] = position(device_id)
+
+        sketch = days.get(day)
+        if sketch is None:
+            sketch = days[day] = HyperLogLog()
+        sketch.add_position(*hashed)
+
+        sketch = locations.get((day, state, city))
+        if sketch is None:
+            sketch = locations[(day, state, city)] = HyperLogLog()
+        sketch.add_position(*hashed)
+
+    for day, sketch in days.items():
+        if day not in rebuilt_days:
+            _load(cursor, "SELECT registers FROM diagnostics_daily_device_sketch WHERE day = ?", (day,), sketch)
+
+    for key, sketch in locations.items():
+        if key not in rebuilt_locations:
+            _load(cursor, "SELECT registers FROM diagnostics_location_device_sketch WHERE day = ? AND state = ? AND city = ?", key, sketch)
+
+    cursor.executemany(
+        "DELETE FROM diagnostics_daily_device_sketch WHERE day = ?",
+        [(day,) for day, sketch in days.items() if not any(sketch.registers)]
+    )
+    cursor.executemany(
+        "INSERT OR REPLACE INTO diagnostics_daily_device_sketch (day, registers) VALUES (?, ?)",
+        [(day, sketch.to_bytes()) for day, sketch in days.items() if any(sketch.registers)]
+    )
+    cursor.executemany(
+        "DELETE FROM diagnostics_location_device_sketch WHERE day = ? AND state = ? AND city = ?",
+        [key for key, sketch in locations.items() if not any(sketch.registers)]
+    )
+    cursor.executemany(
+        "INSERT OR REPLACE INTO diagnostics_location_device_sketch (day, state, city, registers) VALUES (?, ?, ?, ?)",
+        [key + (sketch.to_bytes(),) for key, sketch in locations.items() if any(sketch.registers)]
+    )
+
+    cursor.execute("DELETE FROM diagnostics_sketch_dirty")
+    cursor.execute("UPDATE diagnostics_sketch_state SET last_id = ?", (max_id,))
+
+    return added
+
+
+def rebuild(conn) -> int:
+    """
+    Recalcula todos os sketches a partir das linhas brutas
+
+    Args:
+        conn: Conexão sqlite3 (DB-API) com o banco
+
+    Retorna a quantidade de grupos (dia, estado, cidade) gerados.
+    """
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute("DELETE FROM diagnostics_daily_device_sketch")
+        cursor.execute("DELETE FROM diagnostics_location_device_sketch")
+        cursor.execute("DELETE FROM diagnostics_sketch_dirty")
+        cursor.execute("UPDATE diagnostics_sketch_state SET last_id = 0")
+        refresh(cursor)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+    return conn.execute("SELECT COUNT(*) FROM diagnostics_location_device_sketch").fetchone()[0]
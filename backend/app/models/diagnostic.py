@@ -1,4 +1,5 @@
 from app.extensions import db
+from app.models.schema import EPOCH_SQL
 
 
 class Diagnostic(db.Model):
@@ -6,6 +7,12 @@ class Diagnostic(db.Model):
     Modelo de diagnóstico de rede
     """
     __tablename__ = 'diagnostics'
+    __table_args__ = (
+        db.Index('idx_diagnostics_date', 'date'),
+        db.Index('idx_diagnostics_state_city_date', 'state', 'city', 'date'),
+        db.Index('idx_diagnostics_device_date', 'device_id', 'date'),
+        db.Index('idx_diagnostics_epoch', 'epoch', 'state', 'city', 'latency_ms', 'packet_loss', 'quality_of_service'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     device_id = db.Column(db.String(50), nullable=False)
@@ -15,6 +22,7 @@ class Diagnostic(db.Model):
     packet_loss = db.Column(db.Float, nullable=False)
     quality_of_service = db.Column(db.Float, nullable=False)
     date = db.Column(db.DateTime, nullable=False)
+    epoch = db.Column(db.Integer, db.Computed(EPOCH_SQL, persisted=False))
     
     def __repr__(self):
         return f'<Diagnostic {self.id} - {self.device_id}>'
@@ -0,0 +1,102 @@
+"""
+Dimensão de localidades dos diagnósticos
+
+diagnostics_locations tem uma linha por par (estado, cidade), com um id
+inteiro e as chaves de busca state_key e city_key: o texto sem acentos e sem
+diferenciar maiúsculas (fold()). Os triggers da migração 10 registram os pares
+novos gravados por qualquer caminho, com as chaves nulas; refresh() preenche
+as chaves e indexa os trigramas de cada uma em diagnostics_location_trigrams.
+É chamado pela gravação em lote e pelo upgrade-db; quem busca dobra na hora
+os pares ainda pendentes.
+
+Os filtros de cidade e estado procuram o termo como substring da chave, ou
+a chave igual a um dos termos (operadores eq e in de app.utils.filters): os
+trigramas do termo selecionam os candidatos pelo índice e a comparação é
+conferida em cada um (termos com menos de 3 caracteres percorrem a dimensão,
+que tem uma linha por localidade). Os ids encontrados viram um IN indexado
+sobre (state, city) nas tabelas de diagnósticos e resumos.
+"""
+import unicodedata
+from typing import Set, Tuple
+
+FIELDS = ('city', 'state')
+
+TRIGRAM_SIZE = 3
+
+
+def fold(value: str) -> str:
+    """Chave de busca: sem acentos (decomposição NFKD) e em minúsculas (casefold)"""
+    decomposed = unicodedata.normalize('NFKD', value)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def trigrams(key: str) -> Set[str]:
+    """Trigramas de uma chave já dobrada (vazio abaixo de 3 caracteres)"""
+    return {key[start:start + TRIGRAM_SIZE] for start in range(len(key) - TRIGRAM_SIZE + 1)}
+
+
+def matches(operator: str, keys: Tuple[str, ...]):
+    """
+    Função que indica se um texto atende a uma condição de localidade
+
+    keys são termos já dobrados: 'contains' procura o termo como substring da
+    chave do texto; 'eq' e 'in', a chave igual a um deles.
+    """
+    if operator == 'contains':
+        return lambda value: keys[0] in fold(value)
+    return lambda value: fold(value) in keys
+
+
+def refresh(cursor) -> int:
+    """
+    Preenche as chaves e os trigramas das localidades registradas pelos triggers
+
+    Não faz commit: o chamador controla a transação.
+
+    Retorna a quantidade de localidades indexadas.
+    """
+    pending = cursor.execute(
+        "SELECT id, state, city FROM diagnostics_locations WHERE city_key IS NULL"
+    ).fetchall()
+
+    for location_id, state, city in pending:
+        keys = {'state': fold(state), 'city': fold(city)}
+        cursor.execute(
+            "UPDATE diagnostics_locations SET state_key = ?, city_key = ? WHERE id = ?",
+            (keys['state'], keys['city'], location_id)
+        )
+        cursor.executemany(
+            "INSERT OR IGNORE INTO diagnostics_location_trigrams (field, trigram, location_id) VALUES (?, ?, ?)",
+            [(field, trigram, location_id) for field in FIELDS for trigram in trigrams(keys[field])]
+        )
+
+    return len(pending)
+
+
+def rebuild(conn) -> int:
+    """
+    Recria a dimensão a partir dos pares distintos de todas as partições
+
+    Remove as localidades sem diagnósticos; os ids são reatribuídos.
+
+    Args:
+        conn: Conexão sqlite3 (DB-API) com o banco
+
+    Retorna a quantidade de localidades.
+    """
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute("DELETE FROM diagnostics_location_trigrams")
+        cursor.execute("DELETE FROM diagnostics_locations")
+        cursor.execute(
+            "INSERT INTO diagnostics_locations (state, city)"
+            " SELECT DISTINCT state, city FROM diagnostics_all ORDER BY state, city"
+        )
+        refresh(cursor)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+    return conn.execute("SELECT COUNT(*) FROM diagnostics_locations").fetchone()[0]
@@ -0,0 +1,147 @@
+"""
+Manutenção dos t-digests de métricas por (dia, estado, cidade)
+
+Cada grupo guarda um digest de latency_ms, packet_loss e quality_of_service,
+cobrindo as linhas de diagnostics até diagnostics_digest_state.last_id. Segue
+o mesmo esquema dos sketches de dispositivos (app.models.device_sketches):
+refresh() acrescenta as linhas novas e recalcula os grupos marcados pelos
+triggers de remoção e alteração.
+"""
+from datetime import date, timedelta
+
+from app.models.schema import MAX_ID_SQL
+from app.utils.tdigest import TDigest
+
+METRICS = ('latency_ms', 'packet_loss', 'quality_of_service')
+
+# Valores acumulados por grupo antes de serem passados aos digests
+_FLUSH_SIZE = 10000
+
+
+def _next_day(day: str) -> str:
+    return (date.fromisoformat(day) + timedelta(days=1)).isoformat()
+
+
+def _add_values(digests, values) -> None:
+    for digest, column in zip(digests, values):
+        digest.add_many(column)
+        column.clear()
+
+
+def refresh(cursor) -> int:
+    """
+    Atualiza os digests até o maior id gravado
+
+    Não faz commit: o chamador controla a transação.
+
+    Args:
+        cursor: Cursor DB-API da conexão
+
+    Retorna a quantidade de linhas novas incorporadas.
+    """
+    last_id = cursor.execute("SELECT last_id FROM diagnostics_digest_state").fetchone()[0]
+    max_id = cursor.execute(MAX_ID_SQL).fetchone()[0]
+    dirty = cursor.execute("SELECT day, state, city FROM diagnostics_digest_dirty").fetchall()
+
+    if max_id <= last_id and not dirty:
+        return 0
+
+    groups = {}
+
+    # Grupos com linhas removidas ou alteradas são recalculados do zero
+    for day, state, city in dirty:
+        rows = cursor.execute(
+            "SELECT latency_ms, packet_loss, quality_of_service FROM diagnostics_all"
+            " WHERE state = ? AND city = ? AND date >= ? AND date < ?",
+            (state, city, day, _next_day(day))
+        ).fetchall()
+
+        groups[(day, state, city)] = digests = tuple(TDigest() for _ in METRICS)
+        for digest, column in zip(digests, zip(*rows)):
+            digest.add_many(column)
+
+    rebuilt = set(groups)
+    pending = {}
+    added = 0
+
+    rows = cursor.execute(
+        "SELECT DATE(date), state, city, latency_ms, packet_loss, quality_of_service"
+        " FROM diagnostics_all WHERE id > ? AND id <= ?",
+        (last_id, max_id)
+    )
+
+    for day, state, city, latency_ms, packet_loss, quality_of_service in rows:
+        added += 1
+        key = (day, state, city)
+
+        # O recálculo acima já leu todas as linhas do grupo
+        if key in rebuilt:
+            continue
+
+        values = pending.get(key)
+        if values is None:
+            values = pending[key] = ([], [], [])
+            groups[key] = tuple(TDigest() for _ in METRICS)
+
+        values[0].append(latency_ms)
+        values[1].append(packet_loss)
+        values[2].append(quality_of_service)
+
+        if len(values[0]) >= _FLUSH_SIZE:
+            _add_values(groups[key], values)
+
+    for key, values in pending.items():
+        _add_values(groups[key], values)
+
+    for key, digests in groups.items():
+        if key in rebuilt:
+            continue
+
+        row = cursor.execute(
+            "SELECT latency_ms, packet_loss, quality_of_service FROM diagnostics_metric_digest"
+            " WHERE day = ? AND state = ? AND city = ?",
+            key
+        ).fetchone()
+
+        if row is not None:
+            for digest, data in zip(digests, row):
+                digest.merge(TDigest.from_bytes(data))
+
+    cursor.executemany(
+        "DELETE FROM diagnostics_metric_digest WHERE day = ? AND state = ? AND city = ?",
+        [key for key, digests in groups.items() if digests[0].min is None]
+    )
+    cursor.executemany(
+        "INSERT OR REPLACE INTO diagnostics_metric_digest"
+        " (day, state, city, latency_ms, packet_loss, quality_of_service) VALUES (?, ?, ?, ?, ?, ?)",
+        [key + tuple(digest.to_bytes() for digest in digests) for key, digests in groups.items() if digests[0].min is not None]
+    )
+
+    cursor.execute("DELETE FROM diagnostics_digest_dirty")
+    cursor.execute("UPDATE diagnostics_digest_state SET last_id = ?", (max_id,))
+
+    return added
+
+
+def rebuild(conn) -> int:
+    """
+    Recalcula todos os digests a partir das linhas brutas
+
+    Args:
+        conn: Conexão sqlite3 (DB-API) com o banco
+
+    Retorna a quantidade de grupos (dia, estado, cidade) gerados.
+    """
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute("DELETE FROM diagnostics_metric_digest")
+        cursor.execute("DELETE FROM diagnostics_digest_dirty")
+        cursor.execute("UPDATE diagnostics_digest_state SET last_id = 0")
+        refresh(cursor)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+    return conn.execute("SELECT COUNT(*) FROM diagnostics_metric_digest").fetchone()[0]
@@ -0,0 +1,288 @@
+"""
+Partições por período da tabela diagnostics
+
+diagnostics é a partição corrente: recebe todas as gravações, e os triggers,
+a gravação em lote e os incrementos (id > last_id) continuam sobre ela.
+seal() move os períodos já encerrados (mês ou semana, Config.PARTITION_INTERVAL)
+para tabelas diagnostics_pAAAAMMDD com o mesmo schema e índices, registradas
+em diagnostics_partitions com o intervalo de datas, a quantidade de linhas e
+a faixa de ids. As leituras do DiagnosticsService consultam só as partições
+que cruzam o intervalo pedido; a view diagnostics_all une todas.
+
+drop() remove partições inteiras (DROP TABLE, sem DELETE linha a linha),
+opcionalmente arquivando cada uma num arquivo SQLite próprio e mantendo os
+rollups, sketches e digests dos seus dias.
+
+As linhas movidas passam antes pelos sketches e digests, então as partições
+seladas ficam sempre abaixo de last_id. Partições são somente leitura: as
+remoções e alterações pela API valem para a partição corrente.
+"""
+import os
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from app.models import device_sketches, metric_digests
+from app.models.schema import EPOCH_INDEX_COLUMNS, EPOCH_SQL
+
+INTERVALS = ('month', 'week')
+
+# Mesmas colunas de diagnostics; os ids vêm da partição corrente
+PARTITION_DDL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY,
+        device_id TEXT NOT NULL,
+        city TEXT NOT NULL,
+        state TEXT NOT NULL,
+        latency_ms REAL NOT NULL,
+        packet_loss REAL NOT NULL,
+        quality_of_service REAL NOT NULL,
+        date TEXT NOT NULL,
+        epoch INTEGER GENERATED ALWAYS AS (""" + EPOCH_SQL + """) VIRTUAL
+    )
+"""
+
+# Colunas copiadas entre tabelas (epoch é gerada e não aceita valores)
+STORED_COLUMNS = "id, device_id, city, state, latency_ms, packet_loss, quality_of_service, date"
+
+PARTITION_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS {schema}idx_{name}_date ON {name} (date)",
+    "CREATE INDEX IF NOT EXISTS {schema}idx_{name}_state_city_date ON {name} (state, city, date)",
+    "CREATE INDEX IF NOT EXISTS {schema}idx_{name}_device_date ON {name} (device_id, date)",
+    "CREATE INDEX IF NOT EXISTS {schema}idx_{name}_epoch ON {name} (" + EPOCH_INDEX_COLUMNS + ")",
+)
+
+# Tabelas resumidas por dia, removidas junto com as partições (keep_summaries=False)
+SUMMARY_TABLES = (
+    'diagnostics_daily_rollup',
+    'diagnostics_daily_device_sketch',
+    'diagnostics_location_device_sketch',
+    'diagnostics_sketch_dirty',
+    'diagnostics_metric_digest',
+    'diagnostics_digest_dirty',
+)
+
+
+def period_start(day: date, interval: str) -> date:
+    """Primeiro dia do período (mês ou semana iniciada na segunda) que contém day"""
+    if interval == 'month':
+        return day.replace(day=1)
+    if interval == 'week':
+        return day - timedelta(days=day.weekday())
+    raise ValueError(f"Intervalo de partição inválido: {interval}")
+
+
+def period_end(start: date, interval: str) -> date:
+    """Primeiro dia do período seguinte ao iniciado em start"""
+    if interval == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    if interval == 'week':
+        return start + timedelta(days=7)
+    raise ValueError(f"Intervalo de partição inválido: {interval}")
+
+
+def table_name(start: date) -> str:
+    return f'diagnostics_p{start:%Y%m%d}'
+
+
+def create_table(cursor, name: str, schema: Optional[str] = None) -> None:
+    """Cria a tabela de uma partição e seus índices (schema: banco anexado)"""
+    prefix = f'{schema}.' if schema else ''
+    cursor.execute(PARTITION_DDL.format(table=prefix + name))
+    for statement in PARTITION_INDEXES:
+        cursor.execute(statement.format(schema=prefix, name=name))
+
+
+def create_view(cursor) -> None:
+    """Recria diagnostics_all com a partição corrente e as partições do catálogo"""
+    names = [row[0] for row in cursor.execute("SELECT name FROM diagnostics_partitions ORDER BY start_date")]
+    cursor.execute("DROP VIEW IF EXISTS diagnostics_all")
+    cursor.execute("CREATE VIEW diagnostics_all AS " + " UNION ALL ".join(
+        f"SELECT * FROM {name}" for name in ['diagnostics'] + names
+    ))
+
+
+def list_partitions(conn) -> List[Dict]:
+    """Partições seladas, da mais antiga para a mais recente"""
+    rows = conn.execute(
+        "SELECT name, start_date, end_date, rows, min_id, max_id FROM diagnostics_partitions ORDER BY start_date"
+    ).fetchall()
+    return [dict(zip(('name', 'start_date', 'end_date', 'rows', 'min_id', 'max_id'), row)) for row in rows]
+
+
+def seal(conn, interval: str, before: Optional[date] = None) -> List[Dict]:
+    """
+    Move para partições as linhas dos períodos encerrados antes de before
+
+    Cada período com linhas em diagnostics vira (ou completa, no caso de
+    linhas atrasadas) a sua partição. Tudo ocorre numa transação: leitores
+    veem os dados antes ou depois da selagem, nunca pela metade. A versão dos
+    dados (diagnostics_data_version) muda uma única vez.
+
+    Args:
+        conn: Conexão sqlite3 (DB-API) com o banco
+        interval: 'month' ou 'week'
+        before: Só períodos que terminam até essa data (padrão: o período atual)
+
+    Retorna as partições que receberam linhas, com a quantidade movida.
+    """
+    boundary = period_start(before or date.today(), interval)
+    sealed = []
+
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        first = cursor.execute("SELECT MIN(date) FROM diagnostics").fetchone()[0]
+        start = period_start(date.fromisoformat(first[:10]), interval) if first else boundary
+
+        if start < boundary:
+            # Linhas ainda não incorporadas entram nos sketches e digests antes de sair
+            device_sketches.refresh(cursor)
+            metric_digests.refresh(cursor)
+            cursor.execute("UPDATE diagnostics_ingest_state SET moving_rows = 1")
+
+        while start < boundary:
+            end = period_end(start, interval)
+            bounds = (start.isoformat(), end.isoformat())
+            name = table_name(start)
+
+            total, min_id, max_id = cursor.execute(
+                "SELECT COUNT(*), MIN(id), MAX(id) FROM diagnostics WHERE date >= ? AND date < ?", bounds
+            ).fetchone()
+
+            if total:
+                overlapping = cursor.execute(
+                    "SELECT name FROM diagnostics_partitions WHERE start_date < ? AND end_date > ?"
+                    " AND NOT (name = ? AND start_date = ? AND end_date = ?)",
+                    (bounds[1], bounds[0], name) + bounds
+                ).fetchone()
+                if overlapping:
+                    raise ValueError(f"O período {bounds[0]} a {bounds[1]} sobrepõe a partição {overlapping[0]}")
+
+                create_table(cursor, name)
+                cursor.execute(
+                    f"INSERT INTO {name} ({STORED_COLUMNS}) SELECT {STORED_COLUMNS} FROM diagnostics WHERE date >= ? AND date < ?",
+                    bounds
+                )
+                cursor.execute("DELETE FROM diagnostics WHERE date >= ? AND date < ?", bounds)
+                cursor.execute("""
+                    INSERT INTO diagnostics_partitions (name, start_date, end_date, rows, min_id, max_id)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (name) DO UPDATE SET
+                        rows = rows + excluded.rows,
+                        min_id = MIN(min_id, excluded.min_id),
+                        max_id = MAX(max_id, excluded.max_id)
+                """, (name,) + bounds + (total, min_id, max_id))
+                sealed.append({'name': name, 'start_date': bounds[0], 'end_date': bounds[1], 'rows': total})
+
+            start = end
+
+        cursor.execute("UPDATE diagnostics_ingest_state SET moving_rows = 0")
+
+        if sealed:
+            create_view(cursor)
+            cursor.execute("UPDATE diagnostics_data_version SET changes = changes + 1")
+
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+    # Estatísticas do planejador para as partições novas ou alteradas
+    for partition in sealed:
+        conn.execute(f"ANALYZE {partition['name']}")
+    conn.commit()
+
+    return sealed
+
+
+def expired(conn, cutoff: date) -> List[Dict]:
+    """Partições cujo período termina até cutoff (só linhas anteriores a cutoff)"""
+    return [partition for partition in list_partitions(conn) if partition['end_date'] <= cutoff.isoformat()]
+
+
+def archive(conn, name: str, archive_dir: str) -> str:
+    """
+    Copia uma partição para o arquivo SQLite archive_dir/<name>.db
+
+    O arquivo recebe a tabela <name> com o schema e os índices da partição e
+    pode ser anexado (ATTACH) para consultas. Um arquivo existente não é
+    sobrescrito.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f'{name}.db')
+
+    if os.path.exists(path):
+        raise FileExistsError(f"Arquivo de partição já existe: {path}")
+
+    # ATTACH não é permitido dentro de uma transação
+    conn.execute("ATTACH DATABASE ? AS archive", (path,))
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            create_table(cursor, name, schema='archive')
+            cursor.execute(f"INSERT INTO archive.{name} ({STORED_COLUMNS}) SELECT {STORED_COLUMNS} FROM main.{name}")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+    finally:
+        conn.execute("DETACH DATABASE archive")
+
+    return path
+
+
+def drop(conn, names: List[str], archive_dir: Optional[str] = None, keep_summaries: bool = False) -> List[Dict]:
+    """
+    Remove partições seladas inteiras
+
+    Args:
+        conn: Conexão sqlite3 (DB-API) com o banco
+        names: Partições a remover (nomes do catálogo)
+        archive_dir: Diretório onde cada partição é arquivada antes de sair
+        keep_summaries: Mantém rollup, sketches e digests dos dias removidos,
+                        que continuam nas agregações e estatísticas
+
+    Retorna as partições removidas, com o arquivo de cada uma quando arquivada.
+    """
+    partitions = [partition for partition in list_partitions(conn) if partition['name'] in names]
+
+    for partition in partitions:
+        partition['archive'] = archive(conn, partition['name'], archive_dir) if archive_dir else None
+
+    if not partitions:
+        return []
+
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.executemany("DELETE FROM diagnostics_partitions WHERE name = ?", [(partition['name'],) for partition in partitions])
+        create_view(cursor)
+
+        for partition in partitions:
+            cursor.execute(f"DROP TABLE {partition['name']}")
+
+            if not keep_summaries:
+                bounds = (partition['start_date'], partition['end_date'])
+                for table in SUMMARY_TABLES:
+                    cursor.execute(f"DELETE FROM {table} WHERE day >= ? AND day < ?", bounds)
+
+        cursor.execute("UPDATE diagnostics_data_version SET changes = changes + 1")
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+    return partitions
+
+
+def apply_retention(conn, interval: str, days: int, today: Optional[date] = None, archive_dir: Optional[str] = None, keep_summaries: bool = False) -> List[Dict]:
+    """
+    Sela os períodos encerrados e remove as partições mais antigas que days dias
+
+    Só partições inteiramente anteriores ao limite são removidas: a mais
+    antiga mantida pode ter alguns dias além da retenção.
+    """
+    cutoff = (today or date.today()) - timedelta(days=days)
+    seal(conn, interval, today)
+    return drop(conn, [partition['name'] for partition in expired(conn, cutoff)], archive_dir, keep_summaries)
@@ -0,0 +1,600 @@
+"""
+Gerenciamento versionado do schema SQLite
+
+A versão aplicada fica em PRAGMA user_version. Cada migração é uma lista de
+comandos SQL (ou funções que recebem o cursor) aplicados em ordem, uma única
+vez, dentro de uma transação.
+"""
+from typing import Callable, List, Union
+
+from app.models import locations
+
+
+# Colunas do rollup diário calculadas a partir das linhas brutas
+ROLLUP_COLUMNS_SQL = """
+    DATE(date), state, city, COUNT(*),
+    SUM(latency_ms), MIN(latency_ms), MAX(latency_ms),
+    SUM(packet_loss), MIN(packet_loss), MAX(packet_loss),
+    SUM(quality_of_service), MIN(quality_of_service), MAX(quality_of_service),
+    MIN(date), MAX(date)
+"""
+
+# Soma um grupo novo (excluded) a um grupo já existente no rollup diário
+ROLLUP_UPSERT_SQL = """
+    ON CONFLICT (day, state, city) DO UPDATE SET
+        total = total + excluded.total,
+        sum_latency_ms = sum_latency_ms + excluded.sum_latency_ms,
+        min_latency_ms = MIN(min_latency_ms, excluded.min_latency_ms),
+        max_latency_ms = MAX(max_latency_ms, excluded.max_latency_ms),
+        sum_packet_loss = sum_packet_loss + excluded.sum_packet_loss,
+        min_packet_loss = MIN(min_packet_loss, excluded.min_packet_loss),
+        max_packet_loss = MAX(max_packet_loss, excluded.max_packet_loss),
+        sum_quality_of_service = sum_quality_of_service + excluded.sum_quality_of_service,
+        min_quality_of_service = MIN(min_quality_of_service, excluded.min_quality_of_service),
+        max_quality_of_service = MAX(max_quality_of_service, excluded.max_quality_of_service),
+        first_date = MIN(first_date, excluded.first_date),
+        last_date = MAX(last_date, excluded.last_date)
+"""
+
+# Acumula no rollup as linhas inseridas depois de um id (gravação em lote)
+ROLLUP_MERGE_SQL = (
+    "INSERT INTO diagnostics_daily_rollup SELECT " + ROLLUP_COLUMNS_SQL +
+    " FROM diagnostics WHERE id > ? GROUP BY DATE(date), state, city" + ROLLUP_UPSERT_SQL
+)
+
+# Registra na dimensão de localidades os pares gravados depois de um id (gravação em lote)
+LOCATIONS_MERGE_SQL = (
+    "INSERT OR IGNORE INTO diagnostics_locations (state, city)"
+    " SELECT DISTINCT state, city FROM diagnostics WHERE id > ?"
+)
+
+# Maior id gravado, na tabela diagnostics ou nas partições seladas
+MAX_ID_SQL = """
+    SELECT MAX(
+        (SELECT COALESCE(MAX(id), 0) FROM diagnostics),
+        (SELECT COALESCE(MAX(max_id), 0) FROM diagnostics_partitions)
+    )
+"""
+
+# Instante de um diagnóstico em segundos desde 1970-01-01 (UTC), coluna gerada
+# epoch das tabelas de diagnósticos: os buckets de tempo são aritmética inteira
+# sobre ela, pelo índice, em vez de funções de texto sobre date
+EPOCH_SQL = "CAST(strftime('%s', date) AS INTEGER)"
+
+# Índice de buckets de tempo: cobre os filtros e as métricas agregadas
+EPOCH_INDEX_COLUMNS = "epoch, state, city, latency_ms, packet_loss, quality_of_service"
+
+# Linhas movidas para partições (app.models.partitions) não são remoções: os
+# triggers de DELETE só agem com o sinalizador moving_rows zerado
+_NOT_MOVING_SQL = "(SELECT moving_rows FROM diagnostics_ingest_state) = 0"
+
+
+def _add_partition_epoch(cursor) -> None:
+    """Acrescenta a coluna epoch e o seu índice às partições já seladas"""
+    names = [row[0] for row in cursor.execute("SELECT name FROM diagnostics_partitions")]
+    for name in names:
+        cursor.execute(f"ALTER TABLE {name} ADD COLUMN epoch INTEGER GENERATED ALWAYS AS ({EPOCH_SQL}) VIRTUAL")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_epoch ON {name} ({EPOCH_INDEX_COLUMNS})")
+
+
+MIGRATIONS: List[List[Union[str, Callable]]] = [
+    # 1 - Tabela de diagnósticos
+    [
+        """
+        CREATE TABLE IF NOT EXISTS diagnostics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT NOT NULL,
+            city TEXT NOT NULL,
+            state TEXT NOT NULL,
+            latency_ms REAL NOT NULL,
+            packet_loss REAL NOT NULL,
+            quality_of_service REAL NOT NULL,
+            date TEXT NOT NULL
+        )
+        """,
+    ],
+    # 2 - Índices para filtros por data, localidade e dispositivo
+    [
+        "CREATE INDEX IF NOT EXISTS idx_diagnostics_date ON diagnostics (date)",
+        "CREATE INDEX IF NOT EXISTS idx_diagnostics_state_city_date ON diagnostics (state, city, date)",
+        "CREATE INDEX IF NOT EXISTS idx_diagnostics_device_date ON diagnostics (device_id, date)",
+    ],
+    # 3 - Rollup diário por (dia, estado, cidade) mantido por triggers
+    [
+        """
+        CREATE TABLE IF NOT EXISTS diagnostics_daily_rollup (
+            day TEXT NOT NULL,
+            state TEXT NOT NULL,
+            city TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            sum_latency_ms REAL NOT NULL,
+            min_latency_ms REAL NOT NULL,
+            max_latency_ms REAL NOT NULL,
+            sum_packet_loss REAL NOT NULL,
+            min_packet_loss REAL NOT NULL,
+            max_packet_loss REAL NOT NULL,
+            sum_quality_of_service REAL NOT NULL,
+            min_quality_of_service REAL NOT NULL,
+            max_quality_of_service REAL NOT NULL,
+            first_date TEXT NOT NULL,
+            last_date TEXT NOT NULL,
+            PRIMARY KEY (day, state, city)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_daily_rollup_state_city_day ON diagnostics_daily_rollup (state, city, day)",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_diagnostics_rollup_insert AFTER INSERT ON diagnostics
+        BEGIN
+            INSERT INTO diagnostics_daily_rollup VALUES (
+                DATE(NEW.date), NEW.state, NEW.city, 1,
+                NEW.latency_ms, NEW.latency_ms, NEW.latency_ms,
+                NEW.packet_loss, NEW.packet_loss, NEW.packet_loss,
+                NEW.quality_of_service, NEW.quality_of_service, NEW.quality_of_service,
+                NEW.date, NEW.date
+            )
+            """ + ROLLUP_UPSERT_SQL + """;
+        END
+        """,
+        # MIN/MAX não podem ser decrementados: remoções e alterações recalculam o grupo
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_diagnostics_rollup_delete AFTER DELETE ON diagnostics
+        BEGIN
+            DELETE FROM diagnostics_daily_rollup
+            WHERE day = DATE(OLD.date) AND state = OLD.state AND city = OLD.city;
+            INSERT INTO diagnostics_daily_rollup
+            SELECT """ + ROLLUP_COLUMNS_SQL + """
+            FROM diagnostics
+            WHERE state = OLD.state AND city = OLD.city AND DATE(date) = DATE(OLD.date)
+            GROUP BY DATE(date), state, city;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_diagnostics_rollup_update AFTER UPDATE ON diagnostics
+        BEGIN
+            DELETE FROM diagnostics_daily_rollup
+            WHERE (day = DATE(OLD.date) AND state = OLD.state AND city = OLD.city)
+               OR (day = DATE(NEW.date) AND state = NEW.state AND city = NEW.city);
+            INSERT INTO diagnostics_daily_rollup
+            SELECT """ + ROLLUP_COLUMNS_SQL + """
+            FROM diagnostics
+            WHERE (state = OLD.state AND city = OLD.city AND DATE(date) = DATE(OLD.date))
+               OR (state = NEW.state AND city = NEW.city AND DATE(date) = DATE(NEW.date))
+            GROUP BY DATE(date), state, city;
+        END
+        """,
+        "INSERT OR REPLACE INTO diagnostics_daily_rollup SELECT " + ROLLUP_COLUMNS_SQL + " FROM diagnostics GROUP BY DATE(date), state, city",
+    ],
+    # 4 - Gravações em lote adiam o rollup por linha e o acumulam de uma vez.
+    #     O sinalizador só é alterado dentro da transação de escrita, então
+    #     outras conexões sempre o veem zerado.
+    [
+        "CREATE TABLE IF NOT EXISTS diagnostics_ingest_state (defer_rollups INTEGER NOT NULL)",
+        "INSERT INTO diagnostics_ingest_state (defer_rollups) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM diagnostics_ingest_state)",
+        "DROP TRIGGER IF EXISTS trg_diagnostics_rollup_insert",
+        """
+        CREATE TRIGGER trg_diagnostics_rollup_insert AFTER INSERT ON diagnostics
+        WHEN (SELECT defer_rollups FROM diagnostics_ingest_state) = 0
+        BEGIN
+            INSERT INTO diagnostics_daily_rollup VALUES (
+                DATE(NEW.date), NEW.state, NEW.city, 1,
+                NEW.latency_ms, NEW.latency_ms, NEW.latency_ms,
+                NEW.packet_loss, NEW.packet_loss, NEW.packet_loss,
+                NEW.quality_of_service, NEW.quality_of_service, NEW.quality_of_service,
+                NEW.date, NEW.date
+            )
+            """ + ROLLUP_UPSERT_SQL + """;
+        END
+        """,
+    ],
+    # 5 - Sketches HyperLogLog de device_id por dia e por (dia, estado, cidade).
+    #     São preenchidos em Python (app.models.device_sketches) até o id em
+    #     diagnostics_sketch_state; remoções e alterações marcam o grupo para
+    #     recálculo, já que um sketch não permite retirar valores.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS diagnostics_daily_device_sketch (
+            day TEXT PRIMARY KEY,
+            registers BLOB NOT NULL
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS diagnostics_location_device_sketch (
+            day TEXT NOT NULL,
+            state TEXT NOT NULL,
+            city TEXT NOT NULL,
+            registers BLOB NOT NULL,
+            PRIMARY KEY (day, state, city)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_location_device_sketch_state_city_day ON diagnostics_location_device_sketch (state, city, day)",
+        "CREATE TABLE IF NOT EXISTS diagnostics_sketch_state (last_id INTEGER NOT NULL)",
+        "INSERT INTO diagnostics_sketch_state (last_id) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM diagnostics_sketch_state)",
+        """
+        CREATE TABLE IF NOT EXISTS diagnostics_sketch_dirty (
+            day TEXT NOT NULL,
+            state TEXT NOT NULL,
+            city TEXT NOT NULL,
+            PRIMARY KEY (day, state, city)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_diagnostics_sketch_delete AFTER DELETE ON diagnostics
+        WHEN OLD.id <= (SELECT last_id FROM diagnostics_sketch_state)
+        BEGIN
+            INSERT OR IGNORE INTO diagnostics_sketch_dirty VALUES (DATE(OLD.date), OLD.state, OLD.city);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_diagnostics_sketch_update
+        AFTER UPDATE OF device_id, city, state, date ON diagnostics
+        WHEN OLD.id <= (SELECT last_id FROM diagnostics_sketch_state)
+        BEGIN
+            INSERT OR IGNORE INTO diagnostics_sketch_dirty VALUES (DATE(OLD.date), OLD.state, OLD.city);
+            INSERT OR IGNORE INTO diagnostics_sketch_dirty VALUES (DATE(NEW.date), NEW.state, NEW.city);
+        END
+        """,
+    ],
+    # 6 - t-digests de latency_ms, packet_loss e quality_of_service por
+    #     (dia, estado, cidade), mantidos como os sketches da migração 5
+    #     (app.models.metric_digests)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS diagnostics_metric_digest (
+            day TEXT NOT NULL,
+            state TEXT NOT NULL,
+            city TEXT NOT NULL,
+            latency_ms BLOB NOT NULL,
+            packet_loss BLOB NOT NULL,
+            quality_of_service BLOB NOT NULL,
+            PRIMARY KEY (day, state, city)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_metric_digest_state_city_day ON diagnostics_metric_digest (state, city, day)",
+        "CREATE TABLE IF NOT EXISTS diagnostics_digest_state (last_id INTEGER NOT NULL)",
+        "INSERT INTO diagnostics_digest_state (last_id) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM diagnostics_digest_state)",
+        """
+        CREATE TABLE IF NOT EXISTS diagnostics_digest_dirty (
+            day TEXT NOT NULL,
+            state TEXT NOT NULL,
+            city TEXT NOT NULL,
+            PRIMARY KEY (day, state, city)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_diagnostics_digest_delete AFTER DELETE ON diagnostics
+        WHEN OLD.id <= (SELECT last_id FROM diagnostics_digest_state)
+        BEGIN
+            INSERT OR IGNORE INTO diagnostics_digest_dirty VALUES (DATE(OLD.date), OLD.state, OLD.city);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_diagnostics_digest_update
+        AFTER UPDATE OF city, state, date, latency_ms, packet_loss, quality_of_service ON diagnostics
+        WHEN OLD.id <= (SELECT last_id FROM diagnostics_digest_state)
+        BEGIN
+            INSERT OR IGNORE INTO diagnostics_digest_dirty VALUES (DATE(OLD.date), OLD.state, OLD.city);
+            INSERT OR IGNORE INTO diagnostics_digest_dirty VALUES (DATE(NEW.date), NEW.state, NEW.city);
+        END
+        """,
+    ],
+    # 7 - Contador de remoções e alterações em diagnostics. Junto com MAX(id)
+    #     identifica a versão dos dados (inserções só acrescentam ids maiores).
+    [
+        "CREATE TABLE IF NOT EXISTS diagnostics_data_version (changes INTEGER NOT NULL)",
+        "INSERT INTO diagnostics_data_version (changes) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM diagnostics_data_version)",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_diagnostics_version_delete AFTER DELETE ON diagnostics
+        BEGIN
+            UPDATE diagnostics_data_version SET changes = changes + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_diagnostics_version_update AFTER UPDATE ON diagnostics
+        BEGIN
+            UPDATE diagnostics_data_version SET changes = changes + 1;
+        END
+        """,
+    ],
+    # 8 - Partições por período (app.models.partitions). diagnostics segue
+    #     recebendo as gravações; os períodos completos são movidos para
+    #     tabelas diagnostics_pAAAAMMDD, registradas no catálogo
+    #     diagnostics_partitions. A view diagnostics_all une todas e é lida
+    #     pelos recálculos de rollup, sketches e digests.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS diagnostics_partitions (
+            name TEXT PRIMARY KEY,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            min_id INTEGER NOT NULL,
+            max_id INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """,
+        "ALTER TABLE diagnostics_ingest_state ADD COLUMN moving_rows INTEGER NOT NULL DEFAULT 0",
+        "CREATE VIEW IF NOT EXISTS diagnostics_all AS SELECT * FROM diagnostics",
+        "DROP TRIGGER IF EXISTS trg_diagnostics_rollup_delete",
+        """
+        CREATE TRIGGER trg_diagnostics_rollup_delete AFTER DELETE ON diagnostics
+        WHEN """ + _NOT_MOVING_SQL + """
+        BEGIN
+            DELETE FROM diagnostics_daily_rollup
+            WHERE day = DATE(OLD.date) AND state = OLD.state AND city = OLD.city;
+            INSERT INTO diagnostics_daily_rollup
+            SELECT """ + ROLLUP_COLUMNS_SQL + """
+            FROM diagnostics_all
+            WHERE state = OLD.state AND city = OLD.city AND DATE(date) = DATE(OLD.date)
+            GROUP BY DATE(date), state, city;
+        END
+        """,
+        "DROP TRIGGER IF EXISTS trg_diagnostics_rollup_update",
+        """
+        CREATE TRIGGER trg_diagnostics_rollup_update AFTER UPDATE ON diagnostics
+        BEGIN
+            DELETE FROM diagnostics_daily_rollup
+            WHERE (day = DATE(OLD.date) AND state = OLD.state AND city = OLD.city)
+               OR (day = DATE(NEW.date) AND state = NEW.state AND city = NEW.city);
+            INSERT INTO diagnostics_daily_rollup
+            SELECT """ + ROLLUP_COLUMNS_SQL + """
+            FROM diagnostics_all
+            WHERE (state = OLD.state AND city = OLD.city AND DATE(date) = DATE(OLD.date))
+               OR (state = NEW.state AND city = NEW.city AND DATE(date) = DATE(NEW.date))
+            GROUP BY DATE(date), state, city;
+        END
+        """,
+        "DROP TRIGGER IF EXISTS trg_diagnostics_sketch_delete",
+        """
+        CREATE TRIGGER trg_diagnostics_sketch_delete AFTER DELETE ON diagnostics
+        WHEN OLD.id <= (SELECT last_id FROM diagnostics_sketch_state) AND """ + _NOT_MOVING_SQL + """
+        BEGIN
+            INSERT OR IGNORE INTO diagnostics_sketch_dirty VALUES (DATE(OLD.date), OLD.state, OLD.city);
+        END
+        """,
+        "DROP TRIGGER IF EXISTS trg_diagnostics_digest_delete",
+        """
+        CREATE TRIGGER trg_diagnostics_digest_delete AFTER DELETE ON diagnostics
+        WHEN OLD.id <= (SELECT last_id FROM diagnostics_digest_state) AND """ + _NOT_MOVING_SQL + """
+        BEGIN
+            INSERT OR IGNORE INTO diagnostics_digest_dirty VALUES (DATE(OLD.date), OLD.state, OLD.city);
+        END
+        """,
+        "DROP TRIGGER IF EXISTS trg_diagnostics_version_delete",
+        """
+        CREATE TRIGGER trg_diagnostics_version_delete AFTER DELETE ON diagnostics
+        WHEN """ + _NOT_MOVING_SQL + """
+        BEGIN
+            UPDATE diagnostics_data_version SET changes = changes + 1;
+        END
+        """,
+    ],
+    # 9 - Coluna gerada epoch (virtual, sem espaço na tabela) e índice para os
+    # buckets de tempo de /aggregate, na partição corrente e nas seladas
+    [
+        f"ALTER TABLE diagnostics ADD COLUMN epoch INTEGER GENERATED ALWAYS AS ({EPOCH_SQL}) VIRTUAL",
+        f"CREATE INDEX IF NOT EXISTS idx_diagnostics_epoch ON diagnostics ({EPOCH_INDEX_COLUMNS})",
+        _add_partition_epoch,
+    ],
+    # 10 - Dimensão de localidades (estado, cidade) com chaves de busca sem
+    # acentos e índice de trigramas, para os filtros e o autocompletar
+    [
+        """
+        CREATE TABLE IF NOT EXISTS diagnostics_locations (
+            id INTEGER PRIMARY KEY,
+            state TEXT NOT NULL,
+            city TEXT NOT NULL,
+            state_key TEXT,
+            city_key TEXT,
+            UNIQUE (state, city)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS diagnostics_location_trigrams (
+            field TEXT NOT NULL,
+            trigram TEXT NOT NULL,
+            location_id INTEGER NOT NULL,
+            PRIMARY KEY (field, trigram, location_id)
+        ) WITHOUT ROWID
+        """,
+        # Localidades ainda sem chaves (registradas pelos triggers)
+        "CREATE INDEX IF NOT EXISTS idx_diagnostics_locations_pending ON diagnostics_locations (id) WHERE city_key IS NULL",
+        "INSERT OR IGNORE INTO diagnostics_locations (state, city) SELECT DISTINCT state, city FROM diagnostics_all ORDER BY state, city",
+        locations.refresh,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_diagnostics_location_insert AFTER INSERT ON diagnostics
+        WHEN (SELECT defer_rollups FROM diagnostics_ingest_state) = 0
+        BEGIN
+            INSERT OR IGNORE INTO diagnostics_locations (state, city) VALUES (NEW.state, NEW.city);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_diagnostics_location_update AFTER UPDATE OF state, city ON diagnostics
+        BEGIN
+            INSERT OR IGNORE INTO diagnostics_locations (state, city) VALUES (NEW.state, NEW.city);
+        END
+        """,
+    ],
+    # 11 - Médias e variâncias móveis (EWMA) das métricas por dispositivo e
+    # por (estado, cidade), para a detecção de anomalias
+    # (app.models.anomalies). Mantidas como os sketches da migração 5; score
+    # (maior |z| da última leitura) é indexado para o ranking.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS diagnostics_device_ewma (
+            device_id TEXT PRIMARY KEY,
+            samples INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            last_date TEXT NOT NULL,
+            latency_ms_last REAL NOT NULL,
+            latency_ms_mean REAL NOT NULL,
+            latency_ms_var REAL NOT NULL,
+            latency_ms_z REAL NOT NULL,
+            packet_loss_last REAL NOT NULL,
+            packet_loss_mean REAL NOT NULL,
+            packet_loss_var REAL NOT NULL,
+            packet_loss_z REAL NOT NULL,
+            quality_of_service_last REAL NOT NULL,
+            quality_of_service_mean REAL NOT NULL,
+            quality_of_service_var REAL NOT NULL,
+            quality_of_service_z REAL NOT NULL,
+            score REAL NOT NULL
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS diagnostics_location_ewma (
+            state TEXT NOT NULL,
+            city TEXT NOT NULL,
+            samples INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            last_date TEXT NOT NULL,
+            latency_ms_last REAL NOT NULL,
+            latency_ms_mean REAL NOT NULL,
+            latency_ms_var REAL NOT NULL,
+            latency_ms_z REAL NOT NULL,
+            packet_loss_last REAL NOT NULL,
+            packet_loss_mean REAL NOT NULL,
+            packet_loss_var REAL NOT NULL,
+            packet_loss_z REAL NOT NULL,
+            quality_of_service_last REAL NOT NULL,
+            quality_of_service_mean REAL NOT NULL,
+            quality_of_service_var REAL NOT NULL,
+            quality_of_service_z REAL NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (state, city)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_device_ewma_score ON diagnostics_device_ewma (score)",
+        "CREATE INDEX IF NOT EXISTS idx_location_ewma_score ON diagnostics_location_ewma (score)",
+        "CREATE TABLE IF NOT EXISTS diagnostics_ewma_state (last_id INTEGER NOT NULL)",
+        "INSERT INTO diagnostics_ewma_state (last_id) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM diagnostics_ewma_state)",
+        "CREATE TABLE IF NOT EXISTS diagnostics_ewma_device_dirty (device_id TEXT PRIMARY KEY) WITHOUT ROWID",
+        """
+        CREATE TABLE IF NOT EXISTS diagnostics_ewma_location_dirty (
+            state TEXT NOT NULL,
+            city TEXT NOT NULL,
+            PRIMARY KEY (state, city)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_diagnostics_ewma_delete AFTER DELETE ON diagnostics
+        WHEN OLD.id <= (SELECT last_id FROM diagnostics_ewma_state) AND """ + _NOT_MOVING_SQL + """
+        BEGIN
+            INSERT OR IGNORE INTO diagnostics_ewma_device_dirty VALUES (OLD.device_id);
+            INSERT OR IGNORE INTO diagnostics_ewma_location_dirty VALUES (OLD.state, OLD.city);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_diagnostics_ewma_update
+        AFTER UPDATE OF device_id, city, state, date, latency_ms, packet_loss, quality_of_service ON diagnostics
+        WHEN OLD.id <= (SELECT last_id FROM diagnostics_ewma_state)
+        BEGIN
+            INSERT OR IGNORE INTO diagnostics_ewma_device_dirty VALUES (OLD.device_id);
+            INSERT OR IGNORE INTO diagnostics_ewma_device_dirty VALUES (NEW.device_id);
+            INSERT OR IGNORE INTO diagnostics_ewma_location_dirty VALUES (OLD.state, OLD.city);
+            INSERT OR IGNORE INTO diagnostics_ewma_location_dirty VALUES (NEW.state, NEW.city);
+        END
+        """,
+    ],
+    # 12 - A média e a variância gravadas passam a ser as de referência do z
+    # (antes da última leitura): as médias móveis são descartadas e
+    # recalculadas pelo refresh() do upgrade-db
+    [
+        "DELETE FROM diagnostics_device_ewma",
+        "DELETE FROM diagnostics_location_ewma",
+        "DELETE FROM diagnostics_ewma_device_dirty",
+        "DELETE FROM diagnostics_ewma_location_dirty",
+        "UPDATE diagnostics_ewma_state SET last_id = 0",
+    ],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn) -> int:
+    """Retorna a versão do schema aplicada ao banco"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn) -> int:
+    """
+    Aplica as migrações pendentes
+
+    Args:
+        conn: Conexão sqlite3 (DB-API) com o banco
+
+    Retorna a versão final do schema.
+    """
+    version = get_schema_version(conn)
+
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        try:
+            for statement in statements:
+                if callable(statement):
+                    statement(cursor)
+                else:
+                    cursor.execute(statement)
+            # PRAGMA não aceita parâmetros; number é sempre um inteiro
+            cursor.execute(f"PRAGMA user_version = {int(number)}")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+
+    return get_schema_version(conn)
+
+
+def rebuild_rollups(conn) -> int:
+    """
+    Recalcula o rollup diário a partir das linhas brutas de todas as partições (backfill)
+
+    Args:
+        conn: Conexão sqlite3 (DB-API) com o banco
+
+    Retorna a quantidade de grupos (dia, estado, cidade) gerados.
+    """
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute("DELETE FROM diagnostics_daily_rollup")
+        cursor.execute(
+            "INSERT INTO diagnostics_daily_rollup SELECT " + ROLLUP_COLUMNS_SQL +
+            " FROM diagnostics_all GROUP BY DATE(date), state, city"
+        )
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+    return conn.execute("SELECT COUNT(*) FROM diagnostics_daily_rollup").fetchone()[0]
+
+
+def reset(conn) -> None:
+    """Remove as tabelas de diagnósticos (e partições) e zera a versão do schema"""
+    partitions = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB 'diagnostics_p[0-9]*'"
+    ).fetchall()
+    conn.execute("DROP VIEW IF EXISTS diagnostics_all")
+    for (name,) in partitions:
+        conn.execute(f"DROP TABLE IF EXISTS {name}")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_partitions")
+    conn.execute("DROP TABLE IF EXISTS diagnostics")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_daily_rollup")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_ingest_state")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_daily_device_sketch")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_location_device_sketch")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_sketch_state")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_sketch_dirty")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_metric_digest")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_digest_state")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_digest_dirty")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_data_version")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_locations")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_location_trigrams")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_device_ewma")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_location_ewma")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_ewma_state")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_ewma_device_dirty")
+    conn.execute("DROP TABLE IF EXISTS diagnostics_ewma_location_dirty")
+    conn.execute("PRAGMA user_version = 0")
+    conn.commit()
@@ -1,28 +1,24 @@
-from flask import Blueprint, request, current_app, url_for
+from flask import Blueprint, Response, request, current_app, stream_with_context, url_for
+from app.services.anomaly_service import AnomalyService
 from app.services.diagnostics_service import DiagnosticsService
+from app.services.ingest_service import IngestService
+from app.services.serialization import to_columnar
+from app.extensions import cache, conditional, database, filter_compiler, single_flight
+from app.utils.filters import FILTER_FIELDS
 from app.utils.validators import RequestValidator, ValidationError
-import jwt
+from app.utils.pagination import decode_cursor
+from app.utils.timeseries import bucket_label
+from itertools import chain
+import csv
+import io
+import json
+import zlib
 
 diagnostics_bp = Blueprint('diagnostics', __name__)
 
 
-def verify_token():
-    """Helper para verificar token JWT"""
-    token = request.headers.get('Authorization')
-    if not token:
-        return None
-    
-    if token.startswith('Bearer '):
-        token = token[7:]
-
-    try:
-        jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        return True
-    except:
-        return None
-
-
 @diagnostics_bp.route('/diagnostics', methods=['GET'])
+@conditional.etag
 def get_diagnostics():
     """
     Endpoint de paginação
@@ -32,42 +28,63 @@ def get_diagnostics():
     Query Params:
         - page (int): Número da página (default: 1)
         - limit (int): Itens por página (default: 10, max: 100)
-        - city (str): Filtro por cidade (opcional)
-        - state (str): Filtro por estado (opcional)
+        - cursor (str): Cursor opaco retornado em next_cursor/prev_cursor (opcional)
+        - pagination (str): 'offset' ou 'cursor' (default: 'cursor' se houver cursor, senão 'offset')
+        - count (str): Total de registros - 'exact', 'estimate' ou 'none' (default: 'exact')
+        - city (str): Filtro por cidade, 'salv', 'eq:Salvador' ou 'in:Salvador,Recife' (opcional)
+        - state (str): Filtro por estado, nos mesmos formatos de city (opcional)
+        - device_id (str): Filtro por dispositivo, 'DEV001' ou 'in:DEV001,DEV002' (opcional)
+        - latency_ms, packet_loss, quality_of_service (str): Faixas numéricas, 'eq:',
+          'gt:', 'gte:', 'lt:', 'lte:' ou 'between:mínimo,máximo' (ex.: 'gt:60'; opcional)
         - start_date (str): Filtro por data inicial (formato: YYYY-MM-DD)
         - end_date (str): Filtro por data final (formato: YYYY-MM-DD)
+        - format (str): 'records' (lista de objetos) ou 'columnar' (um array por campo) (default: 'records')
     
     """
-    if not verify_token():
-        return {'message': 'Unauthorized'}, 401
-    
     try:
         page = request.args.get('page', 1, type=int)
         limit = request.args.get('limit', 10, type=int)
-        city = request.args.get('city')
-        state = request.args.get('state')
+        cursor = request.args.get('cursor')
+        mode = request.args.get('pagination', 'cursor' if cursor else 'offset')
+        count = request.args.get('count', 'exact')
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
+        response_format = request.args.get('format', 'records')
         
         page, limit = RequestValidator.validate_pagination_params(page, limit)
-        city, state = RequestValidator.validate_filter_params(city, state)
+        filters = RequestValidator.validate_filters(request.args)
+        start_date, end_date = RequestValidator.validate_date_params(start_date, end_date)
+        count = RequestValidator.validate_count_mode(count)
+        response_format = RequestValidator.validate_response_format(response_format)
+        
+        if mode == 'cursor':
+            return _get_diagnostics_by_cursor(limit, cursor, count, filters, start_date, end_date, response_format)
+        
+        if mode != 'offset':
+            raise ValidationError("O parâmetro 'pagination' deve ser um dos seguintes: offset, cursor")
         
         data, total = DiagnosticsService.get_diagnostics_paginated(
             page=page,
             limit=limit,
-            city=city,
-            state=state,
+            filters=filters,
             start_date=start_date,
-            end_date=end_date
+            end_date=end_date,
+            count=count
         )
         
-        total_pages = (total + limit - 1) // limit if total > 0 else 0
+        if total is None:
+            has_next = len(data) > limit
+            data = data[:limit]
+            total_pages = None
+        else:
+            total_pages = (total + limit - 1) // limit if total > 0 else 0
+            has_next = page < total_pages
         
         qs = request.args.to_dict()
         next_url = None
         prev_url = None
         
-        if page < total_pages:
+        if has_next:
             qs['page'] = page + 1
             next_url = url_for('diagnostics.get_diagnostics', _external=True, **qs)
         
@@ -76,13 +93,13 @@ def get_diagnostics():
             prev_url = url_for('diagnostics.get_diagnostics', _external=True, **qs)
         
         return {
-            'data': data,
+            'data': to_columnar(data) if response_format == 'columnar' else data,
             'pagination': {
                 'total': total,
                 'page': page,
                 'limit': limit,
                 'total_pages': total_pages,
-                'has_next': page < total_pages,
+                'has_next': has_next,
                 'has_prev': page > 1,
                 'next_url': next_url,
                 'prev_url': prev_url
@@ -97,7 +114,46 @@ def get_diagnostics():
         return {'error': 'Erro interno do servidor'}, 500
 
 
+def _get_diagnostics_by_cursor(limit, cursor, count, filters, start_date, end_date, response_format):
+    """Resposta da paginação por cursor (keyset) do endpoint /diagnostics"""
+    data, cursors = DiagnosticsService.get_diagnostics_by_cursor(
+        limit=limit,
+        cursor=decode_cursor(cursor),
+        filters=filters,
+        start_date=start_date,
+        end_date=end_date
+    )
+    
+    total = DiagnosticsService.count_diagnostics(
+        count=count,
+        filters=filters,
+        start_date=start_date,
+        end_date=end_date
+    )
+    
+    return {
+        'data': to_columnar(data) if response_format == 'columnar' else data,
+        'pagination': {
+            'total': total,
+            'count': count,
+            'limit': limit,
+            'has_next': cursors['has_next'],
+            'has_prev': cursors['has_prev'],
+            'next_cursor': cursors['next_cursor'],
+            'prev_cursor': cursors['prev_cursor']
+        }
+    }, 200
+
+
+def _echo_filters(filters):
+    """Filtros aplicados, como informados: city e state sempre, os demais campos se presentes"""
+    echo = {'city': None, 'state': None}
+    echo.update((field, request.args[field].strip()) for field, _, _ in filters)
+    return echo
+
+
 @diagnostics_bp.route('diagnostics/<int:id>', methods=['GET'])
+@conditional.etag
 def get_diagnostic(id):
     """
     Buscar diagnóstico por ID
@@ -106,9 +162,6 @@ def get_diagnostic(id):
         id (int): ID do diagnóstico
     
     """
-    if not verify_token():
-        return {'message': 'Unauthorized'}, 401
-    
     try:
         data = DiagnosticsService.get_diagnostic_by_id(id)
         
@@ -123,47 +176,93 @@ def get_diagnostic(id):
 
 
 @diagnostics_bp.route('diagnostics/aggregate', methods=['GET'])
+@conditional.etag
 def get_aggregated():
     """
     Endpoint de agregação
     
-    Retorna dados agregados por critério (dia, cidade ou estado)
+    Retorna dados agregados por critério (dia, cidade ou estado) ou, com
+    bucket, a série de buckets de tempo com no máximo max_points pontos
     
     Query Params:
         - group_by (str): Critério de agrupamento - 'day', 'city' ou 'state' (default: 'day')
-        - city (str): Filtro por cidade (opcional)
-        - state (str): Filtro por estado (opcional)
+        - bucket (str): Buckets de tempo - '5m', '15m', '1h', '1d' ou '1w' (opcional,
+          não combina com group_by nem percentiles)
+        - max_points (int): Pontos máximos da série de buckets (default: AGGREGATE_MAX_POINTS, max: 10000)
+        - downsample (str): Redução da série acima de max_points - 'merge' (bucket
+          mais largo), 'lttb' ou 'minmax' (default: 'merge')
+        - city (str): Filtro por cidade, 'salv', 'eq:Salvador' ou 'in:Salvador,Recife' (opcional)
+        - state (str): Filtro por estado, nos mesmos formatos de city (opcional)
+        - device_id (str): Filtro por dispositivo, 'DEV001' ou 'in:DEV001,DEV002' (opcional)
+        - latency_ms, packet_loss, quality_of_service (str): Faixas numéricas, 'eq:',
+          'gt:', 'gte:', 'lt:', 'lte:' ou 'between:mínimo,máximo' (ex.: 'gt:60'; opcional)
         - start_date (str): Filtro por data inicial (formato: YYYY-MM-DD)
         - end_date (str): Filtro por data final (formato: YYYY-MM-DD)
+        - percentiles (str): Percentis de latency_ms, packet_loss e quality_of_service
+          por grupo, separados por vírgula (ex.: '50,95,99'; opcional)
+        - exact (bool): Percentis exatos a partir das linhas brutas, em vez dos
+          t-digests (default: false)
+        - format (str): 'records' (lista de objetos) ou 'columnar' (um array por campo) (default: 'records')
     """
-    if not verify_token():
-        return {'message': 'Unauthorized'}, 401
-
     try:
         group_by = request.args.get('group_by', 'day')
-        city = request.args.get('city')
-        state = request.args.get('state')
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
+        percentiles = request.args.get('percentiles')
+        exact = request.args.get('exact', 'false')
+        response_format = request.args.get('format', 'records')
+        bucket = request.args.get('bucket')
         
         group_by = RequestValidator.validate_group_by(group_by)
-        city, state = RequestValidator.validate_filter_params(city, state)
+        filters = RequestValidator.validate_filters(request.args)
+        start_date, end_date = RequestValidator.validate_date_params(start_date, end_date)
+        percentiles = RequestValidator.validate_percentiles(percentiles)
+        exact = RequestValidator.validate_boolean(exact, 'exact')
+        response_format = RequestValidator.validate_response_format(response_format)
+        
+        if bucket is not None:
+            if 'group_by' in request.args or percentiles:
+                raise ValidationError("O parâmetro 'bucket' não pode ser combinado com 'group_by' ou 'percentiles'")
+            
+            max_points = request.args.get('max_points', current_app.config['AGGREGATE_MAX_POINTS'], type=int)
+            downsample = request.args.get('downsample', 'merge')
+            
+            bucket = RequestValidator.validate_bucket(bucket)
+            max_points = RequestValidator.validate_max_points(max_points)
+            downsample = RequestValidator.validate_downsample(downsample)
+            
+            series = DiagnosticsService.get_time_buckets(
+                bucket=bucket,
+                max_points=max_points,
+                downsample=downsample,
+                filters=filters,
+                start_date=start_date,
+                end_date=end_date
+            )
+            
+            return {
+                'data': to_columnar(series['data']) if response_format == 'columnar' else series['data'],
+                'bucket': bucket_label(series['bucket']),
+                'bucket_seconds': series['bucket'],
+                'max_points': max_points,
+                'downsample': downsample,
+                'downsampled': series['downsampled'],
+                'filters': _echo_filters(filters)
+            }, 200
         
         data = DiagnosticsService.get_aggregated_by_day(
-            city=city,
-            state=state,
+            filters=filters,
             group_by=group_by,
             start_date=start_date,
-            end_date=end_date
+            end_date=end_date,
+            percentiles=percentiles,
+            exact=exact
         )
         
         return {
-            'data': data,
+            'data': to_columnar(data) if response_format == 'columnar' else data,
             'group_by': group_by,
-            'filters': {
-                'city': city,
-                'state': state
-            }
+            'filters': _echo_filters(filters)
         }, 200
     
     except ValidationError as e:
@@ -175,6 +274,7 @@ def get_aggregated():
 
 
 @diagnostics_bp.route('diagnostics/statistics', methods=['GET'])
+@conditional.etag
 def get_statistics():
     """
     Endpoint de estatísticas gerais
@@ -182,36 +282,37 @@ def get_statistics():
     Retorna estatísticas agregadas dos diagnósticos
     
     Query Params:
-        - city (str): Filtro por cidade (opcional)
-        - state (str): Filtro por estado (opcional)
+        - city (str): Filtro por cidade, 'salv', 'eq:Salvador' ou 'in:Salvador,Recife' (opcional)
+        - state (str): Filtro por estado, nos mesmos formatos de city (opcional)
+        - device_id (str): Filtro por dispositivo, 'DEV001' ou 'in:DEV001,DEV002' (opcional)
+        - latency_ms, packet_loss, quality_of_service (str): Faixas numéricas, 'eq:',
+          'gt:', 'gte:', 'lt:', 'lte:' ou 'between:mínimo,máximo' (ex.: 'gt:60'; opcional)
         - start_date (str): Filtro por data inicial (formato: YYYY-MM-DD)
         - end_date (str): Filtro por data final (formato: YYYY-MM-DD)
+        - distinct (str): Dispositivos distintos - 'approx' (HyperLogLog, erro padrão
+          de ~1,6%) ou 'exact' (COUNT DISTINCT) (default: 'approx')
     
     """
-    if not verify_token():
-        return {'message': 'Unauthorized'}, 401
-
     try:
-        city = request.args.get('city')
-        state = request.args.get('state')
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
+        distinct = request.args.get('distinct', 'approx')
         
-        city, state = RequestValidator.validate_filter_params(city, state)
+        filters = RequestValidator.validate_filters(request.args)
+        start_date, end_date = RequestValidator.validate_date_params(start_date, end_date)
+        distinct = RequestValidator.validate_distinct_mode(distinct)
         
         stats = DiagnosticsService.get_statistics(
-            city=city,
-            state=state,
+            filters=filters,
             start_date=start_date,
-            end_date=end_date
+            end_date=end_date,
+            distinct=distinct
         )
         
         return {
             'data': stats,
-            'filters': {
-                'city': city,
-                'state': state
-            }
+            'distinct': distinct,
+            'filters': _echo_filters(filters)
         }, 200
     
     except ValidationError as e:
@@ -220,3 +321,340 @@ def get_statistics():
     except Exception as e:
         current_app.logger.error(f'Erro ao buscar estatísticas: {str(e)}')
         return {'error': 'Erro interno do servidor'}, 500
+
+
+@diagnostics_bp.route('diagnostics/dashboard', methods=['GET'])
+@conditional.etag
+def get_dashboard():
+    """
+    Endpoint do dashboard
+    
+    Retorna estatísticas, agregações e a primeira página de diagnósticos numa
+    única resposta, calculadas na mesma transação de leitura (coerentes entre
+    si) e com uma só passada sobre os dados filtrados
+    
+    Query Params:
+        - city (str): Filtro por cidade, 'salv', 'eq:Salvador' ou 'in:Salvador,Recife' (opcional)
+        - state (str): Filtro por estado, nos mesmos formatos de city (opcional)
+        - device_id (str): Filtro por dispositivo, 'DEV001' ou 'in:DEV001,DEV002' (opcional)
+        - latency_ms, packet_loss, quality_of_service (str): Faixas numéricas, 'eq:',
+          'gt:', 'gte:', 'lt:', 'lte:' ou 'between:mínimo,máximo' (ex.: 'gt:60'; opcional)
+        - start_date (str): Filtro por data inicial (formato: YYYY-MM-DD)
+        - end_date (str): Filtro por data final (formato: YYYY-MM-DD)
+        - group_by (str): Agregações incluídas, separadas por vírgula - 'day',
+          'city' e/ou 'state' (default: 'day')
+        - limit (int): Itens da primeira página (default: 10, max: 100)
+        - distinct (str): Dispositivos distintos - 'approx' ou 'exact' (default: 'approx')
+        - format (str): 'records' (lista de objetos) ou 'columnar' (um array por campo) (default: 'records')
+    
+    """
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        group_by = request.args.get('group_by', 'day')
+        limit = request.args.get('limit', 10, type=int)
+        distinct = request.args.get('distinct', 'approx')
+        response_format = request.args.get('format', 'records')
+        
+        filters = RequestValidator.validate_filters(request.args)
+        start_date, end_date = RequestValidator.validate_date_params(start_date, end_date)
+        group_by = RequestValidator.validate_group_by_list(group_by)
+        _, limit = RequestValidator.validate_pagination_params(1, limit)
+        distinct = RequestValidator.validate_distinct_mode(distinct)
+        response_format = RequestValidator.validate_response_format(response_format)
+        
+        dashboard = DiagnosticsService.get_dashboard(
+            filters=filters,
+            start_date=start_date,
+            end_date=end_date,
+            group_by=group_by,
+            limit=limit,
+            distinct=distinct
+        )
+        
+        total = dashboard['statistics']['total_diagnostics']
+        total_pages = (total + limit - 1) // limit if total > 0 else 0
+        
+        next_url = None
+        if total_pages > 1:
+            qs = {key: value for key, value in request.args.items() if key in FILTER_FIELDS or key in ('start_date', 'end_date')}
+            next_url = url_for('diagnostics.get_diagnostics', _external=True, page=2, limit=limit, **qs)
+        
+        if response_format == 'columnar':
+            dashboard = {
+                'statistics': dashboard['statistics'],
+                'aggregates': {kind: to_columnar(rows) for kind, rows in dashboard['aggregates'].items()},
+                'diagnostics': to_columnar(dashboard['diagnostics'])
+            }
+        
+        return {
+            'data': dashboard,
+            'pagination': {
+                'total': total,
+                'page': 1,
+                'limit': limit,
+                'total_pages': total_pages,
+                'has_next': total_pages > 1,
+                'has_prev': False,
+                'next_url': next_url,
+                'prev_url': None
+            },
+            'group_by': list(group_by),
+            'distinct': distinct,
+            'filters': _echo_filters(filters)
+        }, 200
+    
+    except ValidationError as e:
+        return {'error': str(e)}, 400
+    
+    except Exception as e:
+        current_app.logger.error(f'Erro ao montar o dashboard: {str(e)}')
+        return {'error': 'Erro interno do servidor'}, 500
+
+
+@diagnostics_bp.route('diagnostics/anomalies', methods=['GET'])
+@conditional.etag
+def get_anomalies():
+    """
+    Endpoint de anomalias
+    
+    Retorna os dispositivos e as localidades cuja última leitura mais se
+    afasta da própria média móvel (EWMA), do maior |z| para o menor, pelas
+    médias gravadas e pelas linhas ainda não incorporadas (sem ler o histórico)
+    
+    Query Params:
+        - scope (str): 'device', 'location' ou 'all' (default: 'all')
+        - min_z (float): |z| mínimo em alguma métrica (default: ANOMALY_MIN_Z)
+        - min_samples (int): Leituras mínimas do grupo (default: ANOMALY_MIN_SAMPLES)
+        - limit (int): Quantidade máxima de grupos (default: 20, max: 100)
+    """
+    try:
+        scope = request.args.get('scope', 'all')
+        min_z = request.args.get('min_z', current_app.config['ANOMALY_MIN_Z'], type=float)
+        min_samples = request.args.get('min_samples', current_app.config['ANOMALY_MIN_SAMPLES'], type=int)
+        limit = request.args.get('limit', 20, type=int)
+        
+        scope, min_z, min_samples, limit = RequestValidator.validate_anomaly_params(scope, min_z, min_samples, limit)
+        
+        result = AnomalyService.get_anomalies(
+            scope=scope,
+            min_z=min_z,
+            min_samples=min_samples,
+            limit=limit
+        )
+        
+        return dict(
+            result,
+            scope=scope,
+            min_z=min_z,
+            min_samples=min_samples
+        ), 200
+    
+    except ValidationError as e:
+        return {'error': str(e)}, 400
+    
+    except Exception as e:
+        current_app.logger.error(f'Erro ao buscar anomalias: {str(e)}')
+        return {'error': 'Erro interno do servidor'}, 500
+
+
+@diagnostics_bp.route('diagnostics/export', methods=['GET'])
+@conditional.etag
+def export_diagnostics():
+    """
+    Endpoint de exportação
+    
+    Transmite todos os diagnósticos filtrados, sem paginação, lendo o banco
+    em blocos de EXPORT_CHUNK_SIZE linhas; o uso de memória não depende da
+    quantidade exportada.
+    
+    Query Params:
+        - format (str): 'ndjson' ou 'csv' (default: 'ndjson')
+        - compress (str): 'gzip' ou 'none' (default: 'none')
+        - city (str): Filtro por cidade, 'salv', 'eq:Salvador' ou 'in:Salvador,Recife' (opcional)
+        - state (str): Filtro por estado, nos mesmos formatos de city (opcional)
+        - device_id (str): Filtro por dispositivo, 'DEV001' ou 'in:DEV001,DEV002' (opcional)
+        - latency_ms, packet_loss, quality_of_service (str): Faixas numéricas, 'eq:',
+          'gt:', 'gte:', 'lt:', 'lte:' ou 'between:mínimo,máximo' (ex.: 'gt:60'; opcional)
+        - start_date (str): Filtro por data inicial (formato: YYYY-MM-DD)
+        - end_date (str): Filtro por data final (formato: YYYY-MM-DD)
+    
+    """
+    try:
+        export_format = request.args.get('format', 'ndjson')
+        compress = request.args.get('compress', 'none')
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        
+        export_format, compress = RequestValidator.validate_export_params(export_format, compress)
+        filters = RequestValidator.validate_filters(request.args)
+        start_date, end_date = RequestValidator.validate_date_params(start_date, end_date)
+        
+        chunks = DiagnosticsService.iter_diagnostics(
+            chunk_size=current_app.config['EXPORT_CHUNK_SIZE'],
+            filters=filters,
+            start_date=start_date,
+            end_date=end_date
+        )
+        
+        # O primeiro bloco é lido antes de responder, para que falhas na
+        # consulta ainda resultem em 500 e não num arquivo truncado
+        chunks = chain([next(chunks, [])], chunks)
+    
+    except ValidationError as e:
+        return {'error': str(e)}, 400
+    
+    except Exception as e:
+        current_app.logger.error(f'Erro ao exportar diagnósticos: {str(e)}')
+        return {'error': 'Erro interno do servidor'}, 500
+    
+    if export_format == 'csv':
+        body = _encode_csv(chunks)
+    else:
+        body = _encode_ndjson(chunks)
+    
+    if compress == 'gzip':
+        body = _gzip(body)
+    
+    response = Response(stream_with_context(_log_export_errors(body)), mimetype=EXPORT_MIMETYPES[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename=diagnostics.{export_format}'
+    
+    if compress == 'gzip':
+        response.headers['Content-Encoding'] = 'gzip'
+    
+    return response
+
+
+EXPORT_COLUMNS = ('id', 'device_id', 'city', 'state', 'latency_ms', 'packet_loss', 'quality_of_service', 'date')
+
+EXPORT_MIMETYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def _encode_ndjson(chunks):
+    """Serializa cada bloco de diagnósticos como linhas JSON"""
+    for rows in chunks:
+        if rows:
+            yield ''.join(json.dumps(row) + '\n' for row in rows).encode('utf-8')
+
+
+def _encode_csv(chunks):
+    """Serializa os blocos de diagnósticos em CSV, com linha de cabeçalho"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    
+    for rows in chunks:
+        writer.writerows([row[column] for column in EXPORT_COLUMNS] for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _gzip(body):
+    """Comprime um corpo em streaming no formato gzip"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    
+    for block in body:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    
+    yield compressor.flush()
+
+
+def _log_export_errors(body):
+    """Registra falhas ocorridas depois que a resposta já começou a ser enviada"""
+    try:
+        yield from body
+    except Exception as e:
+        current_app.logger.error(f'Erro ao exportar diagnósticos: {str(e)}')
+        raise
+
+
+@diagnostics_bp.route('diagnostics/batch', methods=['POST'])
+def create_diagnostics_batch():
+    """
+    Endpoint de ingestão em lote
+    
+    Aceita um array JSON (application/json) ou um diagnóstico por linha
+    (application/x-ndjson, lido em streaming). Todas as linhas válidas são
+    gravadas numa única transação; as inválidas são listadas em 'errors'.
+    
+    Query Params:
+        - chunk_size (int): Linhas por bloco de validação/executemany (default: INGEST_CHUNK_SIZE)
+    
+    """
+    try:
+        chunk_size = request.args.get('chunk_size', current_app.config['INGEST_CHUNK_SIZE'], type=int)
+        chunk_size = RequestValidator.validate_chunk_size(chunk_size)
+        
+        if request.mimetype in NDJSON_MIMETYPES:
+            rows = _read_ndjson(request.stream)
+        else:
+            rows = request.get_json(silent=True)
+            if not isinstance(rows, list):
+                raise ValidationError('O corpo deve ser um array JSON ou NDJSON')
+        
+        result = IngestService.ingest(rows, chunk_size)
+        
+        if result['received'] == 0:
+            raise ValidationError('O lote não contém diagnósticos')
+        
+        return {'data': result}, 201 if result['inserted'] else 400
+    
+    except ValidationError as e:
+        return {'error': str(e)}, 400
+    
+    except Exception as e:
+        current_app.logger.error(f'Erro ao gravar lote de diagnósticos: {str(e)}')
+        return {'error': 'Erro interno do servidor'}, 500
+
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+def _read_ndjson(stream, block_size=1 << 16):
+    """Decodifica um corpo NDJSON em blocos; linhas malformadas viram None"""
+    loads = current_app.json.loads
+    pending = b''
+    
+    while True:
+        block = stream.read(block_size)
+        lines = (pending + block).split(b'\n')
+        pending = lines.pop() if block else b''
+        
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            
+            try:
+                yield loads(line)
+            except ValueError:
+                yield None
+        
+        if not block:
+            return
+
+
+@diagnostics_bp.route('diagnostics/cache', methods=['GET'])
+def get_cache_stats():
+    """
+    Estatísticas do cache de leituras
+    
+    Retorna acertos, falhas, remoções por LRU/TTL e entradas do processo atual,
+    do cache de leituras e do cache de planos de filtro (filter_plans), e as
+    leituras coalescidas pelo single-flight (single_flight)
+    """
+    return {'data': cache.stats(), 'filter_plans': filter_compiler.stats(), 'single_flight': single_flight.stats()}, 200
+
+
+@diagnostics_bp.route('diagnostics/database', methods=['GET'])
+def get_database_stats():
+    """
+    Estatísticas dos pools de conexões
+    
+    Retorna, por pool (principal, leitura), conexões em uso, pico, tempo médio
+    de uso e os PRAGMAs efetivos de uma conexão
+    """
+    return {'data': database.stats()}, 200
@@ -0,0 +1,41 @@
+from flask import Blueprint, request, current_app
+from app.services.location_service import LocationService
+from app.extensions import conditional
+from app.utils.validators import RequestValidator, ValidationError
+
+locations_bp = Blueprint('locations', __name__)
+
+
+@locations_bp.route('/locations', methods=['GET'])
+@conditional.etag
+def get_locations():
+    """
+    Endpoint de autocompletar localidades
+    
+    Retorna as localidades (id, cidade, estado) cuja cidade ou estado contém
+    o termo, sem diferenciar acentos nem maiúsculas, pelo índice de trigramas
+    da dimensão de localidades
+    
+    Query Params:
+        - q (str): Termo buscado (obrigatório)
+        - limit (int): Quantidade máxima de localidades (default: 10, max: 50)
+    """
+    try:
+        q = request.args.get('q')
+        limit = request.args.get('limit', 10, type=int)
+        
+        q, limit = RequestValidator.validate_location_query(q, limit)
+        
+        data = LocationService.search(q=q, limit=limit)
+        
+        return {
+            'data': data,
+            'q': q
+        }, 200
+    
+    except ValidationError as e:
+        return {'error': str(e)}, 400
+    
+    except Exception as e:
+        current_app.logger.error(f'Erro ao buscar localidades: {str(e)}')
+        return {'error': 'Erro interno do servidor'}, 500
@@ -0,0 +1,123 @@
+from app.database import begin_read_snapshot, read_connection
+from app.extensions import db, cache
+from app.models import anomalies
+from app.models.anomalies import ALPHA, METRICS, MIN_STD, SCOPES, STATE_COLUMNS
+from types import SimpleNamespace
+from typing import Dict, Tuple
+import math
+
+
+class AnomalyService:
+    """Serviço responsável pelo ranking de anomalias (médias móveis por grupo)"""
+
+    @staticmethod
+    def _scope_sql(scope: str) -> str:
+        """Grupos de um escopo acima dos limites, do maior score para o menor (pelo índice de score)"""
+        table, key_columns, _ = SCOPES[scope]
+        keys = {column: 'NULL' for column in ('device_id', 'state', 'city')}
+        keys.update((column, column) for column in key_columns)
+
+        return f"""
+            SELECT * FROM (
+                SELECT '{scope}' as scope, {', '.join(f'{value} as {column}' for column, value in keys.items())},
+                       {', '.join(STATE_COLUMNS)}
+                FROM {table}
+                WHERE score >= :min_z AND samples >= :min_samples
+                ORDER BY score DESC
+                LIMIT :limit
+            )
+        """
+
+    @staticmethod
+    def _row_key(row) -> Tuple:
+        return (row.device_id,) if row.scope == 'device' else (row.state, row.city)
+
+    @staticmethod
+    def _group_row(scope: str, key: Tuple, group) -> SimpleNamespace:
+        """Grupo calculado em memória (anomalies.pending) no formato das linhas de _scope_sql"""
+        _, key_columns, _ = SCOPES[scope]
+        keys = dict.fromkeys(('device_id', 'state', 'city'))
+        keys.update(zip(key_columns, key))
+        return SimpleNamespace(scope=scope, **keys, **dict(zip(STATE_COLUMNS, group.to_row())))
+
+    @staticmethod
+    def _row_to_dict(row) -> Dict:
+        """Grupo das tabelas EWMA: z = (value - mean) / std, a referência da última leitura"""
+        item = {'scope': row.scope}
+
+        if row.scope == 'device':
+            item['device_id'] = row.device_id
+        else:
+            item['city'] = row.city
+            item['state'] = row.state
+
+        item.update(
+            score=round(row.score, 2),
+            samples=row.samples,
+            last_id=row.last_id,
+            last_date=row.last_date,
+            metrics={
+                metric: {
+                    'value': round(getattr(row, f'{metric}_last'), 2),
+                    'mean': round(getattr(row, f'{metric}_mean'), 2),
+                    # Desvio efetivo do z, com o mínimo da métrica
+                    'std': round(max(math.sqrt(getattr(row, f'{metric}_var')), min_std), 2),
+                    'z': round(getattr(row, f'{metric}_z'), 2),
+                }
+                for metric, min_std in zip(METRICS, MIN_STD)
+            },
+        )
+        return item
+
+    @staticmethod
+    @cache.memoize('anomalies')
+    def get_anomalies(scope: str = 'all', min_z: float = 3.0, min_samples: int = 20, limit: int = 20) -> Dict:
+        """
+        Grupos cuja última leitura mais se afasta da média móvel, por |z|
+
+        Lê as tabelas de médias móveis (app.models.anomalies): cada escopo
+        percorre o índice de score do maior para o menor, sem ler o histórico
+        de diagnósticos. A gravação em lote atualiza as médias depois do
+        commit; até lá, os grupos alterados pelas linhas ainda não
+        incorporadas são calculados em memória e ocupam no ranking o lugar
+        dos gravados, então a resposta não depende de a atualização já ter
+        rodado.
+
+        Args:
+            scope: 'device', 'location' ou 'all' (os dois, num único ranking)
+            min_z: |z| mínimo da última leitura em alguma métrica
+            min_samples: Leituras mínimas do grupo (as primeiras ainda formam a média)
+            limit: Quantidade máxima de grupos
+        """
+        scopes = list(SCOPES) if scope == 'all' else [scope]
+
+        begin_read_snapshot(db.session)
+        cursor = read_connection(db.session).connection.cursor()
+        try:
+            pending, last_id = anomalies.pending(cursor)
+        finally:
+            cursor.close()
+
+        # Cada grupo pendente pode tirar do ranking gravado um dos limit primeiros
+        replaced = sum(len(pending[item]) for item in scopes)
+        params = {'min_z': min_z, 'min_samples': min_samples, 'limit': limit + replaced}
+
+        sql = " UNION ALL ".join(AnomalyService._scope_sql(item) for item in scopes)
+        rows = db.session.execute(db.text(sql + " ORDER BY score DESC LIMIT :limit"), params).fetchall()
+
+        if replaced:
+            rows = [row for row in rows if AnomalyService._row_key(row) not in pending[row.scope]]
+            rows.extend(
+                AnomalyService._group_row(item, key, group)
+                for item in scopes
+                for key, group in pending[item].items()
+                if group.samples >= max(min_samples, 1)
+            )
+            rows = [row for row in rows if row.score >= min_z]
+            rows.sort(key=lambda row: row.score, reverse=True)
+
+        return {
+            'data': [AnomalyService._row_to_dict(row) for row in rows[:limit]],
+            'alpha': ALPHA,
+            'last_id': last_id,
+        }
@@ -0,0 +1,331 @@
+"""
+Cache das leituras do DiagnosticsService
+
+Backends disponíveis (Config.CACHE_BACKEND):
+    - 'memory': LRU + TTL em memória, por processo
+    - 'sqlite': arquivo SQLite compartilhado entre os workers
+    - 'none': desabilitado
+"""
+import functools
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from flask import current_app, g, has_app_context
+
+from app.models.locations import fold
+from app.services.metrics import query_namespace
+
+
+# Parâmetros buscados pela chave da dimensão de localidades: a chave de cache
+# ignora espaços nas bordas, acentos e maiúsculas, como a busca
+CASE_INSENSITIVE_PARAMS = ('city', 'state', 'q')
+
+
+def build_key(namespace: str, params: Dict[str, Any]) -> str:
+    """
+    Monta a chave de cache a partir dos parâmetros normalizados
+
+    Args:
+        namespace: Nome da consulta (ex.: 'statistics')
+        params: Argumentos da consulta
+    """
+    normalized = {}
+
+    for name, value in params.items():
+        if isinstance(value, str):
+            value = value.strip()
+            if name in CASE_INSENSITIVE_PARAMS:
+                value = fold(value)
+            if value == '':
+                value = None
+
+        if value is not None:
+            normalized[name] = value
+
+    return namespace + ':' + json.dumps(normalized, sort_keys=True, separators=(',', ':'), default=str)
+
+
+class CacheBackend:
+    """Interface comum dos backends de cache"""
+
+    name = 'base'
+
+    def __init__(self):
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+        self._counters_lock = threading.Lock()
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._counters_lock:
+            self._counters[counter] += amount
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def after_fork(self) -> None:
+        """Descarta no processo filho os recursos herdados do pai (padrão: nenhum)"""
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        """Retorna os contadores do processo atual e o total de entradas"""
+        with self._counters_lock:
+            counters = dict(self._counters)
+
+        lookups = counters['hits'] + counters['misses']
+        counters['hit_ratio'] = round(counters['hits'] / lookups, 4) if lookups else 0.0
+        counters['entries'] = len(self)
+        counters['backend'] = self.name
+        return counters
+
+
+class NullCache(CacheBackend):
+    """Backend que não armazena nada (cache desabilitado)"""
+
+    name = 'none'
+
+    def get(self, key):
+        self._count('misses')
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class MemoryCache(CacheBackend):
+    """LRU com expiração por TTL, local ao processo"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries: int = 1024):
+        super().__init__()
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+                self._count('expirations')
+
+            if entry is None:
+                self._count('misses')
+                return None
+
+            self._entries.move_to_end(key)
+
+        self._count('hits')
+        return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._count('evictions')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache em arquivo SQLite compartilhado entre processos
+
+    Os valores são serializados em JSON. A ordem LRU é mantida pela coluna
+    accessed_at, atualizada a cada leitura.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path: str, max_entries: int = 1024):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed ON cache_entries (accessed_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)).fetchone()
+
+        if row is not None and row[1] <= now:
+            conn.execute("DELETE FROM cache_entries WHERE key = ? AND expires_at <= ?", (key, now))
+            row = None
+            self._count('expirations')
+
+        if row is None:
+            self._count('misses')
+            return None
+
+        conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count('hits')
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, default=str), now + ttl, now)
+        )
+
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE key IN "
+                "(SELECT key FROM cache_entries ORDER BY accessed_at LIMIT ?)",
+                (excess,)
+            )
+            self._count('evictions', excess)
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache_entries")
+
+    def after_fork(self):
+        # A conexão da thread que fez o fork não pode ser usada pelo filho
+        self._local = threading.local()
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+
+
+class ResponseCache:
+    """Extensão Flask que escolhe o backend de cache a partir do Config"""
+
+    def __init__(self, app=None):
+        self.backend: CacheBackend = NullCache()
+        self.ttl = 30
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        backend = app.config.get('CACHE_BACKEND', 'memory')
+        max_entries = app.config.get('CACHE_MAX_ENTRIES', 1024)
+        self.ttl = app.config.get('CACHE_TTL', 30)
+
+        if backend == 'memory':
+            self.backend = MemoryCache(max_entries)
+        elif backend == 'sqlite':
+            path = app.config.get('CACHE_SQLITE_PATH') or os.path.join(app.instance_path, 'cache.db')
+            self.backend = SQLiteCache(path, max_entries)
+        elif backend == 'none':
+            self.backend = NullCache()
+        else:
+            raise ValueError(f"Backend de cache inválido: {backend}")
+
+        app.extensions['response_cache'] = self
+
+    def invalidate(self) -> None:
+        """Descarta todas as entradas (chamado após gravar diagnósticos)"""
+        self.backend.clear()
+        self.backend._count('invalidations')
+
+    def stats(self) -> Dict:
+        return self.backend.stats()
+
+    def after_fork(self) -> None:
+        """Chamado em cada worker criado por fork (gunicorn com preload_app)"""
+        self.backend.after_fork()
+
+    def memoize(self, namespace: str) -> Callable:
+        """
+        Decorator que guarda o retorno da função sob a chave dos seus argumentos
+        (e da versão dos dados, quando a requisição já a conhece)
+
+        Nas falhas de cache, as chamadas simultâneas com a mesma chave são
+        coalescidas pelo SingleFlight (app.services.single_flight).
+
+        Args:
+            namespace: Prefixo da chave, um por consulta
+        """
+        def decorator(func):
+            signature = inspect.signature(func)
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                key = build_key(namespace, bound.arguments)
+
+                # Versão dos dados já lida pelo GET condicional: entradas de
+                # versões anteriores deixam de ser encontradas
+                if has_app_context() and g.get('data_version') is not None:
+                    key += '@{}.{}'.format(*g.data_version)
+
+                value = self.backend.get(key)
+                if value is not None:
+                    return value
+
+                def compute():
+                    with query_namespace(namespace):
+                        result = func(*args, **kwargs)
+                    if result is not None:
+                        self.backend.set(key, result, self.ttl)
+                    return result
+
+                # Falhas simultâneas da mesma chave esperam uma só execução
+                flights = current_app.extensions.get('single_flight') if has_app_context() else None
+                if flights is None:
+                    return compute()
+
+                return flights.do(namespace, key, compute, recheck=lambda: self.backend.get(key))
+
+            return wrapper
+
+        return decorator
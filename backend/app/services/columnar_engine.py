@@ -0,0 +1,529 @@
+"""
+Motor colunar (NumPy) para as agregações do DiagnosticsService
+
+Quando Config.ANALYTICS_ENGINE = 'columnar', /aggregate e /statistics são
+calculados sobre cópias colunares dos diagnósticos (view diagnostics_all, com
+as partições seladas) em vez de SQL:
+
+    - métricas em float64, datas em int64 (microssegundos desde a época);
+    - city, state e device_id codificados por dicionário (int32), com as
+      entradas em arquivos JSON Lines só acrescentados: meta.json guarda o
+      tamanho de cada um, e cada sincronização grava e lê só as entradas novas;
+    - arquivos em COLUMNAR_PATH lidos com np.memmap, compartilhados pelos
+      processos e acrescentados a partir do último id carregado.
+
+Remoções, alterações e mudanças nas partições (diagnostics_data_version)
+fazem a cópia ser refeita numa nova geração. Filtros viram máscaras e os
+agrupamentos usam bincount e reduceat. O arredondamento final é delegado ao
+ROUND do SQLite para que os valores coincidam com os do caminho SQL.
+
+NumPy é opcional: só é necessário com o motor colunar habilitado.
+"""
+import json
+import operator
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from itertools import chain
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import text
+
+from app.models import locations
+from app.utils.filters import FILTER_FIELDS, Filters
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - dependência opcional
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+# Colunas carregadas: nome -> tipo NumPy
+COLUMNS = {
+    'id': 'int64',
+    'timestamp': 'int64',
+    'latency_ms': 'float64',
+    'packet_loss': 'float64',
+    'quality_of_service': 'float64',
+    'city': 'int32',
+    'state': 'int32',
+    'device_id': 'int32',
+}
+
+# Colunas de texto codificadas por dicionário
+ENCODED_COLUMNS = ('city', 'state', 'device_id')
+
+METRICS = ('latency_ms', 'packet_loss', 'quality_of_service')
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_DAY_US = 86400 * 1000000
+_READ_CHUNK = 50000
+
+# Formato de meta.json: arquivos de outro formato são refeitos numa geração nova
+_META_FORMAT = 2
+
+# Variáveis por consulta de arredondamento no SQLite
+_ROUND_BATCH = 500
+
+# Operadores numéricos dos filtros (app.utils.filters)
+_COMPARISONS = {
+    'eq': operator.eq,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+}
+
+
+def _session():
+    """Sessão do Flask-SQLAlchemy da aplicação atual"""
+    return current_app.extensions['sqlalchemy'].session
+
+
+def _timestamp(value: str) -> int:
+    """Converte a data ISO 8601 gravada em microssegundos desde a época"""
+    return (datetime.fromisoformat(value).replace(tzinfo=None) - _EPOCH) // _MICROSECOND
+
+
+def _day_timestamp(value: str, days: int = 0) -> int:
+    return (date.fromisoformat(value[:10]) - _EPOCH.date() + timedelta(days=days)).days * _DAY_US
+
+
+def _sqlite_round(values: List[Optional[float]]) -> List[Optional[float]]:
+    """Aplica ROUND(valor, 2) do SQLite, que difere de round() em empates"""
+    conn = sqlite3.connect(':memory:')
+    try:
+        rounded = []
+        for start in range(0, len(values), _ROUND_BATCH):
+            batch = values[start:start + _ROUND_BATCH]
+            sql = 'SELECT ' + ', '.join(['ROUND(?, 2)'] * len(batch))
+            rounded.extend(conn.execute(sql, batch).fetchone())
+        return rounded
+    finally:
+        conn.close()
+
+
+class ColumnarEngine:
+    """Extensão Flask com as colunas mapeadas em memória do processo"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.path = None
+        self.database = None
+        self._lock = threading.Lock()
+        self._meta = None
+        self._columns: Dict[str, 'np.ndarray'] = {}
+        self._dictionaries: Dict[str, List[str]] = {}
+        # Códigos das entradas carregadas e (geração, bytes lidos de cada arquivo)
+        self._codes: Dict[str, Dict[str, int]] = {}
+        self._loaded: Optional[Tuple[str, Dict[str, int]]] = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        engine = app.config.get('ANALYTICS_ENGINE', 'sql')
+
+        if engine not in ('sql', 'columnar'):
+            raise ValueError(f"Motor de análise inválido: {engine}")
+
+        self.enabled = engine == 'columnar'
+        self.path = app.config.get('COLUMNAR_PATH') or os.path.join(app.instance_path, 'columnar')
+        self.database = app.config['SQLALCHEMY_DATABASE_URI']
+
+        if self.enabled and np is None:
+            raise RuntimeError("ANALYTICS_ENGINE='columnar' requer o pacote numpy")
+
+        app.extensions['columnar_engine'] = self
+
+    # Sincronização com a tabela diagnostics
+
+    def _data_version(self) -> Tuple[int, int]:
+        row = _session().execute(text("""
+            SELECT
+                (SELECT COALESCE(MAX(id), 0) FROM diagnostics) as max_id,
+                (SELECT changes FROM diagnostics_data_version) as changes
+        """)).fetchone()
+        return row.max_id, row.changes or 0
+
+    def _sync(self) -> None:
+        """Garante que as colunas cobrem a versão atual dos dados"""
+        max_id, changes = self._data_version()
+
+        with self._lock:
+            if self._is_current(self._meta, max_id, changes):
+                return
+
+            os.makedirs(self.path, exist_ok=True)
+
+            with self._file_lock():
+                meta = self._read_meta()
+
+                if meta is None or meta['changes'] != changes:
+                    meta = self._rebuild(changes)
+                elif not self._is_current(meta, max_id, changes):
+                    meta = self._append(meta)
+                else:
+                    self._read_dictionaries(meta)
+
+                self._map(meta)
+
+    @staticmethod
+    def _is_current(meta, max_id: int, changes: int) -> bool:
+        return meta is not None and meta['changes'] == changes and meta['last_id'] >= max_id
+
+    @contextmanager
+    def _file_lock(self):
+        """Serializa a atualização dos arquivos entre processos (fcntl)"""
+        if fcntl is None:
+            yield
+            return
+
+        with open(os.path.join(self.path, '.lock'), 'w') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _read_meta(self) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.path, 'meta.json')) as handle:
+                meta = json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+        # Arquivos de outro banco (ex.: DATABASE_URL alterada) ou de outro formato são refeitos
+        if meta.get('format') != _META_FORMAT or meta.get('database') != self.database:
+            return None
+        if not os.path.isdir(os.path.join(self.path, meta['generation'])):
+            return None
+
+        return meta
+
+    def _write_meta(self, meta: Dict) -> None:
+        temporary = os.path.join(self.path, f'meta.{uuid.uuid4().hex}.tmp')
+        with open(temporary, 'w') as handle:
+            json.dump(meta, handle)
+        os.replace(temporary, os.path.join(self.path, 'meta.json'))
+
+    def _rebuild(self, changes: int) -> Dict:
+        """Recria as colunas numa geração nova e descarta as anteriores"""
+        generation = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.path, generation))
+
+        meta = {
+            'format': _META_FORMAT,
+            'database': self.database,
+            'generation': generation,
+            'rows': 0,
+            'last_id': 0,
+            'changes': changes,
+            # Bytes válidos do arquivo de entradas de cada dicionário
+            'dictionaries': {column: 0 for column in ENCODED_COLUMNS},
+        }
+        meta = self._append(meta)
+
+        for name in os.listdir(self.path):
+            if name != generation and os.path.isdir(os.path.join(self.path, name)):
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+        return meta
+
+    def _add_entries(self, added: Dict[str, List[str]]) -> None:
+        """
+        Acrescenta entradas aos dicionários em memória
+
+        O dicionário de listas é substituído, não alterado: consultas em
+        andamento seguem com o que receberam de _snapshot().
+        """
+        dictionaries = dict(self._dictionaries)
+
+        for column, values in added.items():
+            if values:
+                codes = self._codes[column]
+                for value in values:
+                    codes[value] = len(codes)
+                dictionaries[column] = dictionaries[column] + values
+
+        self._dictionaries = dictionaries
+
+    def _read_dictionaries(self, meta: Dict) -> None:
+        """Carrega as entradas de meta ainda não lidas pelo processo (todas, se a geração mudou)"""
+        if self._loaded is None or self._loaded[0] != meta['generation']:
+            self._dictionaries = {column: [] for column in ENCODED_COLUMNS}
+            self._codes = {column: {} for column in ENCODED_COLUMNS}
+            self._loaded = (meta['generation'], {column: 0 for column in ENCODED_COLUMNS})
+
+        directory = os.path.join(self.path, meta['generation'])
+        sizes = self._loaded[1]
+        added = {}
+
+        for column in ENCODED_COLUMNS:
+            start, end = sizes[column], meta['dictionaries'][column]
+            added[column] = []
+
+            if end > start:
+                with open(os.path.join(directory, f'{column}.jsonl'), 'rb') as handle:
+                    handle.seek(start)
+                    added[column] = [json.loads(line) for line in handle.read(end - start).splitlines()]
+
+        self._add_entries(added)
+        self._loaded = (meta['generation'], dict(meta['dictionaries']))
+
+    def _append(self, meta: Dict) -> Dict:
+        """Acrescenta às colunas as linhas com id maior que meta['last_id']"""
+        self._read_dictionaries(meta)
+
+        directory = os.path.join(self.path, meta['generation'])
+        # Entradas novas desta sincronização, incorporadas às carregadas no final
+        added = {column: [] for column in ENCODED_COLUMNS}
+        new_codes = {column: {} for column in ENCODED_COLUMNS}
+        sizes = dict(meta['dictionaries'])
+        rows = meta['rows']
+        last_id = meta['last_id']
+
+        files = {}
+        for column, dtype in COLUMNS.items():
+            handle = open(os.path.join(directory, f'{column}.bin'), 'ab')
+            # Descarta bytes de uma atualização interrompida
+            handle.truncate(rows * np.dtype(dtype).itemsize)
+            files[column] = handle
+
+        entries = {}
+        for column in ENCODED_COLUMNS:
+            handle = open(os.path.join(directory, f'{column}.jsonl'), 'ab')
+            handle.truncate(sizes[column])
+            entries[column] = handle
+
+        try:
+            result = _session().execute(text(
+                "SELECT id, device_id, city, state, latency_ms, packet_loss, quality_of_service, date"
+                " FROM diagnostics_all WHERE id > :last_id ORDER BY id"
+            ), {'last_id': last_id}, execution_options={'yield_per': _READ_CHUNK})
+
+            for chunk in result.partitions():
+                values = {column: [] for column in COLUMNS}
+
+                for row in chunk:
+                    values['id'].append(row.id)
+                    values['timestamp'].append(_timestamp(row.date))
+                    values['latency_ms'].append(row.latency_ms)
+                    values['packet_loss'].append(row.packet_loss)
+                    values['quality_of_service'].append(row.quality_of_service)
+
+                    for column in ENCODED_COLUMNS:
+                        value = getattr(row, column)
+                        code = self._codes[column].get(value)
+                        if code is None:
+                            code = new_codes[column].get(value)
+                        if code is None:
+                            code = new_codes[column][value] = len(self._codes[column]) + len(added[column])
+                            added[column].append(value)
+                            line = (json.dumps(value) + '\n').encode('utf-8')
+                            entries[column].write(line)
+                            sizes[column] += len(line)
+                        values[column].append(code)
+
+                for column, dtype in COLUMNS.items():
+                    files[column].write(np.asarray(values[column], dtype=dtype).tobytes())
+
+                rows += len(chunk)
+                last_id = chunk[-1].id
+        finally:
+            for handle in chain(files.values(), entries.values()):
+                handle.close()
+
+        meta = dict(meta, rows=rows, last_id=last_id, dictionaries=sizes)
+        self._write_meta(meta)
+
+        self._add_entries(added)
+        self._loaded = (meta['generation'], sizes)
+        return meta
+
+    def _map(self, meta: Dict) -> None:
+        directory = os.path.join(self.path, meta['generation'])
+        columns = {}
+
+        for column, dtype in COLUMNS.items():
+            if meta['rows']:
+                columns[column] = np.memmap(os.path.join(directory, f'{column}.bin'), dtype=dtype, mode='r', shape=(meta['rows'],))
+            else:
+                columns[column] = np.empty(0, dtype=dtype)
+
+        self._columns = columns
+        self._meta = meta
+
+    def load(self) -> None:
+        """Sincroniza e mapeia as colunas já (ex.: no processo mestre, antes do fork dos workers)"""
+        if self.enabled:
+            self._sync()
+
+    # Consultas
+
+    def _mask(self, columns, dictionaries, filters: Filters, start_date: Optional[str], end_date: Optional[str]):
+        """Máscara booleana equivalente a DiagnosticsService._build_filters"""
+        mask = np.ones(len(columns['id']), dtype=bool)
+
+        for column, op, values in filters:
+            # Colunas codificadas: a condição escolhe os códigos do dicionário
+            if FILTER_FIELDS[column] == 'location':
+                matches = locations.matches(op, values)
+                selected = [code for code, entry in enumerate(dictionaries[column]) if matches(entry)]
+                mask &= np.isin(columns[column], np.asarray(selected, dtype=COLUMNS[column]))
+            elif column in ENCODED_COLUMNS:
+                selected = [code for code, entry in enumerate(dictionaries[column]) if entry in values]
+                mask &= np.isin(columns[column], np.asarray(selected, dtype=COLUMNS[column]))
+            elif op == 'between':
+                mask &= (columns[column] >= values[0]) & (columns[column] <= values[1])
+            else:
+                mask &= _COMPARISONS[op](columns[column], values[0])
+
+        if start_date:
+            mask &= columns['timestamp'] >= _day_timestamp(start_date)
+
+        if end_date:
+            mask &= columns['timestamp'] < _day_timestamp(end_date, days=1)
+
+        return mask
+
+    def _snapshot(self):
+        """Sincroniza e retorna (colunas, dicionários) consistentes entre si"""
+        self._sync()
+        with self._lock:
+            return self._columns, self._dictionaries
+
+    @staticmethod
+    def _reduce(groups, selected_columns):
+        """
+        Agrega as métricas por grupo
+
+        Retorna (chaves, contagens, médias por métrica, mínimo e máximo de latency_ms).
+        As somas seguem a ordem dos ids, como a varredura da tabela no SQLite.
+        """
+        keys, inverse = np.unique(groups, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(keys))
+
+        averages = {
+            metric: np.bincount(inverse, weights=selected_columns[metric], minlength=len(keys)) / counts
+            for metric in METRICS
+        }
+
+        order = np.argsort(inverse, kind='stable')
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        latency = selected_columns['latency_ms'][order]
+
+        return keys, counts, averages, np.minimum.reduceat(latency, starts), np.maximum.reduceat(latency, starts)
+
+    def aggregate(self, group_by: str, filters: Filters = (), start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict]:
+        """Equivalente colunar de DiagnosticsService.get_aggregated_by_day"""
+        columns, dictionaries = self._snapshot()
+        mask = self._mask(columns, dictionaries, filters, start_date, end_date)
+
+        if not mask.any():
+            return []
+
+        selected = {column: np.asarray(columns[column])[mask] for column in ('timestamp', 'city', 'state') + METRICS}
+
+        if group_by == 'day':
+            groups = selected['timestamp'] // _DAY_US
+        elif group_by == 'city':
+            groups = selected['city'].astype('int64') * max(len(dictionaries['state']), 1) + selected['state']
+        else:
+            groups = selected['state']
+
+        keys, counts, averages, minimums, maximums = self._reduce(groups, selected)
+
+        rounded = iter(_sqlite_round(
+            [float(value) for metric in METRICS for value in averages[metric]] +
+            ([float(value) for value in minimums] + [float(value) for value in maximums] if group_by == 'day' else [])
+        ))
+        averages = {metric: [next(rounded) for _ in keys] for metric in METRICS}
+        if group_by == 'day':
+            minimums = [next(rounded) for _ in keys]
+            maximums = [next(rounded) for _ in keys]
+
+        data = []
+        for position, key in enumerate(keys.tolist()):
+            row_dict = {
+                'total': int(counts[position]),
+                'avg_latency_ms': float(averages['latency_ms'][position] or 0),
+                'avg_packet_loss': float(averages['packet_loss'][position] or 0),
+                'avg_quality_of_service': float(averages['quality_of_service'][position] or 0)
+            }
+
+            if group_by == 'day':
+                row_dict['day'] = (_EPOCH.date() + timedelta(days=key)).isoformat()
+                row_dict['min_latency_ms'] = float(minimums[position] or 0)
+                row_dict['max_latency_ms'] = float(maximums[position] or 0)
+            elif group_by == 'city':
+                city_code, state_code = divmod(key, max(len(dictionaries['state']), 1))
+                row_dict['city'] = dictionaries['city'][city_code]
+                row_dict['state'] = dictionaries['state'][state_code]
+            else:
+                row_dict['state'] = dictionaries['state'][key]
+
+            data.append(row_dict)
+
+        if group_by == 'day':
+            data.sort(key=lambda row: row['day'], reverse=True)
+        elif group_by == 'city':
+            data.sort(key=lambda row: (-row['total'], row['city'], row['state']))
+        else:
+            data.sort(key=lambda row: (-row['total'], row['state']))
+
+        return data
+
+    def statistics(self, filters: Filters = (), start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict:
+        """Equivalente colunar de DiagnosticsService.get_statistics (contagens distintas exatas)"""
+        columns, dictionaries = self._snapshot()
+        mask = self._mask(columns, dictionaries, filters, start_date, end_date)
+        total = int(np.count_nonzero(mask))
+
+        if total == 0:
+            return {
+                'total_diagnostics': 0,
+                'total_devices': 0,
+                'total_cities': 0,
+                'total_states': 0,
+                'avg_latency_ms': 0.0,
+                'avg_packet_loss': 0.0,
+                'avg_quality_of_service': 0.0,
+                'first_diagnostic': None,
+                'last_diagnostic': None
+            }
+
+        selected = {column: np.asarray(columns[column])[mask] for column in ('id', 'timestamp') + METRICS}
+        _, _, averages, _, _ = self._reduce(np.zeros(total, dtype='int64'), selected)
+        averages = dict(zip(METRICS, _sqlite_round([float(averages[metric][0]) for metric in METRICS])))
+
+        # As datas são devolvidas como gravadas, lidas pelo id da primeira e da última
+        first_id = int(selected['id'][np.argmin(selected['timestamp'])])
+        last_id = int(selected['id'][np.argmax(selected['timestamp'])])
+        dates = dict(_session().execute(
+            text("SELECT id, date FROM diagnostics_all WHERE id IN (:first_id, :last_id)"),
+            {'first_id': first_id, 'last_id': last_id}
+        ).fetchall())
+
+        return {
+            'total_diagnostics': total,
+            'total_devices': int(np.unique(np.asarray(columns['device_id'])[mask]).size),
+            'total_cities': int(np.unique(np.asarray(columns['city'])[mask]).size),
+            'total_states': int(np.unique(np.asarray(columns['state'])[mask]).size),
+            'avg_latency_ms': float(averages['latency_ms'] or 0),
+            'avg_packet_loss': float(averages['packet_loss'] or 0),
+            'avg_quality_of_service': float(averages['quality_of_service'] or 0),
+            'first_diagnostic': dates.get(first_id),
+            'last_diagnostic': dates.get(last_id)
+        }
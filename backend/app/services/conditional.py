@@ -0,0 +1,96 @@
+"""
+GET condicional (ETag / If-None-Match) nas leituras de diagnósticos
+
+A versão dos dados é o par (MAX(id), diagnostics_data_version.changes):
+inserções só acrescentam ids maiores e remoções/alterações incrementam o
+contador (migração 7). O ETag de uma leitura combina essa versão com o
+endpoint e os parâmetros normalizados como nas chaves do cache; quando o
+If-None-Match da requisição contém o ETag atual, a resposta é 304 sem que a
+view execute a consulta.
+
+A versão é lida logo depois de begin_read_snapshot(): as consultas da view
+enxergam exatamente os dados identificados pelo ETag. Ela também fica em
+g.data_version, que o cache de leituras inclui nas chaves.
+"""
+import functools
+import hashlib
+from typing import Callable, Optional, Tuple
+
+from flask import current_app, g, request
+from sqlalchemy import text
+
+from app.database import begin_read_snapshot
+from app.services.cache import build_key
+
+
+def _session():
+    """Sessão do Flask-SQLAlchemy da aplicação atual"""
+    return current_app.extensions['sqlalchemy'].session
+
+
+class ConditionalRequests:
+    """Extensão Flask: ETag pela versão dos dados, 304 e Cache-Control"""
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.cache_control: Optional[str] = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.enabled = app.config.get('ETAG_ENABLED', True)
+        self.cache_control = app.config.get('HTTP_CACHE_CONTROL') or None
+
+        app.extensions['conditional_requests'] = self
+
+    @staticmethod
+    def data_version() -> Tuple[int, int]:
+        """Versão dos dados na transação de leitura da requisição (lida uma vez)"""
+        version = g.get('data_version')
+
+        if version is None:
+            session = _session()
+            begin_read_snapshot(session)
+            row = session.execute(text("""
+                SELECT
+                    (SELECT COALESCE(MAX(id), 0) FROM diagnostics) as max_id,
+                    (SELECT changes FROM diagnostics_data_version) as changes
+            """)).fetchone()
+            version = g.data_version = (row.max_id, row.changes or 0)
+
+        return version
+
+    @staticmethod
+    def compute_etag(version: Tuple[int, int]) -> str:
+        """ETag (sem aspas) da requisição atual para a versão dos dados"""
+        params = dict(request.view_args or {}, **request.args.to_dict())
+        key = build_key(request.endpoint, params)
+        return hashlib.blake2b(f'{version[0]}.{version[1]}:{key}'.encode('utf-8'), digest_size=12).hexdigest()
+
+    def etag(self, view: Callable) -> Callable:
+        """
+        Decorator de views de leitura: responde 304 quando o cliente já tem a
+        versão atual e marca as respostas 200 com ETag e Cache-Control
+        """
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return view(*args, **kwargs)
+
+            tag = self.compute_etag(self.data_version())
+
+            if request.if_none_match.contains_weak(tag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(tag, weak=True)
+            if self.cache_control:
+                response.headers['Cache-Control'] = self.cache_control
+
+            return response
+
+        return wrapper
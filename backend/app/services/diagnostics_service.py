@@ -1,71 +1,399 @@
-from app.extensions import db
-from typing import Dict, List, Optional, Tuple
+from app.database import begin_read_snapshot
+from app.extensions import db, cache, columnar, filter_compiler
+from app.models.metric_digests import METRICS
+from app.services.cache import MemoryCache, build_key
+from app.services.location_service import LocationService
+from app.utils.hyperloglog import HyperLogLog
+from app.utils.pagination import encode_cursor, CURSOR_NEXT, CURSOR_PREV
+from app.utils.filters import Filters, day_bound, location_filters, only_locations, without
+from app.utils.tdigest import TDigest, exact_quantile
+from app.utils import timeseries
+from flask import current_app
+from types import SimpleNamespace
+from datetime import date, datetime, timedelta, timezone
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Tuple
+import calendar
+
+
+# Totais reutilizados pelo modo count=estimate, por filtros normalizados: LRU
+# limitado a COUNT_ESTIMATE_MAX_ENTRIES entradas de COUNT_ESTIMATE_TTL segundos
+_count_cache = MemoryCache()
+
+# Tabelas opcionais (rollup, sketches) já encontradas: {(URI do banco, tabela)}
+_known_tables = set()
+
+# Campos de um diagnóstico nas respostas, na ordem de DIAGNOSTIC_COLUMNS, que já
+# traz as métricas arredondadas pelo SQLite: as linhas viram dicts sem conversões
+DIAGNOSTIC_FIELDS = ('id', 'device_id', 'city', 'state', 'latency_ms', 'packet_loss', 'quality_of_service', 'date')
+DIAGNOSTIC_COLUMNS = (
+    "id, device_id, city, state, ROUND(latency_ms, 2) as latency_ms, ROUND(packet_loss, 2) as packet_loss,"
+    " ROUND(quality_of_service, 2) as quality_of_service, date"
+)
+
+# Colunas que identificam cada grupo de /aggregate, para associar os percentis
+PERCENTILE_GROUP_KEYS = {'day': ('day',), 'city': ('city', 'state'), 'state': ('state',)}
+
+# Colunas lidas pelos buckets de tempo, todas em idx_diagnostics_epoch
+BUCKET_COLUMNS = "epoch, latency_ms, packet_loss, quality_of_service"
+
+# Colunas das agregações por cidade/estado: o índice de epoch as cobre, então
+# cada partição é lida pelo índice, sem tocar a tabela
+LOCATION_AGGREGATE_COLUMNS = "state, city, latency_ms, packet_loss, quality_of_service"
+
+# Médias ponderadas a partir das somas e contagens do rollup diário
+ROLLUP_AVERAGES_SQL = """
+    SUM(total) as total,
+    ROUND(SUM(sum_latency_ms) / SUM(total), 2) as avg_latency,
+    ROUND(SUM(sum_packet_loss) / SUM(total), 2) as avg_packet_loss,
+    ROUND(SUM(sum_quality_of_service) / SUM(total), 2) as avg_quality
+"""
 
 
 class DiagnosticsService:
     """Serviço responsável por operações de diagnóstico"""
     
     @staticmethod
-    def get_diagnostics_paginated(page: int, limit: int, city: Optional[str] = None, state: Optional[str] = None, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Tuple[List[Dict], int]:
+    def _build_filters(filters: Filters = (), start_date: Optional[str] = None, end_date: Optional[str] = None, date_column: str = 'date') -> Tuple[str, Dict]:
         """
-        Retorna diagnósticos paginados com filtros opcionais
+        Monta a cláusula WHERE comum às consultas de diagnósticos
+        
+        Compilada por filter_compiler (app.services.filter_compiler): o texto
+        depende só da forma dos filtros e os valores vão nos parâmetros, com o
+        nome do campo (iguais para a mesma condição em qualquer tabela).
+        
+        Os limites de data viram um intervalo semiaberto sobre a coluna
+        (date >= início AND date < dia seguinte ao fim), que pode usar o
+        índice idx_diagnostics_date, ao contrário de DATE(date). Cidade e
+        estado são resolvidos na dimensão de localidades e viram um IN sobre
+        (state, city), ou só sobre state no filtro de estado, que usa os
+        índices por localidade das tabelas brutas e dos resumos.
         
         Args:
-            page: Número da página (começa em 1)
-            limit: Quantidade de registros por página
-            city: Filtro opcional por cidade
-            state: Filtro opcional por estado
+            filters: Condições de filtro (campo, operador, valores; app.utils.filters)
             start_date: Filtro opcional data inicial (formato: YYYY-MM-DD)
             end_date: Filtro opcional data final (formato: YYYY-MM-DD)
+            date_column: Coluna de data ('date' nas linhas brutas, 'day' nos resumos por dia)
         """
-        sql = "SELECT * FROM diagnostics WHERE 1=1"
-        params = {}
+        return filter_compiler.compile(filters, LocationService.resolve, start_date, end_date, date_column)
+    
+    @staticmethod
+    def _has_table(name: str) -> bool:
+        """Indica se a tabela existe no banco atual (a presença é memorizada)"""
+        uri = current_app.config['SQLALCHEMY_DATABASE_URI']
+        if (uri, name) in _known_tables:
+            return True
+        
+        try:
+            result = db.session.execute(db.text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+            ), {'name': name}).fetchone()
+        except Exception:
+            db.session.rollback()
+            return False
+        
+        if result:
+            _known_tables.add((uri, name))
+        
+        return result is not None
+    
+    @staticmethod
+    def _partition_tables(start_date: Optional[str] = None, end_date: Optional[str] = None, diagnostic_id: Optional[int] = None) -> List[str]:
+        """
+        Tabelas que podem conter os diagnósticos pedidos
         
-        if city:
-            sql += " AND city LIKE :city COLLATE NOCASE"
-            params['city'] = f'%{city}%'
+        As partições seladas do catálogo entram só se o período cruza o
+        intervalo de datas ou a faixa de ids contém diagnostic_id (partition
+        pruning). A partição corrente (diagnostics) fica de fora quando as
+        suas datas, MIN e MAX lidos do índice, não cruzam o intervalo; sem
+        nenhuma tabela, a consulta é feita sobre ela e volta vazia.
+        """
+        if not DiagnosticsService._has_table('diagnostics_partitions'):
+            return ['diagnostics']
         
-        if state:
-            sql += " AND state LIKE :state COLLATE NOCASE"
-            params['state'] = f'%{state}%'
+        sql = "SELECT name FROM diagnostics_partitions WHERE 1=1"
+        params = {}
         
         if start_date:
-            sql += " AND DATE(date) >= DATE(:start_date)"
-            params['start_date'] = start_date
+            sql += " AND end_date > :start_date"
+            params['start_date'] = day_bound(start_date)
         
         if end_date:
-            sql += " AND DATE(date) <= DATE(:end_date)"
-            params['end_date'] = end_date
+            sql += " AND start_date < :end_date"
+            params['end_date'] = day_bound(end_date, days=1)
         
-        sql += " ORDER BY date DESC"
+        if diagnostic_id is not None:
+            sql += " AND :id BETWEEN min_id AND max_id"
+            params['id'] = diagnostic_id
         
-        count_sql = sql.replace("SELECT *", "SELECT COUNT(*) as total")
-        total_result = db.session.execute(db.text(count_sql), params).fetchone()
-        total = total_result.total if total_result else 0
+        # Os nomes (diagnostics_pAAAAMMDD) seguem a ordem das datas
+        sql += " ORDER BY name DESC"
+        tables = [row.name for row in db.session.execute(db.text(sql), params)]
         
-        offset = (page - 1) * limit
-        sql += " LIMIT :limit OFFSET :offset"
-        params['limit'] = limit
-        params['offset'] = offset
+        if tables and (start_date or end_date):
+            # MIN e MAX em subconsultas separadas: juntos, não usam os extremos do índice
+            head = db.session.execute(db.text(
+                "SELECT (SELECT MIN(date) FROM diagnostics) as first_date, (SELECT MAX(date) FROM diagnostics) as last_date"
+            )).fetchone()
+            
+            if head.first_date is None:
+                return tables
+            if start_date and head.last_date < params['start_date']:
+                return tables
+            if end_date and head.first_date >= params['end_date']:
+                return tables
+        
+        return ['diagnostics'] + tables
+    
+    @staticmethod
+    def _from_diagnostics(where: str, start_date: Optional[str] = None, end_date: Optional[str] = None, columns: str = '*') -> str:
+        """
+        Cláusula FROM (com o WHERE) das leituras de linhas brutas
+        
+        Sem partições no intervalo é a própria tabela diagnostics; com elas,
+        uma subconsulta UNION ALL com o WHERE repetido em cada tabela, para
+        que cada uma use os seus índices. columns restringe as colunas de
+        cada parte, para que um índice que as cubra dispense a tabela.
+        """
+        tables = DiagnosticsService._partition_tables(start_date, end_date)
+        
+        if len(tables) == 1:
+            return f" FROM {tables[0]}" + where
+        
+        return " FROM (" + " UNION ALL ".join(f"SELECT {columns} FROM {table}" + where for table in tables) + ")"
+    
+    @staticmethod
+    def _select_diagnostics(where: str, order: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> str:
+        """
+        SELECT das colunas de um diagnóstico (DIAGNOSTIC_COLUMNS) em ordem
+        
+        Com partições, cada tabela vira uma parte de um UNION ALL ordenado: o
+        SQLite intercala as partes (MERGE) lendo cada uma pelo seu índice de
+        data, sem ordenar todas as linhas, e LIMIT interrompe a leitura.
+        """
+        tables = DiagnosticsService._partition_tables(start_date, end_date)
+        return " UNION ALL ".join(f"SELECT {DIAGNOSTIC_COLUMNS} FROM {table}" + where for table in tables) + f" ORDER BY {order}"
+    
+    @staticmethod
+    def _select_page(where: str, tables: List[str]) -> str:
+        """
+        Página (LIMIT/OFFSET) mais recente primeiro, lida de várias partições
+        
+        O UNION ALL ordenado intercala só (date, id), que estão no índice de
+        data de cada partição, e descarta as linhas do OFFSET sem ler as
+        tabelas; as colunas são buscadas depois, pelo id, apenas para as
+        linhas da página. O resultado não sai ordenado.
+        """
+        ids = " UNION ALL ".join(f"SELECT date, id as page_id FROM {table}" + where for table in tables)
+        ids += " ORDER BY date DESC, page_id DESC LIMIT :limit OFFSET :offset"
+        
+        return "WITH page AS MATERIALIZED (" + ids + ") " + " UNION ALL ".join(
+            f"SELECT {DIAGNOSTIC_COLUMNS} FROM {table} WHERE id IN (SELECT page_id FROM page)" for table in tables
+        )
+    
+    @staticmethod
+    def _use_rollups(filters: Filters = ()) -> bool:
+        """
+        Indica se as agregações podem ser lidas do rollup diário
+        
+        Localidade e intervalo de dias são chaves do rollup; filtros por
+        dispositivo ou por métrica precisam das linhas brutas.
+        """
+        if not current_app.config.get('ROLLUPS_ENABLED', True) or not only_locations(filters):
+            return False
+        
+        return DiagnosticsService._has_table('diagnostics_daily_rollup')
+    
+    @staticmethod
+    def _row_to_dict(row) -> Dict:
+        """Converte uma linha selecionada com DIAGNOSTIC_COLUMNS em dicionário"""
+        return dict(zip(DIAGNOSTIC_FIELDS, row))
+    
+    @staticmethod
+    def count_diagnostics(count: str = 'exact', filters: Filters = (), start_date: Optional[str] = None, end_date: Optional[str] = None) -> Optional[int]:
+        """
+        Retorna o total de diagnósticos para os filtros informados
+        
+        Args:
+            count: 'exact' executa COUNT(*), 'estimate' reutiliza um total recente
+                   (ou MAX(id) sem filtros) e 'none' não calcula o total
+            filters: Condições de filtro (campo, operador, valores; app.utils.filters)
+            start_date: Filtro opcional data inicial (formato: YYYY-MM-DD)
+            end_date: Filtro opcional data final (formato: YYYY-MM-DD)
+        """
+        if count == 'none':
+            return None
+        
+        where, params = DiagnosticsService._build_filters(filters, start_date, end_date)
+        
+        if count == 'estimate':
+            if not params:
+                # Sem filtros o maior id é uma estimativa O(log n) do total; com
+                # partições, os totais do catálogo mais a faixa de ids da corrente
+                if len(DiagnosticsService._partition_tables()) > 1:
+                    sql = """
+                        SELECT
+                            (SELECT SUM(rows) FROM diagnostics_partitions) +
+                            (SELECT COALESCE(MAX(id) - MIN(id) + 1, 0) FROM diagnostics) as total
+                    """
+                else:
+                    sql = "SELECT MAX(id) as total FROM diagnostics"
+                result = db.session.execute(db.text(sql)).fetchone()
+                return (result.total or 0) if result else 0
+            
+            key = build_key('count_estimate', {'filters': filters, 'start_date': start_date, 'end_date': end_date})
+            cached = _count_cache.get(key)
+            if cached is not None:
+                return cached
+        
+        tables = DiagnosticsService._partition_tables(start_date, end_date)
+        if len(tables) == 1:
+            sql = f"SELECT COUNT(*) as total FROM {tables[0]}" + where
+        else:
+            sql = "SELECT SUM(total) as total FROM (" + " UNION ALL ".join(
+                f"SELECT COUNT(*) as total FROM {table}" + where for table in tables
+            ) + ")"
+        
+        result = db.session.execute(db.text(sql), params).fetchone()
+        total = result.total if result else 0
+        
+        if count == 'estimate':
+            _count_cache.max_entries = current_app.config.get('COUNT_ESTIMATE_MAX_ENTRIES', 256)
+            _count_cache.set(key, total, current_app.config.get('COUNT_ESTIMATE_TTL', 60))
+        
+        return total
+    
+    @staticmethod
+    @cache.memoize('diagnostics')
+    def get_diagnostics_paginated(page: int, limit: int, filters: Filters = (), start_date: Optional[str] = None, end_date: Optional[str] = None, count: str = 'exact') -> Tuple[List[Dict], Optional[int]]:
+        """
+        Retorna diagnósticos paginados com filtros opcionais
+        
+        Args:
+            page: Número da página (começa em 1)
+            limit: Quantidade de registros por página
+            filters: Condições de filtro (campo, operador, valores; app.utils.filters)
+            start_date: Filtro opcional data inicial (formato: YYYY-MM-DD)
+            end_date: Filtro opcional data final (formato: YYYY-MM-DD)
+            count: Modo de contagem do total ('exact', 'estimate' ou 'none')
+        
+        Com count='none' o total retornado é None e são buscados limit + 1
+        registros, para que o chamador saiba se existe próxima página.
+        """
+        where, params = DiagnosticsService._build_filters(filters, start_date, end_date)
+        total = DiagnosticsService.count_diagnostics(count, filters, start_date, end_date)
+        
+        tables = DiagnosticsService._partition_tables(start_date, end_date)
+        if len(tables) == 1:
+            sql = f"SELECT {DIAGNOSTIC_COLUMNS} FROM {tables[0]}" + where
+            sql += " ORDER BY date DESC, id DESC"
+            sql += " LIMIT :limit OFFSET :offset"
+        else:
+            sql = DiagnosticsService._select_page(where, tables)
+        params['limit'] = limit + 1 if total is None else limit
+        params['offset'] = (page - 1) * limit
         
         result = db.session.execute(db.text(sql), params)
         
-        data = []
-        for row in result:
-            data.append({
-                'id': row.id,
-                'device_id': row.device_id,
-                'city': row.city,
-                'state': row.state,
-                'latency_ms': round(float(row.latency_ms), 2),
-                'packet_loss': round(float(row.packet_loss), 2),
-                'quality_of_service': round(float(row.quality_of_service), 2),
-                'date': row.date
-            })
+        data = [DiagnosticsService._row_to_dict(row) for row in result]
+        if len(tables) > 1:
+            data.sort(key=lambda item: (item['date'], item['id']), reverse=True)
         
         return data, total
     
     @staticmethod
+    @cache.memoize('diagnostics_cursor')
+    def get_diagnostics_by_cursor(limit: int, cursor: Optional[Tuple[str, int, str]] = None, filters: Filters = (), start_date: Optional[str] = None, end_date: Optional[str] = None) -> Tuple[List[Dict], Dict]:
+        """
+        Retorna diagnósticos paginados por cursor (keyset) sobre (date, id)
+        
+        Em vez de OFFSET, a página é buscada a partir da chave do último (ou
+        primeiro) registro visto, então o custo não cresce com a profundidade.
+        
+        Args:
+            limit: Quantidade de registros por página
+            cursor: Cursor decodificado (date, id, direção) ou None para a primeira página
+            filters: Condições de filtro (campo, operador, valores; app.utils.filters)
+            start_date: Filtro opcional data inicial (formato: YYYY-MM-DD)
+            end_date: Filtro opcional data final (formato: YYYY-MM-DD)
+        """
+        where, params = DiagnosticsService._build_filters(filters, start_date, end_date)
+        direction = cursor[2] if cursor else CURSOR_NEXT
+        
+        if cursor and direction == CURSOR_NEXT:
+            where += " AND (date, id) < (:cursor_date, :cursor_id)"
+        elif cursor:
+            where += " AND (date, id) > (:cursor_date, :cursor_id)"
+        
+        if cursor:
+            params['cursor_date'] = cursor[0]
+            params['cursor_id'] = cursor[1]
+        
+        if direction == CURSOR_NEXT:
+            sql = DiagnosticsService._select_diagnostics(where, "date DESC, id DESC", start_date, end_date)
+        else:
+            sql = DiagnosticsService._select_diagnostics(where, "date ASC, id ASC", start_date, end_date)
+        
+        sql += " LIMIT :limit"
+        params['limit'] = limit + 1
+        
+        rows = db.session.execute(db.text(sql), params).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        if direction == CURSOR_PREV:
+            rows.reverse()
+            has_next, has_prev = True, has_more
+        else:
+            has_next, has_prev = has_more, cursor is not None
+        
+        data = [DiagnosticsService._row_to_dict(row) for row in rows]
+        
+        next_cursor = None
+        prev_cursor = None
+        
+        if data and has_next:
+            next_cursor = encode_cursor(data[-1]['date'], data[-1]['id'], CURSOR_NEXT)
+        
+        if data and has_prev:
+            prev_cursor = encode_cursor(data[0]['date'], data[0]['id'], CURSOR_PREV)
+        
+        return data, {
+            'has_next': has_next and next_cursor is not None,
+            'has_prev': has_prev and prev_cursor is not None,
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor
+        }
+    
+    @staticmethod
+    def iter_diagnostics(chunk_size: int, filters: Filters = (), start_date: Optional[str] = None, end_date: Optional[str] = None) -> Iterator[List[Dict]]:
+        """
+        Percorre todos os diagnósticos filtrados em blocos de chunk_size
+        
+        A consulta é lida do cursor aos poucos (yield_per), então no máximo um
+        bloco fica em memória, qualquer que seja a quantidade de linhas. A
+        ordem (date, id) é a do índice idx_diagnostics_date, sem ordenação
+        temporária.
+        
+        Args:
+            chunk_size: Quantidade de linhas por bloco
+            filters: Condições de filtro (campo, operador, valores; app.utils.filters)
+            start_date: Filtro opcional data inicial (formato: YYYY-MM-DD)
+            end_date: Filtro opcional data final (formato: YYYY-MM-DD)
+        """
+        where, params = DiagnosticsService._build_filters(filters, start_date, end_date)
+        sql = DiagnosticsService._select_diagnostics(where, "date, id", start_date, end_date)
+        
+        result = db.session.execute(db.text(sql), params, execution_options={'yield_per': chunk_size})
+        
+        try:
+            for rows in result.partitions():
+                yield [DiagnosticsService._row_to_dict(row) for row in rows]
+        finally:
+            result.close()
+    
+    @staticmethod
+    @cache.memoize('diagnostic')
     def get_diagnostic_by_id(diagnostic_id: int) -> Optional[Dict]:
         """
         Busca um diagnóstico específico por ID
@@ -73,67 +401,296 @@ class DiagnosticsService:
         Args:
             diagnostic_id: ID do diagnóstico
         """
-        sql = "SELECT * FROM diagnostics WHERE id = :id"
+        tables = DiagnosticsService._partition_tables(diagnostic_id=diagnostic_id)
+        sql = " UNION ALL ".join(f"SELECT {DIAGNOSTIC_COLUMNS} FROM {table} WHERE id = :id" for table in tables)
         result = db.session.execute(db.text(sql), {'id': diagnostic_id}).fetchone()
         
         if not result:
             return None
         
-        return {
-            'id': result.id,
-            'device_id': result.device_id,
-            'city': result.city,
-            'state': result.state,
-            'latency_ms': round(float(result.latency_ms), 2),
-            'packet_loss': round(float(result.packet_loss), 2),
-            'quality_of_service': round(float(result.quality_of_service), 2),
-            'date': result.date
-        }
+        return DiagnosticsService._row_to_dict(result)
     
     @staticmethod
-    def get_aggregated_by_day(city: Optional[str] = None, state: Optional[str] = None, group_by: str = 'day', start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict]:
+    @cache.memoize('aggregate')
+    def get_aggregated_by_day(filters: Filters = (), group_by: str = 'day', start_date: Optional[str] = None, end_date: Optional[str] = None, percentiles: Optional[Tuple[float, ...]] = None, exact: bool = False) -> List[Dict]:
         """
         Retorna dados agregados por dia com médias de métricas
         
         Args:
-            city: Filtro opcional por cidade
-            state: Filtro opcional por estado
+            filters: Condições de filtro (campo, operador, valores; app.utils.filters)
             group_by: Critério de agrupamento ('day', 'city', 'state')
             start_date: Filtro opcional data inicial (formato: YYYY-MM-DD)
             end_date: Filtro opcional data final (formato: YYYY-MM-DD)
+            percentiles: Percentis (0 a 100) das métricas a incluir em cada grupo
+            exact: Calcula os percentis ordenando as linhas brutas, em vez de
+                   combinar os t-digests (para validação)
         """
-        params = {}
+        if group_by not in ('day', 'city', 'state'):
+            raise ValueError(f"Critério de agrupamento inválido: {group_by}")
         
-        if group_by == 'day':
+        # Agrupar por cidade ignora o filtro de cidade; por estado, ignora ambos
+        if group_by != 'day':
+            filters = without(filters, 'city')
+        if group_by == 'state':
+            filters = without(filters, 'state')
+        
+        if columnar.enabled:
+            data = columnar.aggregate(group_by, filters, start_date, end_date)
+        else:
+            data = DiagnosticsService._aggregate_sql(group_by, filters, start_date, end_date)
+        
+        if percentiles:
+            values = DiagnosticsService._get_percentiles(group_by, filters, start_date, end_date, percentiles, exact)
+            
+            for row_dict in data:
+                key = tuple(row_dict[column] for column in PERCENTILE_GROUP_KEYS[group_by])
+                row_dict['percentiles'] = values.get(key, {})
+        
+        return data
+    
+    @staticmethod
+    def _aggregate_sql(group_by: str, filters: Filters, start_date: Optional[str], end_date: Optional[str]) -> List[Dict]:
+        """Executa a agregação em SQL, pelo rollup diário quando disponível"""
+        if DiagnosticsService._use_rollups(filters):
+            sql, params = DiagnosticsService._aggregate_rollup_sql(group_by, filters, start_date, end_date)
+        else:
+            sql, params = DiagnosticsService._aggregate_raw_sql(group_by, filters, start_date, end_date)
+        
+        result = db.session.execute(db.text(sql), params)
+        
+        return [DiagnosticsService._aggregate_row_to_dict(row, group_by) for row in result]
+    
+    @staticmethod
+    @cache.memoize('buckets')
+    def get_time_buckets(bucket: int, max_points: int, downsample: str = 'merge', filters: Filters = (), start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict:
+        """
+        Retorna a série de buckets de tempo de largura fixa com médias de métricas
+        
+        Os buckets são calculados sobre a coluna gerada epoch, pelo índice
+        idx_diagnostics_epoch (que cobre filtros e métricas), ou sobre o rollup
+        diário quando a largura é um múltiplo de dia. Só buckets com
+        diagnósticos aparecem, do mais antigo para o mais recente.
+        
+        Args:
+            bucket: Largura pedida dos buckets, em segundos
+            max_points: Quantidade máxima de pontos da série
+            downsample: Redução acima de max_points - 'merge' (bucket mais
+                        largo, exato), 'lttb' ou 'minmax' (pela latência média)
+            filters: Condições de filtro (campo, operador, valores; app.utils.filters)
+            start_date: Filtro opcional data inicial (formato: YYYY-MM-DD)
+            end_date: Filtro opcional data final (formato: YYYY-MM-DD)
+        
+        Retorna {'bucket': largura efetiva em segundos, 'downsampled': bool, 'data': [...]}.
+        """
+        span = DiagnosticsService._epoch_span(start_date, end_date)
+        if span is None:
+            return {'bucket': bucket, 'downsampled': False, 'data': []}
+        
+        if downsample == 'merge':
+            bucket = timeseries.pick_bucket(bucket, span[0], span[1], max_points)
+        
+        if bucket % timeseries.BUCKETS['1d'] == 0 and DiagnosticsService._use_rollups(filters):
+            where, params = DiagnosticsService._build_filters(filters, start_date, end_date, date_column='day')
             sql = """
                 SELECT 
-                    DATE(date) as day,
+                    (CAST(strftime('%s', day) AS INTEGER) - :origin) / :width * :width + :origin as bucket_epoch,
+            """ + ROLLUP_AVERAGES_SQL + """,
+                    ROUND(MIN(min_latency_ms), 2) as min_latency,
+                    ROUND(MAX(max_latency_ms), 2) as max_latency
+                FROM diagnostics_daily_rollup
+            """ + where
+        else:
+            where, params = DiagnosticsService._build_filters(filters)
+            where += " AND epoch >= :first_epoch AND epoch <= :last_epoch"
+            params['first_epoch'], params['last_epoch'] = span
+            sql = """
+                SELECT 
+                    (epoch - :origin) / :width * :width + :origin as bucket_epoch,
                     COUNT(*) as total,
                     ROUND(AVG(latency_ms), 2) as avg_latency,
                     ROUND(AVG(packet_loss), 2) as avg_packet_loss,
                     ROUND(AVG(quality_of_service), 2) as avg_quality,
                     ROUND(MIN(latency_ms), 2) as min_latency,
                     ROUND(MAX(latency_ms), 2) as max_latency
-                FROM diagnostics
-                WHERE 1=1
-            """
-            
-            if city:
-                sql += " AND city LIKE :city COLLATE NOCASE"
-                params['city'] = f'%{city}%'
-            
-            if state:
-                sql += " AND state LIKE :state COLLATE NOCASE"
-                params['state'] = f'%{state}%'
+            """ + DiagnosticsService._from_diagnostics(where, start_date, end_date, columns=BUCKET_COLUMNS)
+        
+        sql += " GROUP BY bucket_epoch ORDER BY bucket_epoch"
+        params['origin'] = timeseries.EPOCH_ORIGIN
+        params['width'] = bucket
+        
+        rows = db.session.execute(db.text(sql), params).fetchall()
+        
+        downsampled = len(rows) > max_points
+        if downsampled:
+            latencies = [row.avg_latency or 0 for row in rows]
+            if downsample == 'lttb':
+                kept = timeseries.lttb([row.bucket_epoch for row in rows], latencies, max_points)
+            else:
+                kept = timeseries.min_max(latencies, max_points)
+            rows = [rows[index] for index in kept]
+        
+        data = []
+        for row in rows:
+            row_dict = DiagnosticsService._aggregate_row_to_dict(row, 'bucket')
+            row_dict['bucket'] = datetime.fromtimestamp(row.bucket_epoch, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+            data.append(row_dict)
+        
+        return {'bucket': bucket, 'downsampled': downsampled, 'data': data}
+    
+    @staticmethod
+    def _epoch_span(start_date: Optional[str], end_date: Optional[str]) -> Optional[Tuple[int, int]]:
+        """
+        Primeiro e último epoch com diagnósticos no intervalo de datas
+        
+        Lidos dos extremos do índice de epoch de cada partição do intervalo,
+        em subconsultas separadas (juntos, MIN e MAX percorreriam o índice).
+        Retorna None se não há diagnósticos.
+        """
+        params = {
+            'start_epoch': calendar.timegm(date.fromisoformat(start_date[:10]).timetuple()) if start_date else 0,
+            'end_epoch': calendar.timegm((date.fromisoformat(end_date[:10]) + timedelta(days=1)).timetuple()) if end_date else 2 ** 62,
+        }
+        bounds = " WHERE epoch >= :start_epoch AND epoch < :end_epoch"
+        
+        sql = " UNION ALL ".join(
+            f"SELECT (SELECT MIN(epoch) FROM {table}{bounds}) as first_epoch, (SELECT MAX(epoch) FROM {table}{bounds}) as last_epoch"
+            for table in DiagnosticsService._partition_tables(start_date, end_date)
+        )
+        result = db.session.execute(db.text(
+            "SELECT MIN(first_epoch) as first_epoch, MAX(last_epoch) as last_epoch FROM (" + sql + ")"
+        ), params).fetchone()
+        
+        if result.first_epoch is None:
+            return None
+        
+        return result.first_epoch, result.last_epoch
+    
+    @staticmethod
+    def _aggregate_row_to_dict(row, group_by: str) -> Dict:
+        """Converte uma linha de agregação (total, médias e chaves do grupo) em dicionário"""
+        row_dict = {
+            'total': row.total,
+            'avg_latency_ms': float(row.avg_latency or 0),
+            'avg_packet_loss': float(row.avg_packet_loss or 0),
+            'avg_quality_of_service': float(row.avg_quality or 0)
+        }
+        
+        if group_by == 'day':
+            row_dict['day'] = row.day
+            row_dict['min_latency_ms'] = float(row.min_latency or 0)
+            row_dict['max_latency_ms'] = float(row.max_latency or 0)
+        elif group_by == 'bucket':
+            row_dict['min_latency_ms'] = float(row.min_latency or 0)
+            row_dict['max_latency_ms'] = float(row.max_latency or 0)
+        elif group_by == 'city':
+            row_dict['city'] = row.city
+            row_dict['state'] = row.state
+        elif group_by == 'state':
+            row_dict['state'] = row.state
+        
+        return row_dict
+    
+    @staticmethod
+    def _get_percentiles(group_by: str, filters: Filters, start_date: Optional[str], end_date: Optional[str], percentiles: Tuple[float, ...], exact: bool) -> Dict[Tuple, Dict]:
+        """
+        Calcula percentis das métricas para cada grupo da agregação
+        
+        Por padrão combina os t-digests de (dia, estado, cidade) do intervalo,
+        acrescentando as linhas ainda não incorporadas. Com exact=True, com
+        filtros por dispositivo ou por métrica, ou se há grupos aguardando
+        recálculo, ordena os valores das linhas brutas.
+        
+        Retorna {chave do grupo: {métrica: {'p50': valor, ...}}}.
+        """
+        key_columns = PERCENTILE_GROUP_KEYS[group_by]
+        progress = None
+        if not exact and only_locations(filters):
+            progress = DiagnosticsService._summary_progress('diagnostics_digest_state', 'diagnostics_digest_dirty')
+        
+        raw_sql = "SELECT DATE(date) as day, city, state, latency_ms, packet_loss, quality_of_service"
+        where, params = DiagnosticsService._build_filters(filters, start_date, end_date)
+        
+        if progress is None:
+            groups = {}
+            sql = raw_sql + DiagnosticsService._from_diagnostics(where, start_date, end_date)
+            for row in db.session.execute(db.text(sql), params):
+                columns = groups.setdefault(tuple(getattr(row, column) for column in key_columns), ([], [], []))
+                columns[0].append(row.latency_ms)
+                columns[1].append(row.packet_loss)
+                columns[2].append(row.quality_of_service)
             
-            if start_date:
-                sql += " AND DATE(date) >= DATE(:start_date)"
-                params['start_date'] = start_date
+            return {
+                key: {
+                    metric: DiagnosticsService._percentile_labels(percentiles, partial(exact_quantile, sorted(values)))
+                    for metric, values in zip(METRICS, columns)
+                }
+                for key, columns in groups.items()
+            }
+        
+        groups = {}
+        
+        digest_where, digest_params = DiagnosticsService._build_filters(filters, start_date, end_date, date_column='day')
+        result = db.session.execute(db.text(
+            "SELECT day, city, state, latency_ms, packet_loss, quality_of_service FROM diagnostics_metric_digest" + digest_where
+        ), digest_params)
+        
+        for row in result:
+            key = tuple(getattr(row, column) for column in key_columns)
+            digests = groups.get(key)
+            if digests is None:
+                digests = groups[key] = tuple(TDigest() for _ in METRICS)
             
-            if end_date:
-                sql += " AND DATE(date) <= DATE(:end_date)"
-                params['end_date'] = end_date
+            for digest, data in zip(digests, (row.latency_ms, row.packet_loss, row.quality_of_service)):
+                digest.merge(TDigest.from_bytes(data))
+        
+        if progress.max_id > progress.last_id:
+            params['last_id'] = progress.last_id
+            pending = {}
+            # Linhas acima de last_id ainda estão na partição corrente; a
+            # gravação em lote deixa a atualização dos digests para depois do commit
+            rows = db.session.execute(db.text(raw_sql + " FROM diagnostics" + where + " AND id > :last_id"), params).fetchall()
+            for row in rows:
+                columns = pending.setdefault(tuple(getattr(row, column) for column in key_columns), ([], [], []))
+                columns[0].append(row.latency_ms)
+                columns[1].append(row.packet_loss)
+                columns[2].append(row.quality_of_service)
             
+            for key, columns in pending.items():
+                digests = groups.get(key)
+                if digests is None:
+                    digests = groups[key] = tuple(TDigest() for _ in METRICS)
+                for digest, values in zip(digests, columns):
+                    digest.add_many(values)
+        
+        return {
+            key: {
+                metric: DiagnosticsService._percentile_labels(percentiles, digest.quantile)
+                for metric, digest in zip(METRICS, digests)
+            }
+            for key, digests in groups.items()
+        }
+    
+    @staticmethod
+    def _percentile_labels(percentiles: Tuple[float, ...], quantile) -> Dict[str, float]:
+        """Monta {'p50': valor, ...} a partir de uma função quantil (0 a 1)"""
+        return {f'p{p:g}': round(quantile(p / 100), 2) for p in percentiles}
+    
+    @staticmethod
+    def _aggregate_raw_sql(group_by: str, filters: Filters, start_date: Optional[str], end_date: Optional[str]) -> Tuple[str, Dict]:
+        """Monta a agregação sobre as linhas brutas das partições do intervalo"""
+        where, params = DiagnosticsService._build_filters(filters, start_date, end_date)
+        
+        if group_by == 'day':
+            sql = """
+                SELECT 
+                    DATE(date) as day,
+                    COUNT(*) as total,
+                    ROUND(AVG(latency_ms), 2) as avg_latency,
+                    ROUND(AVG(packet_loss), 2) as avg_packet_loss,
+                    ROUND(AVG(quality_of_service), 2) as avg_quality,
+                    ROUND(MIN(latency_ms), 2) as min_latency,
+                    ROUND(MAX(latency_ms), 2) as max_latency
+            """ + DiagnosticsService._from_diagnostics(where, start_date, end_date)
             sql += " GROUP BY DATE(date) ORDER BY DATE(date) DESC"
             
         elif group_by == 'city':
@@ -145,25 +702,10 @@ class DiagnosticsService:
                     ROUND(AVG(latency_ms), 2) as avg_latency,
                     ROUND(AVG(packet_loss), 2) as avg_packet_loss,
                     ROUND(AVG(quality_of_service), 2) as avg_quality
-                FROM diagnostics
-                WHERE 1=1
-            """
-            
-            if state:
-                sql += " AND state LIKE :state COLLATE NOCASE"
-                params['state'] = f'%{state}%'
-            
-            if start_date:
-                sql += " AND DATE(date) >= DATE(:start_date)"
-                params['start_date'] = start_date
-            
-            if end_date:
-                sql += " AND DATE(date) <= DATE(:end_date)"
-                params['end_date'] = end_date
-            
-            sql += " GROUP BY city, state ORDER BY total DESC"
+            """ + DiagnosticsService._from_diagnostics(where, start_date, end_date, columns=LOCATION_AGGREGATE_COLUMNS)
+            sql += " GROUP BY city, state ORDER BY total DESC, city, state"
             
-        elif group_by == 'state':
+        else:
             sql = """
                 SELECT 
                     state,
@@ -171,96 +713,89 @@ class DiagnosticsService:
                     ROUND(AVG(latency_ms), 2) as avg_latency,
                     ROUND(AVG(packet_loss), 2) as avg_packet_loss,
                     ROUND(AVG(quality_of_service), 2) as avg_quality
-                FROM diagnostics
-                WHERE 1=1
-            """
-            
-            if start_date:
-                sql += " AND DATE(date) >= DATE(:start_date)"
-                params['start_date'] = start_date
-            
-            if end_date:
-                sql += " AND DATE(date) <= DATE(:end_date)"
-                params['end_date'] = end_date
-            
-            sql += " GROUP BY state ORDER BY total DESC"
-        else:
-            raise ValueError(f"Critério de agrupamento inválido: {group_by}")
+            """ + DiagnosticsService._from_diagnostics(where, start_date, end_date, columns=LOCATION_AGGREGATE_COLUMNS)
+            sql += " GROUP BY state ORDER BY total DESC, state"
         
-        result = db.session.execute(db.text(sql), params)
+        return sql, params
+    
+    @staticmethod
+    def _aggregate_rollup_sql(group_by: str, filters: Filters, start_date: Optional[str], end_date: Optional[str]) -> Tuple[str, Dict]:
+        """Monta a agregação sobre o rollup diário (dia, estado, cidade)"""
+        where, params = DiagnosticsService._build_filters(filters, start_date, end_date, date_column='day')
         
-        data = []
-        for row in result:
-            row_dict = {
-                'total': row.total,
-                'avg_latency_ms': float(row.avg_latency or 0),
-                'avg_packet_loss': float(row.avg_packet_loss or 0),
-                'avg_quality_of_service': float(row.avg_quality or 0)
-            }
+        if group_by == 'day':
+            sql = "SELECT day, " + ROLLUP_AVERAGES_SQL + """,
+                    ROUND(MIN(min_latency_ms), 2) as min_latency,
+                    ROUND(MAX(max_latency_ms), 2) as max_latency
+                FROM diagnostics_daily_rollup
+            """ + where
+            sql += " GROUP BY day ORDER BY day DESC"
             
-            if group_by == 'day':
-                row_dict['day'] = row.day
-                row_dict['min_latency_ms'] = float(row.min_latency or 0)
-                row_dict['max_latency_ms'] = float(row.max_latency or 0)
-            elif group_by == 'city':
-                row_dict['city'] = row.city
-                row_dict['state'] = row.state
-            elif group_by == 'state':
-                row_dict['state'] = row.state
+        elif group_by == 'city':
+            sql = "SELECT city, state, " + ROLLUP_AVERAGES_SQL + " FROM diagnostics_daily_rollup" + where
+            sql += " GROUP BY city, state ORDER BY total DESC, city, state"
             
-            data.append(row_dict)
+        else:
+            sql = "SELECT state, " + ROLLUP_AVERAGES_SQL + " FROM diagnostics_daily_rollup" + where
+            sql += " GROUP BY state ORDER BY total DESC, state"
         
-        return data
+        return sql, params
     
     @staticmethod
-    def get_statistics(city: Optional[str] = None, state: Optional[str] = None, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict:
+    @cache.memoize('statistics')
+    def get_statistics(filters: Filters = (), start_date: Optional[str] = None, end_date: Optional[str] = None, distinct: str = 'approx') -> Dict:
         """
         Retorna estatísticas gerais dos diagnósticos
         
         Args:
-            city: Filtro opcional por cidade
-            state: Filtro opcional por estado
+            filters: Condições de filtro (campo, operador, valores; app.utils.filters)
             start_date: Filtro opcional data inicial (formato: YYYY-MM-DD)
             end_date: Filtro opcional data final (formato: YYYY-MM-DD)
+            distinct: 'approx' estima os dispositivos distintos pelos sketches
+                      HyperLogLog (erro padrão de ~1,6%); 'exact' usa COUNT(DISTINCT)
         """
-        sql = """
-            SELECT 
-                COUNT(*) as total_diagnostics,
-                COUNT(DISTINCT device_id) as total_devices,
-                COUNT(DISTINCT city) as total_cities,
-                COUNT(DISTINCT state) as total_states,
-                ROUND(AVG(latency_ms), 2) as avg_latency,
-                ROUND(AVG(packet_loss), 2) as avg_packet_loss,
-                ROUND(AVG(quality_of_service), 2) as avg_quality,
-                MIN(date) as first_diagnostic,
-                MAX(date) as last_diagnostic
-            FROM diagnostics
-            WHERE 1=1
-        """
-        
-        params = {}
+        if columnar.enabled:
+            # As colunas respondem as contagens distintas exatas sem custo extra
+            return columnar.statistics(filters, start_date, end_date)
         
-        if city:
-            sql += " AND city LIKE :city COLLATE NOCASE"
-            params['city'] = f'%{city}%'
-        
-        if state:
-            sql += " AND state LIKE :state COLLATE NOCASE"
-            params['state'] = f'%{state}%'
-        
-        if start_date:
-            sql += " AND DATE(date) >= DATE(:start_date)"
-            params['start_date'] = start_date
-        
-        if end_date:
-            sql += " AND DATE(date) <= DATE(:end_date)"
-            params['end_date'] = end_date
+        devices = None
+        if distinct == 'approx':
+            devices = DiagnosticsService._estimate_devices(filters, start_date, end_date)
         
-        result = db.session.execute(db.text(sql), params).fetchone()
+        if DiagnosticsService._use_rollups(filters):
+            result = DiagnosticsService._statistics_from_rollup(filters, start_date, end_date, devices)
+        else:
+            where, params = DiagnosticsService._build_filters(filters, start_date, end_date)
+            
+            if devices is None:
+                devices_sql = "COUNT(DISTINCT device_id)"
+            else:
+                devices_sql = ":total_devices"
+                params['total_devices'] = devices
+            
+            sql = """
+                SELECT 
+                    COUNT(*) as total_diagnostics,
+                    """ + devices_sql + """ as total_devices,
+                    COUNT(DISTINCT city) as total_cities,
+                    COUNT(DISTINCT state) as total_states,
+                    ROUND(AVG(latency_ms), 2) as avg_latency,
+                    ROUND(AVG(packet_loss), 2) as avg_packet_loss,
+                    ROUND(AVG(quality_of_service), 2) as avg_quality,
+                    MIN(date) as first_diagnostic,
+                    MAX(date) as last_diagnostic
+            """ + DiagnosticsService._from_diagnostics(where, start_date, end_date)
+            
+            result = db.session.execute(db.text(sql), params).fetchone()
         
         if not result:
             return {}
         
+        return DiagnosticsService._statistics_to_dict(result)
+    
+    @staticmethod
+    def _statistics_to_dict(result) -> Dict:
+        """Converte a linha de estatísticas gerais em dicionário"""
         return {
             'total_diagnostics': result.total_diagnostics,
             'total_devices': result.total_devices,
@@ -272,4 +807,236 @@ class DiagnosticsService:
             'first_diagnostic': result.first_diagnostic,
             'last_diagnostic': result.last_diagnostic
         }
-
+    
+    @staticmethod
+    def _statistics_from_rollup(filters: Filters, start_date: Optional[str], end_date: Optional[str], devices: Optional[int] = None):
+        """
+        Calcula as estatísticas gerais a partir do rollup diário
+        
+        Dispositivos distintos não são aditivos entre grupos: sem a estimativa
+        dos sketches (devices), COUNT(DISTINCT device_id) é lido das linhas brutas.
+        """
+        where, params = DiagnosticsService._build_filters(filters, start_date, end_date, date_column='day')
+        sql = """
+            SELECT 
+                COALESCE(SUM(total), 0) as total_diagnostics,
+                COUNT(DISTINCT city) as total_cities,
+                COUNT(DISTINCT state) as total_states,
+                ROUND(SUM(sum_latency_ms) / SUM(total), 2) as avg_latency,
+                ROUND(SUM(sum_packet_loss) / SUM(total), 2) as avg_packet_loss,
+                ROUND(SUM(sum_quality_of_service) / SUM(total), 2) as avg_quality,
+                MIN(first_date) as first_diagnostic,
+                MAX(last_date) as last_diagnostic
+            FROM diagnostics_daily_rollup
+        """ + where
+        rollup = db.session.execute(db.text(sql), params).fetchone()
+        
+        if devices is None:
+            where, params = DiagnosticsService._build_filters(filters, start_date, end_date)
+            sql = "SELECT COUNT(DISTINCT device_id) as total_devices" + DiagnosticsService._from_diagnostics(where, start_date, end_date)
+            devices = db.session.execute(db.text(sql), params).fetchone().total_devices
+        
+        return SimpleNamespace(total_devices=devices, **rollup._asdict())
+    
+    @staticmethod
+    @cache.memoize('dashboard')
+    def get_dashboard(filters: Filters = (), start_date: Optional[str] = None, end_date: Optional[str] = None, group_by: Tuple[str, ...] = ('day',), limit: int = 10, distinct: str = 'approx') -> Dict:
+        """
+        Retorna estatísticas, agregações e a primeira página numa só leitura
+        
+        Todas as consultas rodam na mesma transação de leitura, então os
+        números são coerentes entre si (o total da paginação é o
+        total_diagnostics das estatísticas). Estatísticas e agregações saem de
+        uma única consulta: os grupos (dia, estado, cidade) do intervalo são
+        calculados uma vez, do rollup diário ou de uma varredura das linhas
+        brutas, e reagrupados para cada resultado. Os filtros seguem os de
+        /statistics e /aggregate; o motor colunar não é usado aqui.
+        
+        Args:
+            filters: Condições de filtro (campo, operador, valores; app.utils.filters)
+            start_date: Filtro opcional data inicial (formato: YYYY-MM-DD)
+            end_date: Filtro opcional data final (formato: YYYY-MM-DD)
+            group_by: Agregações incluídas ('day', 'city', 'state')
+            limit: Registros da primeira página
+            distinct: 'approx' (sketches HyperLogLog) ou 'exact' para total_devices
+        """
+        begin_read_snapshot(db.session)
+        
+        sql, params = DiagnosticsService._dashboard_sql(group_by, filters, start_date, end_date)
+        
+        statistics = None
+        aggregates = {key: [] for key in group_by}
+        for row in db.session.execute(db.text(sql), params):
+            if row.kind == 'statistics':
+                statistics = row
+            else:
+                aggregates[row.kind].append(DiagnosticsService._aggregate_row_to_dict(row, row.kind))
+        
+        # Mesma ordem das consultas de /aggregate
+        if 'day' in aggregates:
+            aggregates['day'].sort(key=lambda item: item['day'], reverse=True)
+        if 'city' in aggregates:
+            aggregates['city'].sort(key=lambda item: (-item['total'], item['city'], item['state']))
+        if 'state' in aggregates:
+            aggregates['state'].sort(key=lambda item: (-item['total'], item['state']))
+        
+        devices = None
+        if distinct == 'approx':
+            devices = DiagnosticsService._estimate_devices(filters, start_date, end_date)
+        if devices is None:
+            where, params = DiagnosticsService._build_filters(filters, start_date, end_date)
+            sql = "SELECT COUNT(DISTINCT device_id) as total_devices" + DiagnosticsService._from_diagnostics(where, start_date, end_date)
+            devices = db.session.execute(db.text(sql), params).fetchone().total_devices
+        
+        where, params = DiagnosticsService._build_filters(filters, start_date, end_date)
+        sql = DiagnosticsService._select_diagnostics(where, "date DESC, id DESC", start_date, end_date) + " LIMIT :limit"
+        params['limit'] = limit
+        data = [DiagnosticsService._row_to_dict(row) for row in db.session.execute(db.text(sql), params)]
+        
+        values = statistics._asdict()
+        values['total_diagnostics'] = values.pop('total')
+        
+        return {
+            'statistics': DiagnosticsService._statistics_to_dict(SimpleNamespace(total_devices=devices, **values)),
+            'aggregates': aggregates,
+            'diagnostics': data
+        }
+    
+    @staticmethod
+    def _dashboard_sql(group_by: Tuple[str, ...], filters: Filters, start_date: Optional[str], end_date: Optional[str]) -> Tuple[str, Dict]:
+        """
+        Monta a consulta única do dashboard
+        
+        A CTE materializada traz os grupos (dia, estado, cidade) filtrados só
+        pelo que todas as partes têm em comum: o agrupamento por estado ignora
+        os filtros de localidade e o por cidade ignora o de cidade, como em
+        /aggregate; os filtros por dispositivo e por métrica valem para todas. Cada parte do UNION ALL reagrupa a CTE com os próprios
+        filtros; a coluna kind identifica a parte ('statistics' ou o group_by).
+        """
+        if 'state' in group_by:
+            base_filters = without(filters, 'city', 'state')
+        elif 'city' in group_by:
+            base_filters = without(filters, 'city')
+        else:
+            base_filters = filters
+        
+        if DiagnosticsService._use_rollups(filters):
+            where, params = DiagnosticsService._build_filters(base_filters, start_date, end_date, date_column='day')
+            groups_sql = """
+                SELECT day, state, city, total, sum_latency_ms, min_latency_ms, max_latency_ms,
+                    sum_packet_loss, sum_quality_of_service, first_date, last_date
+                FROM diagnostics_daily_rollup
+            """ + where
+        else:
+            where, params = DiagnosticsService._build_filters(base_filters, start_date, end_date)
+            groups_sql = """
+                SELECT
+                    DATE(date) as day, state, city, COUNT(*) as total,
+                    SUM(latency_ms) as sum_latency_ms, MIN(latency_ms) as min_latency_ms, MAX(latency_ms) as max_latency_ms,
+                    SUM(packet_loss) as sum_packet_loss, SUM(quality_of_service) as sum_quality_of_service,
+                    MIN(date) as first_date, MAX(date) as last_date
+            """ + DiagnosticsService._from_diagnostics(where, start_date, end_date) + " GROUP BY DATE(date), state, city"
+        
+        # Os filtros de cada parte usam os mesmos nomes de parâmetro da CTE;
+        # os demais (dispositivo, métricas) já valem para todas as partes
+        location_where, location_params = DiagnosticsService._build_filters(location_filters(filters))
+        state_where, _ = DiagnosticsService._build_filters(without(location_filters(filters), 'city'))
+        params.update(location_params)
+        
+        parts = ["""
+            SELECT 'statistics' as kind, NULL as day, NULL as city, NULL as state,
+                COALESCE(SUM(total), 0) as total,
+                COUNT(DISTINCT city) as total_cities,
+                COUNT(DISTINCT state) as total_states,
+                ROUND(SUM(sum_latency_ms) / SUM(total), 2) as avg_latency,
+                ROUND(SUM(sum_packet_loss) / SUM(total), 2) as avg_packet_loss,
+                ROUND(SUM(sum_quality_of_service) / SUM(total), 2) as avg_quality,
+                NULL as min_latency, NULL as max_latency,
+                MIN(first_date) as first_diagnostic,
+                MAX(last_date) as last_diagnostic
+            FROM groups
+        """ + location_where]
+        
+        aggregate_sql = """
+            SELECT '{kind}', {keys}, SUM(total), NULL, NULL,
+                ROUND(SUM(sum_latency_ms) / SUM(total), 2),
+                ROUND(SUM(sum_packet_loss) / SUM(total), 2),
+                ROUND(SUM(sum_quality_of_service) / SUM(total), 2),
+                {extremes}, NULL, NULL
+            FROM groups
+        """
+        no_extremes = 'NULL, NULL'
+        
+        if 'day' in group_by:
+            parts.append(aggregate_sql.format(
+                kind='day', keys='day, NULL, NULL',
+                extremes='ROUND(MIN(min_latency_ms), 2), ROUND(MAX(max_latency_ms), 2)'
+            ) + location_where + " GROUP BY day")
+        if 'city' in group_by:
+            parts.append(aggregate_sql.format(kind='city', keys='NULL, city, state', extremes=no_extremes) + state_where + " GROUP BY city, state")
+        if 'state' in group_by:
+            parts.append(aggregate_sql.format(kind='state', keys='NULL, NULL, state', extremes=no_extremes) + " GROUP BY state")
+        
+        sql = "WITH groups AS MATERIALIZED (" + groups_sql + ")" + " UNION ALL ".join(parts)
+        return sql, params
+    
+    @staticmethod
+    def _summary_progress(state_table: str, dirty_table: str):
+        """
+        Lê até onde (last_id) os sketches/digests cobrem a tabela diagnostics
+        
+        Retorna None se as tabelas não existem ou se há grupos aguardando
+        recálculo; nesses casos o chamador deve ler as linhas brutas.
+        """
+        if not DiagnosticsService._has_table(state_table):
+            return None
+        
+        progress = db.session.execute(db.text(f"""
+            SELECT
+                last_id,
+                (SELECT COALESCE(MAX(id), 0) FROM diagnostics) as max_id,
+                EXISTS (SELECT 1 FROM {dirty_table}) as dirty
+            FROM {state_table}
+        """)).fetchone()
+        
+        if progress is None or progress.dirty:
+            return None
+        
+        return progress
+    
+    @staticmethod
+    def _estimate_devices(filters: Filters, start_date: Optional[str], end_date: Optional[str]) -> Optional[int]:
+        """
+        Estima os dispositivos distintos combinando sketches HyperLogLog
+        
+        Sem filtro de localidade são combinados os sketches diários; com
+        filtro, os de (dia, estado, cidade). Linhas ainda não incorporadas
+        (id > last_id) são acrescentadas na hora. Retorna None se os sketches
+        não existem, há grupos aguardando recálculo após remoções ou há
+        filtros por dispositivo ou por métrica, que os sketches não separam.
+        """
+        if not only_locations(filters):
+            return None
+        
+        progress = DiagnosticsService._summary_progress('diagnostics_sketch_state', 'diagnostics_sketch_dirty')
+        if progress is None:
+            return None
+        
+        if filters:
+            table = 'diagnostics_location_device_sketch'
+        else:
+            table = 'diagnostics_daily_device_sketch'
+        
+        where, params = DiagnosticsService._build_filters(filters, start_date, end_date, date_column='day')
+        result = db.session.execute(db.text(f"SELECT registers FROM {table}" + where), params)
+        sketch = HyperLogLog.union(row.registers for row in result)
+        
+        if progress.max_id > progress.last_id:
+            where, params = DiagnosticsService._build_filters(filters, start_date, end_date)
+            params['last_id'] = progress.last_id
+            # Linhas acima de last_id ainda estão na partição corrente
+            result = db.session.execute(db.text("SELECT DISTINCT device_id FROM diagnostics" + where + " AND id > :last_id"), params)
+            for (device_id,) in result.fetchall():
+                sketch.add(device_id)
+        
+        return sketch.count()
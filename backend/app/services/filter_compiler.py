@@ -0,0 +1,133 @@
+"""
+Compilador dos filtros das consultas de diagnósticos
+
+Os filtros (condições de app.utils.filters e o intervalo de datas) viram a
+cláusula WHERE parametrizada de todas as leituras do DiagnosticsService. O
+texto do SQL depende só da forma dos filtros (campos, operadores, limites de
+data presentes e coluna de data), nunca dos valores: listas vão num único
+parâmetro JSON lido por json_each() e as localidades, pelos ids da dimensão
+(resolvidos por LocationService.resolve, recebido do DiagnosticsService).
+O mesmo texto se repete entre requisições, então o cache de instruções
+compiladas do SQLAlchemy e o de prepared statements do sqlite3 são
+reaproveitados.
+
+Os textos compilados ficam num LRU por forma (FILTER_PLAN_CACHE_SIZE
+entradas); os valores são convertidos em parâmetros a cada chamada.
+"""
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.utils.filters import FILTER_FIELDS, Filters, day_bound
+
+# Comparações dos operadores numéricos
+COMPARISONS = {'eq': '=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+# Forma de um filtro: (coluna de data, ((campo, operador), ...), início?, fim?)
+Shape = Tuple[str, Tuple[Tuple[str, str], ...], bool, bool]
+
+
+class FilterCompiler:
+    """Extensão Flask: filtros em SQL canônico, com cache dos planos por forma"""
+
+    def __init__(self, app=None):
+        self.max_plans = 256
+        self._plans: 'OrderedDict[Shape, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.max_plans = app.config.get('FILTER_PLAN_CACHE_SIZE', 256)
+        app.extensions['filter_compiler'] = self
+
+    @staticmethod
+    def _condition_sql(field: str, operator: str) -> str:
+        """SQL de uma condição; os parâmetros têm o nome do campo"""
+        kind = FILTER_FIELDS[field]
+
+        if kind == 'location':
+            # O filtro de estado vale para todas as cidades do estado
+            target, columns = ('state', 'state') if field == 'state' else ('(state, city)', 'state, city')
+            return f"{target} IN (SELECT {columns} FROM diagnostics_locations WHERE id IN (SELECT value FROM json_each(:{field})))"
+
+        if operator == 'in':
+            return f"{field} IN (SELECT value FROM json_each(:{field}))"
+
+        if operator == 'between':
+            return f"{field} BETWEEN :{field}_low AND :{field}_high"
+
+        return f"{field} {COMPARISONS[operator]} :{field}"
+
+    def plan(self, shape: Shape) -> str:
+        """Cláusula WHERE da forma de filtro (compilada uma vez por forma)"""
+        with self._lock:
+            where = self._plans.get(shape)
+            if where is not None:
+                self._plans.move_to_end(shape)
+                self._counters['hits'] += 1
+                return where
+
+        date_column, conditions, has_start, has_end = shape
+
+        where = " WHERE 1=1"
+        for field, operator in conditions:
+            where += " AND " + self._condition_sql(field, operator)
+
+        # Intervalo semiaberto sobre a coluna, que pode usar os índices de data
+        if has_start:
+            where += f" AND {date_column} >= :start_date"
+        if has_end:
+            where += f" AND {date_column} < :end_date"
+
+        with self._lock:
+            self._counters['misses'] += 1
+            self._plans[shape] = where
+            while len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+                self._counters['evictions'] += 1
+
+        return where
+
+    def compile(self, filters: Filters, resolve: Callable[[str, str, Tuple], List[int]], start_date: Optional[str] = None, end_date: Optional[str] = None, date_column: str = 'date') -> Tuple[str, Dict]:
+        """
+        Cláusula WHERE e parâmetros de uma leitura
+
+        Args:
+            filters: Condições (campo, operador, valores)
+            resolve: Ids das localidades de uma condição (campo, operador, valores)
+            start_date: Filtro opcional data inicial (formato: YYYY-MM-DD)
+            end_date: Filtro opcional data final (formato: YYYY-MM-DD)
+            date_column: Coluna de data ('date' nas linhas brutas, 'day' nos resumos)
+        """
+        shape = (date_column, tuple((field, operator) for field, operator, _ in filters), bool(start_date), bool(end_date))
+        params = {}
+
+        for field, operator, values in filters:
+            if FILTER_FIELDS[field] == 'location':
+                params[field] = json.dumps(resolve(field, operator, values))
+            elif operator == 'in':
+                params[field] = json.dumps(values)
+            elif operator == 'between':
+                params[f'{field}_low'], params[f'{field}_high'] = values
+            else:
+                params[field] = values[0]
+
+        if start_date:
+            params['start_date'] = day_bound(start_date)
+        if end_date:
+            params['end_date'] = day_bound(end_date, days=1)
+
+        return self.plan(shape), params
+
+    def stats(self) -> Dict:
+        """Acertos, falhas e remoções do cache de planos e a quantidade de formas"""
+        with self._lock:
+            counters = dict(self._counters, entries=len(self._plans), max_entries=self.max_plans)
+
+        lookups = counters['hits'] + counters['misses']
+        counters['hit_ratio'] = round(counters['hits'] / lookups, 4) if lookups else 0.0
+        return counters
@@ -0,0 +1,133 @@
+from app.extensions import db, cache, summaries
+from app.models import locations
+from app.models.schema import LOCATIONS_MERGE_SQL, ROLLUP_MERGE_SQL
+from app.services.summary_refresh import refresh_summaries
+from app.utils.validators import RequestValidator
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+
+INSERT_SQL = """
+    INSERT INTO diagnostics
+    (device_id, city, state, latency_ms, packet_loss, quality_of_service, date)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Tabela temporária da conexão, sem índices nem triggers, que recebe o lote
+# antes de um único INSERT ... SELECT em diagnostics
+STAGING_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS diagnostics_staging
+    (device_id, city, state, latency_ms, packet_loss, quality_of_service, date)
+"""
+
+STAGED_INSERT_SQL = """
+    INSERT INTO diagnostics
+    (device_id, city, state, latency_ms, packet_loss, quality_of_service, date)
+    SELECT device_id, city, state, latency_ms, packet_loss, quality_of_service, date
+    FROM temp.diagnostics_staging ORDER BY rowid
+"""
+
+
+def insert_rows(cursor, rows: Sequence[Tuple], chunk_size: int) -> int:
+    """
+    Insere diagnósticos já validados com executemany, em blocos
+
+    As linhas passam pela tabela temporária diagnostics_staging e entram em
+    diagnostics com um único INSERT ... SELECT: os triggers de inserção são
+    avaliados numa só instrução em vez de um executemany por linha. Os
+    triggers de rollup e de localidades por linha são suspensos durante o
+    lote e as linhas novas são acumuladas no rollup diário com um único GROUP
+    BY e registradas na dimensão de localidades, e as chaves de localidades
+    são atualizadas. Os sketches de dispositivos, os digests de métricas e as
+    médias móveis da detecção de anomalias ficam para refresh_summaries()
+    (app.services.summary_refresh). Não faz commit: o chamador controla a
+    transação.
+
+    Args:
+        cursor: Cursor DB-API da conexão
+        rows: Tuplas na ordem das colunas de INSERT_SQL
+        chunk_size: Quantidade de linhas por executemany
+    """
+    if not rows:
+        return 0
+
+    cursor.execute("UPDATE diagnostics_ingest_state SET defer_rollups = 1")
+    last_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM diagnostics").fetchone()[0]
+
+    cursor.execute(STAGING_SQL)
+    for start in range(0, len(rows), chunk_size):
+        cursor.executemany(
+            "INSERT INTO temp.diagnostics_staging VALUES (?, ?, ?, ?, ?, ?, ?)", rows[start:start + chunk_size]
+        )
+    cursor.execute(STAGED_INSERT_SQL)
+    cursor.execute("DELETE FROM temp.diagnostics_staging")
+
+    cursor.execute(ROLLUP_MERGE_SQL, (last_id,))
+    cursor.execute(LOCATIONS_MERGE_SQL, (last_id,))
+    cursor.execute("UPDATE diagnostics_ingest_state SET defer_rollups = 0")
+    locations.refresh(cursor)
+
+    return len(rows)
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterable[List[Any]]:
+    """Divide um iterável em listas de até size itens"""
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class IngestService:
+    """Serviço responsável pela gravação de diagnósticos"""
+
+    @staticmethod
+    def ingest(rows: Iterable[Any], chunk_size: int) -> Dict:
+        """
+        Valida e grava um lote de diagnósticos numa única transação
+
+        As linhas são consumidas em blocos de chunk_size, então um corpo
+        NDJSON pode ser gravado sem carregar o lote inteiro em memória.
+        Linhas inválidas são rejeitadas individualmente. Os resumos adiados
+        são atualizados conforme SUMMARY_REFRESH: no fim do lote, na mesma
+        transação ('inline'), ou depois do commit.
+
+        Args:
+            rows: Objetos recebidos (lista JSON ou linhas NDJSON decodificadas)
+            chunk_size: Linhas por bloco de validação e executemany
+        """
+        inserted = 0
+        received = 0
+        rejected = []
+
+        cursor = db.session.connection().connection.cursor()
+
+        try:
+            for chunk in chunked(rows, chunk_size):
+                valid, errors = RequestValidator.validate_diagnostic_rows(chunk, offset=received)
+                inserted += insert_rows(cursor, valid, chunk_size)
+                rejected.extend(errors)
+                received += len(chunk)
+
+            if inserted and summaries.mode == 'inline':
+                refresh_summaries(cursor)
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        if inserted:
+            cache.invalidate()
+            summaries.schedule()
+
+        return {
+            'received': received,
+            'inserted': inserted,
+            'rejected': len(rejected),
+            'errors': rejected
+        }
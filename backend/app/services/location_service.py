@@ -0,0 +1,96 @@
+from app.extensions import db, cache
+from app.models.locations import FIELDS, fold, trigrams
+from typing import Dict, List, Tuple
+
+
+class LocationService:
+    """Serviço responsável pela dimensão de localidades (estado, cidade)"""
+
+    @staticmethod
+    def _key(row, field: str) -> str:
+        """Chave de busca de field na linha (dobrada na hora se ainda pendente)"""
+        key = getattr(row, f'{field}_key')
+        return key if key is not None else fold(getattr(row, field))
+
+    @staticmethod
+    def _matching(field: str, key: str) -> List:
+        """
+        Localidades cuja chave de field contém key (já dobrada)
+
+        Os candidatos vêm do índice de trigramas: as localidades que têm
+        todos os trigramas de key, mais as ainda sem chaves. Abaixo de 3
+        caracteres, a dimensão inteira. A substring é conferida em cada um.
+        """
+        if field not in FIELDS:
+            raise ValueError(f"Campo de localidade inválido: {field}")
+
+        columns = "SELECT id, state, city, state_key, city_key FROM diagnostics_locations"
+        grams = sorted(trigrams(key))
+
+        if grams:
+            names = [f'trigram_{index}' for index in range(len(grams))]
+            params = dict(zip(names, grams), field=field, count=len(grams))
+            rows = db.session.execute(db.text(columns + """
+                WHERE id IN (
+                    SELECT location_id FROM diagnostics_location_trigrams
+                    WHERE field = :field AND trigram IN (""" + ", ".join(f':{name}' for name in names) + """)
+                    GROUP BY location_id HAVING COUNT(*) = :count
+                )
+            """), params).fetchall()
+            rows += db.session.execute(db.text(columns + " WHERE city_key IS NULL")).fetchall()
+        else:
+            rows = db.session.execute(db.text(columns)).fetchall()
+
+        return [row for row in rows if key in LocationService._key(row, field)]
+
+    @staticmethod
+    def resolve(field: str, operator: str, keys: Tuple[str, ...]) -> List[int]:
+        """
+        Ids das localidades que atendem a uma condição de localidade
+
+        Args:
+            field: 'city' ou 'state'
+            operator: 'contains' (substring de keys[0]), 'eq' ou 'in' (chave igual a uma de keys)
+            keys: Termos já dobrados por fold()
+        """
+        if operator == 'contains':
+            return sorted(row.id for row in LocationService._matching(field, keys[0]))
+
+        # Quem tem a chave igual ao termo também a contém
+        return sorted({
+            row.id
+            for key in keys
+            for row in LocationService._matching(field, key)
+            if LocationService._key(row, field) == key
+        })
+
+    @staticmethod
+    @cache.memoize('locations')
+    def search(q: str, limit: int) -> List[Dict]:
+        """
+        Autocompletar: localidades cuja cidade ou estado contém q
+
+        As cidades que começam com q vêm primeiro, depois as que têm q em
+        outra posição, e as encontradas só pelo estado por último; em cada
+        grupo, em ordem alfabética da cidade.
+
+        Args:
+            q: Termo digitado (sem diferenciar acentos nem maiúsculas)
+            limit: Quantidade máxima de localidades
+        """
+        key = fold(q)
+        found = {}
+
+        for field in FIELDS:
+            for row in LocationService._matching(field, key):
+                found.setdefault(row.id, row)
+
+        def rank(row):
+            city_key = LocationService._key(row, 'city')
+            position = 0 if city_key.startswith(key) else 1 if key in city_key else 2
+            return position, city_key, LocationService._key(row, 'state')
+
+        return [
+            {'id': row.id, 'city': row.city, 'state': row.state}
+            for row in sorted(found.values(), key=rank)[:limit]
+        ]
@@ -0,0 +1,547 @@
+"""
+Instrumentação do caminho das requisições
+
+Metrics registra, por processo:
+    - latência de cada endpoint (histograma) e requisições por status;
+    - onde o tempo de cada requisição foi gasto: verificação do token ('auth'),
+      SQL ('sql'), serialização JSON ('serialization'), compressão
+      ('compression') e o restante ('other': validação, montagem dos dicts de
+      resposta, ...). As duas fases do meio são medidas por serialization.py;
+    - tempo e linhas das consultas SQL, pelos eventos do SQLAlchemy, por
+      consulta (o namespace do cache de leituras em andamento ou, fora dele, o
+      endpoint) e formato (comando e tabelas). Os dois rótulos vêm do código,
+      não do texto das consultas, então a quantidade de séries é limitada. No
+      SQLite as linhas são produzidas durante o fetch, então as conexões
+      pysqlite usam um cursor que também mede fetchone/fetchmany/fetchall;
+    - consultas acima de SLOW_QUERY_MS, registradas no log com o texto da
+      consulta, os parâmetros e o endpoint.
+
+render() devolve tudo no formato texto do Prometheus (GET /api/metrics).
+
+Com vários workers (gunicorn), METRICS_MULTIPROC_DIR aponta um diretório
+compartilhado: cada processo grava ali o seu snapshot (<pid>.json) a cada
+METRICS_FLUSH_INTERVAL segundos e render() soma os de todos, então qualquer
+worker que atenda o scrape devolve os totais do servidor. Quando um worker
+sai, o mestre incorpora os contadores dele a archive.json (merge_process) e
+descarta os gauges. Sem o diretório, cada processo expõe só os seus números.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Limites (segundos) dos buckets dos histogramas
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PREFIX = 'net_diagnostics'
+
+# Tamanho máximo do texto da consulta no log de consultas lentas
+MAX_STATEMENT_LENGTH = 1000
+
+# Famílias expostas: nome -> (tipo, labels, descrição)
+FAMILIES = {
+    'http_requests_total': ('counter', ('endpoint', 'method', 'status'), 'Requisições atendidas por endpoint, método e status'),
+    'http_request_duration_seconds': ('histogram', ('endpoint',), 'Latência das requisições por endpoint'),
+    'http_request_phase_seconds_total': ('counter', ('endpoint', 'phase'), 'Tempo das requisições por fase (auth, sql, serialization, compression, other)'),
+    'sql_query_duration_seconds': ('histogram', ('query', 'shape'), 'Tempo de execução e leitura por consulta e formato'),
+    'sql_query_rows_total': ('counter', ('query', 'shape'), 'Linhas lidas ou alteradas por consulta e formato'),
+    'sql_slow_queries_total': ('counter', (), 'Consultas acima de SLOW_QUERY_MS'),
+    'single_flight_calls_total': ('counter', ('namespace', 'outcome'), 'Leituras por consulta: executadas, coalescidas, esperas e timeouts do single-flight'),
+    'single_flight_in_flight': ('gauge', (), 'Leituras em andamento registradas no single-flight (líderes)'),
+    'db_pool_checked_out': ('gauge', ('pool',), 'Conexões em uso por pool'),
+    'db_pool_checkouts_total': ('counter', ('pool',), 'Conexões retiradas de cada pool'),
+}
+
+# Contadores de processos encerrados, no diretório compartilhado
+ARCHIVE_FILE = 'archive.json'
+
+_TABLE_RE = re.compile(r'\b(?:FROM|JOIN|INTO|UPDATE)\s+([A-Za-z_][A-Za-z0-9_]*)', re.IGNORECASE)
+
+# Partições seladas (app.models.partitions.table_name): um único formato
+_PARTITION_RE = re.compile(r'^diagnostics_p\d{8}$')
+
+
+def statement_text(statement: str) -> str:
+    """Texto da consulta com espaços normalizados (os valores já vêm como parâmetros)"""
+    return ' '.join(statement.split())[:MAX_STATEMENT_LENGTH]
+
+
+def statement_shape(statement: str) -> str:
+    """
+    Formato da consulta: comando e tabelas lidas ou gravadas ('SELECT diagnostics,diagnostics_p*')
+
+    Filtros, listas IN e colunas variam sem mudar o formato; as partições
+    contam como uma tabela só.
+    """
+    words = statement.split(None, 2)
+    if not words:
+        return ''
+
+    command = words[0].upper()
+    if command == 'PRAGMA' and len(words) > 1:
+        return 'PRAGMA ' + re.split(r'[\s=(;]', words[1], 1)[0].lower()
+
+    tables = sorted({
+        'diagnostics_p*' if _PARTITION_RE.match(table) else table
+        for table in _TABLE_RE.findall(statement)
+    })
+    return f"{command} {','.join(tables)}" if tables else command
+
+
+@contextmanager
+def query_namespace(namespace: str):
+    """Rotula com namespace as consultas executadas no bloco (ResponseCache.memoize)"""
+    if not has_app_context():
+        yield
+        return
+
+    previous = g.get('metrics_query')
+    g.metrics_query = namespace
+    try:
+        yield
+    finally:
+        g.metrics_query = previous
+
+
+def record_phase(phase: str, seconds: float) -> None:
+    """Soma seconds à fase da requisição atual (sem requisição, não faz nada)"""
+    if has_request_context():
+        phases = g.setdefault('metrics_phases', {})
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+class Histogram:
+    """Histograma cumulativo com buckets fixos (sem lock: protegido por Metrics)"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def state(self) -> Tuple[list, int, float]:
+        """(contagens por bucket, total, soma), como nos snapshots"""
+        return list(self.counts), self.count, self.sum
+
+
+class QueryTiming:
+    """Execução de uma consulta ainda aberta: o fetch soma tempo e linhas"""
+
+    __slots__ = ('statement', 'labels', 'parameters', 'endpoint', 'seconds', 'rows', 'returns_rows')
+
+    def __init__(self, statement, labels, parameters, endpoint, seconds, rows, returns_rows):
+        self.statement = statement
+        self.labels = labels
+        self.parameters = parameters
+        self.endpoint = endpoint
+        self.seconds = seconds
+        self.rows = rows
+        self.returns_rows = returns_rows
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor sqlite3 que mede o fetch e conclui a medição ao fechar"""
+
+    metrics = None
+    timing: Optional[QueryTiming] = None
+
+    def _fetched(self, started: float, rows: int) -> None:
+        seconds = time.perf_counter() - started
+        record_phase('sql', seconds)
+        if self.timing is not None:
+            self.timing.seconds += seconds
+            self.timing.rows += rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def finish(self) -> None:
+        timing, self.timing = self.timing, None
+        if timing is not None and self.metrics is not None:
+            self.metrics.record_query(timing)
+
+    def close(self):
+        self.finish()
+        super().close()
+
+    def __del__(self):
+        # Resultados lidos só com fetchone não fecham o cursor explicitamente
+        self.finish()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _merge(total: Dict[str, Dict[Tuple, Any]], data: Dict[str, Dict[Tuple, Any]], gauges: bool = True) -> None:
+    """Soma as séries de data às de total (histogramas bucket a bucket)"""
+    for name, series in data.items():
+        kind = FAMILIES[name][0]
+        if kind == 'gauge' and not gauges:
+            continue
+
+        target = total.setdefault(name, {})
+        for labels, value in series.items():
+            current = target.get(labels)
+            if current is None:
+                target[labels] = value
+            elif kind == 'histogram':
+                target[labels] = ([a + b for a, b in zip(current[0], value[0])], current[1] + value[1], current[2] + value[2])
+            else:
+                target[labels] = current + value
+
+
+def _dump(path: str, data: Dict[str, Dict[Tuple, Any]]) -> None:
+    """Grava um snapshot de forma atômica (leitores veem o anterior ou o novo)"""
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump({name: [[list(labels), value] for labels, value in series.items()] for name, series in data.items()}, f)
+    os.replace(temporary, path)
+
+
+def _load(path: str) -> Dict[str, Dict[Tuple, Any]]:
+    """Snapshot gravado por _dump ({} se o arquivo não existe mais)"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            raw = json.load(f)
+    except FileNotFoundError:
+        return {}
+
+    return {name: {tuple(labels): value for labels, value in series} for name, series in raw.items() if name in FAMILIES}
+
+
+def clear_directory(directory: str) -> None:
+    """Prepara o diretório compartilhado, descartando snapshots de execuções anteriores"""
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith('.json') or name.endswith('.tmp'):
+            os.remove(os.path.join(directory, name))
+
+
+def merge_process(directory: str, pid: int) -> None:
+    """
+    Incorpora os contadores de um processo encerrado a archive.json
+
+    Chamado pelo mestre quando um worker sai: os totais não diminuem com a
+    reciclagem dos workers e os gauges do processo deixam de ser somados.
+    """
+    path = os.path.join(directory, f'{pid}.json')
+    data = _load(path)
+    if not data:
+        return
+
+    archive_path = os.path.join(directory, ARCHIVE_FILE)
+    archive = _load(archive_path)
+    _merge(archive, data, gauges=False)
+    _dump(archive_path, archive)
+    os.remove(path)
+
+
+class Metrics:
+    """Extensão Flask: histogramas de latência, tempo por fase e tempo de SQL"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.slow_query_seconds = 0.2
+        self.directory: Optional[str] = None
+        self.flush_interval = 1.0
+        self._next_flush = 0.0
+        self._timer: Optional[threading.Timer] = None
+        self._requests: Dict[Tuple, int] = {}
+        self._latency: Dict[Tuple, Histogram] = {}
+        self._phases: Dict[Tuple, float] = {}
+        self._queries: Dict[Tuple, Histogram] = {}
+        self._query_rows: Dict[Tuple, int] = {}
+        self._slow_queries = 0
+        self._lock = threading.Lock()
+        self._installed = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        """
+        Deve ser chamado logo depois de db.init_app(app): o before_request
+        precisa rodar antes do da autenticação e as conexões abertas pelas
+        demais extensões já devem ser instrumentadas
+        """
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        self.slow_query_seconds = app.config.get('SLOW_QUERY_MS', 200) / 1000
+        self.directory = app.config.get('METRICS_MULTIPROC_DIR') or None
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL', 1.0)
+        app.extensions['metrics'] = self
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+        if not self.enabled:
+            return
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+        if not self._installed:
+            # Em Engine: vale também para o pool de leitura e o engine do modo ASGI
+            event.listen(Engine, 'do_connect', self._on_connect)
+            event.listen(Engine, 'before_cursor_execute', self._before_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_execute)
+            self._installed = True
+
+    # Requisições
+
+    @staticmethod
+    def _start_request():
+        g.metrics_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+
+        seconds = time.perf_counter() - started
+        phases = g.pop('metrics_phases', {})
+        endpoint = request.endpoint or 'unmatched'
+        phases['other'] = max(seconds - sum(phases.values()), 0.0)
+
+        with self._lock:
+            key = (endpoint, request.method, response.status_code)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+            histogram = self._latency.get(endpoint)
+            if histogram is None:
+                histogram = self._latency[endpoint] = Histogram()
+            histogram.observe(seconds)
+
+            for phase, value in phases.items():
+                self._phases[(endpoint, phase)] = self._phases.get((endpoint, phase), 0.0) + value
+
+            flush, timer = self._schedule_flush()
+
+        if flush:
+            self.flush()
+        if timer is not None:
+            timer.start()
+
+        return response
+
+    def _schedule_flush(self) -> Tuple[bool, Optional[threading.Timer]]:
+        """
+        Publicar agora, ou ao fim do intervalo (com self._lock)
+
+        Um worker que fica ocioso logo depois de publicar ainda publica o que
+        atendeu depois disso, pelo timer.
+        """
+        if self.directory is None:
+            return False, None
+
+        now = time.monotonic()
+        if now >= self._next_flush:
+            self._next_flush = now + self.flush_interval
+            return True, None
+
+        if self._timer is not None:
+            return False, None
+
+        self._timer = threading.Timer(self._next_flush - now, self._deferred_flush, (current_app._get_current_object(),))
+        self._timer.daemon = True
+        return False, self._timer
+
+    def _deferred_flush(self, app) -> None:
+        with self._lock:
+            self._timer = None
+            self._next_flush = time.monotonic() + self.flush_interval
+
+        with app.app_context():
+            self.flush()
+
+    # SQL
+
+    @staticmethod
+    def _on_connect(dialect, connection_record, cargs, cparams):
+        # aiosqlite já lê todas as linhas dentro do execute
+        if dialect.name == 'sqlite' and dialect.driver == 'pysqlite':
+            cparams.setdefault('factory', InstrumentedConnection)
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        context.metrics_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, 'metrics_started', None)
+        if started is None:
+            return
+
+        seconds = time.perf_counter() - started
+        record_phase('sql', seconds)
+
+        endpoint = request.endpoint if has_request_context() else None
+        query = (g.get('metrics_query') if has_app_context() else None) or endpoint or 'other'
+        returns_rows = cursor.description is not None
+        rows = 0 if returns_rows else max(cursor.rowcount, 0)
+        timing = QueryTiming(statement, (query, statement_shape(statement)), parameters, endpoint, seconds, rows, returns_rows)
+
+        if returns_rows and isinstance(cursor, InstrumentedCursor):
+            cursor.finish()
+            cursor.metrics = self
+            cursor.timing = timing
+        else:
+            self.record_query(timing)
+
+    def record_query(self, timing: QueryTiming) -> None:
+        """Conclui a medição de uma consulta (chamado ao fechar o cursor)"""
+        with self._lock:
+            histogram = self._queries.get(timing.labels)
+            if histogram is None:
+                histogram = self._queries[timing.labels] = Histogram()
+            histogram.observe(timing.seconds)
+            self._query_rows[timing.labels] = self._query_rows.get(timing.labels, 0) + timing.rows
+
+            slow = timing.seconds >= self.slow_query_seconds
+            if slow:
+                self._slow_queries += 1
+
+        if slow:
+            logger.warning(
+                'Consulta lenta: %.1f ms, %d linhas, endpoint=%s, consulta=%s: %s parâmetros=%r',
+                timing.seconds * 1000, timing.rows, timing.endpoint, timing.labels[0],
+                statement_text(timing.statement), timing.parameters
+            )
+
+    # Exposição
+
+    def snapshot(self) -> Dict[str, Dict[Tuple, Any]]:
+        """Séries do processo (família -> labels -> valor), com single-flight e pools da aplicação atual"""
+        with self._lock:
+            data = {
+                'http_requests_total': dict(self._requests),
+                'http_request_duration_seconds': {(endpoint,): histogram.state() for endpoint, histogram in self._latency.items()},
+                'http_request_phase_seconds_total': dict(self._phases),
+                'sql_query_duration_seconds': {labels: histogram.state() for labels, histogram in self._queries.items()},
+                'sql_query_rows_total': dict(self._query_rows),
+                'sql_slow_queries_total': {(): self._slow_queries},
+            }
+
+        flights = current_app.extensions.get('single_flight') if has_app_context() else None
+        if flights is not None:
+            flight_stats = flights.stats()
+            data['single_flight_calls_total'] = {
+                (namespace, outcome): count
+                for namespace, counts in flight_stats['namespaces'].items()
+                for outcome, count in counts.items()
+            }
+            data['single_flight_in_flight'] = {(): flight_stats['in_flight']}
+
+        tuning = current_app.extensions.get('database_tuning') if has_app_context() else None
+        if tuning is not None and tuning.monitors:
+            pools = {name: monitor.stats() for name, monitor in tuning.monitors.items()}
+            data['db_pool_checked_out'] = {(name,): stats.get('checked_out', 0) for name, stats in pools.items()}
+            data['db_pool_checkouts_total'] = {(name,): stats['checkouts'] for name, stats in pools.items()}
+
+        return data
+
+    def flush(self) -> None:
+        """Publica o snapshot do processo no diretório compartilhado (se configurado)"""
+        if self.directory is not None:
+            _dump(os.path.join(self.directory, f'{os.getpid()}.json'), self.snapshot())
+
+    def after_fork(self) -> None:
+        """Chamado em cada worker criado por fork: os números herdados são do mestre"""
+        with self._lock:
+            self._requests.clear()
+            self._latency.clear()
+            self._phases.clear()
+            self._queries.clear()
+            self._query_rows.clear()
+            self._slow_queries = 0
+            self._next_flush = 0.0
+            self._timer = None
+
+    def collect(self) -> Dict[str, Dict[Tuple, Any]]:
+        """Séries do servidor: as do processo ou, com o diretório, a soma dos snapshots"""
+        if self.directory is None:
+            return self.snapshot()
+
+        self.flush()
+
+        total: Dict[str, Dict[Tuple, Any]] = {}
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith('.json'):
+                _merge(total, _load(os.path.join(self.directory, name)))
+        return total
+
+    def render(self) -> str:
+        """Métricas no formato texto de exposição do Prometheus"""
+        data = self.collect()
+        lines = []
+
+        for name, (kind, label_names, help_text) in FAMILIES.items():
+            series = data.get(name)
+            if series is None:
+                continue
+
+            lines.append(f'# HELP {PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {PREFIX}_{name} {kind}')
+
+            for labels, value in sorted(series.items()):
+                if kind != 'histogram':
+                    lines.append(f'{PREFIX}_{name}{_labels(label_names, labels)} {value}')
+                    continue
+
+                counts, count, total = value
+                cumulative = 0
+                for bound, bucket in zip(DEFAULT_BUCKETS, counts):
+                    cumulative += bucket
+                    le = 'le="%s"' % bound
+                    lines.append(f'{PREFIX}_{name}_bucket{_labels(label_names, labels, le)} {cumulative}')
+                le = 'le="+Inf"'
+                lines.append(f'{PREFIX}_{name}_bucket{_labels(label_names, labels, le)} {count}')
+                lines.append(f'{PREFIX}_{name}_sum{_labels(label_names, labels)} {total}')
+                lines.append(f'{PREFIX}_{name}_count{_labels(label_names, labels)} {count}')
+
+        return '\n'.join(lines) + '\n'
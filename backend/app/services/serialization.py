@@ -0,0 +1,177 @@
+"""
+Serialização e compressão das respostas
+
+ResponseSerialization instala:
+    - FastJSONProvider: o provider JSON do Flask sobre o orjson, com a mesma
+      saída do padrão (chaves ordenadas, indentação no modo debug, datas no
+      formato HTTP) e a leitura dos corpos JSON e NDJSON; o tempo de saída
+      entra na fase 'serialization' das métricas;
+    - compressão gzip ou brotli (pacote opcional `brotli`) negociada pelo
+      Accept-Encoding, para corpos a partir de COMPRESS_MIN_SIZE bytes. Respostas
+      em streaming (exportação) e já codificadas ficam como estão.
+
+to_columnar() monta o formato `format=columnar` das listagens: um array por
+campo em vez de uma lista de objetos, sem repetir os nomes a cada linha.
+"""
+import gzip
+import time
+from typing import Dict, List
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+from app.services.metrics import record_phase
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência listada em requirements.txt
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_ENGINES = ('orjson', 'default')
+
+# Tipos de conteúdo comprimidos (os demais, como imagens, já são compactos)
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/csv', 'text/plain')
+
+
+def to_columnar(rows: List[Dict]) -> Dict[str, List]:
+    """Converte uma lista de dicts com os mesmos campos em {campo: [valores]}"""
+    if not rows:
+        return {}
+    return {field: [row[field] for row in rows] for field in rows[0]}
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Provider JSON sobre o orjson
+
+    Tipos que o orjson não serializa (Decimal, objetos com __html__) e datas,
+    que o Flask formata como data HTTP, passam pelo default do Flask. Na
+    leitura, NaN e Infinity, que não são JSON válido, tornam o documento
+    inválido.
+    """
+
+    def _options(self, indent: bool = False) -> int:
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            # Opções do json da biblioteca padrão (indent, separators, ...) seguem por ele
+            if kwargs:
+                return super().dumps(obj, **kwargs)
+            return orjson.dumps(obj, default=self.default, option=self._options()).decode('utf-8')
+        finally:
+            record_phase('serialization', time.perf_counter() - started)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+
+        started = time.perf_counter()
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent) | orjson.OPT_APPEND_NEWLINE)
+        record_phase('serialization', time.perf_counter() - started)
+
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Provider JSON padrão do Flask, com o tempo de dumps na fase 'serialization'"""
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            record_phase('serialization', time.perf_counter() - started)
+
+
+class ResponseSerialization:
+    """Extensão Flask: provider JSON e compressão das respostas"""
+
+    def __init__(self, app=None):
+        self.compress = False
+        self.min_size = 1024
+        self.gzip_level = 6
+        self.brotli_quality = 5
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        """Deve ser chamado depois de metrics.init_app(app), para que a compressão seja medida"""
+        engine = app.config.get('JSON_ENGINE', 'orjson')
+
+        if engine not in JSON_ENGINES:
+            raise ValueError(f"Motor JSON inválido: {engine}")
+
+        if engine == 'orjson' and orjson is None:
+            raise RuntimeError("JSON_ENGINE='orjson' requer o pacote orjson")
+
+        app.json = FastJSONProvider(app) if engine == 'orjson' else TimedJSONProvider(app)
+
+        self.compress = app.config.get('COMPRESS_ENABLED', True)
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+        self.gzip_level = app.config.get('COMPRESS_LEVEL', 6)
+        self.brotli_quality = app.config.get('COMPRESS_BROTLI_QUALITY', 5)
+
+        if self.compress:
+            app.after_request(self._compress)
+
+        app.extensions['response_serialization'] = self
+
+    @staticmethod
+    def _encoding() -> str:
+        """Melhor codificação aceita pelo cliente ('br', 'gzip' ou 'identity')"""
+        accepted = request.accept_encodings
+        candidates = [('br', accepted['br']), ('gzip', accepted['gzip'])] if brotli is not None else [('gzip', accepted['gzip'])]
+        encoding, quality = max(candidates, key=lambda candidate: candidate[1])
+        return encoding if quality > 0 else 'identity'
+
+    def _compress(self, response):
+        # O 304 repete o Vary que a resposta 200 teria
+        if response.status_code == 304:
+            response.vary.add('Accept-Encoding')
+            return response
+
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+                or response.status_code == 204 or 'Content-Encoding' in response.headers):
+            return response
+
+        body = response.get_data()
+        if len(body) < self.min_size:
+            return response
+
+        encoding = self._encoding()
+        if encoding == 'identity':
+            return response
+
+        started = time.perf_counter()
+        if encoding == 'br':
+            body = brotli.compress(body, quality=self.brotli_quality)
+        else:
+            body = gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+        record_phase('compression', time.perf_counter() - started)
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,284 @@
+"""
+Coalescência de leituras idênticas em andamento (single-flight)
+
+SingleFlight.do(namespace, key, func) executa func uma vez por chave entre as
+chamadas simultâneas do processo: a primeira (líder) calcula e as que chegam
+enquanto ela roda esperam e recebem o mesmo resultado (ou a mesma exceção).
+Terminada a chamada, a chave sai do registro; reaproveitar o resultado depois
+disso é papel do cache de leituras (ResponseCache.memoize chama do() nas
+falhas de cache, com a mesma chave normalizada).
+
+Entre processos (vários workers), SINGLE_FLIGHT_LOCK_PATH ativa um arquivo de
+lock: antes de calcular, o líder trava com fcntl.lockf o byte do arquivo
+escolhido pelo hash da chave. Quem precisou esperar o lock consulta de novo o
+cache (recheck) antes de calcular, então com CACHE_BACKEND='sqlite' a leitura
+roda uma vez entre todos os workers. Os locks POSIX são do processo: duas
+threads do mesmo processo com chaves diferentes no mesmo byte "obteriam" o
+lock juntas. Por isso cada byte é antes reservado no próprio processo
+(self._slots, sob self._lock) e só então travado no arquivo. fcntl só existe
+em sistemas POSIX; sem ele, a coalescência fica restrita a cada processo.
+
+No modo ASGI (app.asgi) as views rodam em greenlets de
+AsyncConnection.run_sync(), todas na thread do event loop: esperar num
+threading.Event travaria o loop, e com ele o líder. Nesse caso as esperas
+(pelo líder e entre tentativas do lock) são corrotinas aguardadas pela ponte
+do SQLAlchemy (await_only), e o loop segue atendendo o líder e as demais
+requisições.
+
+A espera, pelo líder do processo ou pelo lock, vai até SINGLE_FLIGHT_TIMEOUT
+segundos; depois disso a chamada calcula por conta própria.
+"""
+import asyncio
+import os
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+try:
+    from greenlet import getcurrent
+    from sqlalchemy.util import await_only
+except ImportError:  # pragma: no cover - sem greenlet não há modo ASGI
+    getcurrent = None
+
+# Bytes do arquivo de lock: um por faixa de hash das chaves
+LOCK_SLOTS = 1 << 20
+
+# Intervalo máximo (segundos) entre tentativas de obter o lock do arquivo
+LOCK_POLL_INTERVAL = 0.05
+
+# Contadores por namespace
+OUTCOMES = ('executed', 'coalesced', 'timeouts', 'lock_waits', 'shared')
+
+
+def _in_event_loop() -> bool:
+    """
+    Se a chamada roda num greenlet de greenlet_spawn sobre um event loop (modo ASGI)
+
+    Na thread do loop, código síncrono só roda dentro de greenlet_spawn, que
+    cria um greenlet filho do que dirige o loop.
+    """
+    if getcurrent is None or getcurrent().parent is None:
+        return False
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class _Call:
+    """Chamada em andamento: o líder publica o resultado e sinaliza done (e os waiters do event loop)"""
+
+    __slots__ = ('done', 'value', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error: Optional[Exception] = None
+        self.waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+
+class SingleFlight:
+    """Extensão Flask: coalescência de chamadas idênticas simultâneas"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.timeout = 30.0
+        self.lock_path: Optional[str] = None
+        self._lock_fd: Optional[int] = None
+        self._calls: Dict[str, _Call] = {}
+        self._slots: Set[int] = set()
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, str], int] = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.enabled = app.config.get('SINGLE_FLIGHT_ENABLED', True)
+        self.timeout = app.config.get('SINGLE_FLIGHT_TIMEOUT', 30)
+        self.lock_path = app.config.get('SINGLE_FLIGHT_LOCK_PATH') or None
+
+        if fcntl is None:
+            self.lock_path = None
+
+        app.extensions['single_flight'] = self
+
+    def _count(self, namespace: str, outcome: str) -> None:
+        with self._lock:
+            self._counters[namespace, outcome] = self._counters.get((namespace, outcome), 0) + 1
+
+    def do(self, namespace: str, key: str, func: Callable[[], Any], recheck: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Retorna func(), executada uma vez entre as chamadas simultâneas com a mesma chave
+
+        Args:
+            namespace: Consulta (rótulo das métricas)
+            key: Chave normalizada dos argumentos
+            func: Cálculo do resultado
+            recheck: Consulta ao cache compartilhado depois de esperar o lock
+                     entre processos (None se ainda não há resultado)
+        """
+        if not self.enabled:
+            return func()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not self._wait(call):
+                self._count(namespace, 'timeouts')
+                return func()
+
+            self._count(namespace, 'coalesced')
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = self._run(namespace, key, func, recheck)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                call.done.set()
+                waiters, call.waiters = call.waiters, []
+
+            for loop, future in waiters:
+                loop.call_soon_threadsafe(_resolve, future)
+
+        return call.value
+
+    def _wait(self, call: _Call) -> bool:
+        """Espera o líder até self.timeout sem travar o event loop; retorna se ele terminou"""
+        if not _in_event_loop():
+            return call.done.wait(self.timeout)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        with self._lock:
+            if call.done.is_set():
+                return True
+            call.waiters.append((loop, future))
+
+        try:
+            await_only(asyncio.wait_for(future, self.timeout))
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    @staticmethod
+    def _sleep(seconds: float) -> None:
+        if _in_event_loop():
+            await_only(asyncio.sleep(seconds))
+        else:
+            time.sleep(seconds)
+
+    def _run(self, namespace: str, key: str, func: Callable[[], Any], recheck: Optional[Callable[[], Any]]) -> Any:
+        """Executa func sob o lock do arquivo (se configurado), como líder do processo"""
+        if not self.lock_path:
+            self._count(namespace, 'executed')
+            return func()
+
+        slot = zlib.crc32(key.encode('utf-8')) % LOCK_SLOTS
+        acquired, waited = self._acquire(slot)
+
+        try:
+            if waited:
+                self._count(namespace, 'lock_waits')
+
+                if recheck is not None:
+                    value = recheck()
+                    if value is not None:
+                        self._count(namespace, 'shared')
+                        return value
+
+            self._count(namespace, 'executed')
+            return func()
+        finally:
+            if acquired:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, slot)
+                with self._lock:
+                    self._slots.discard(slot)
+
+    def _try_lock(self, slot: int) -> bool:
+        """Reserva o byte slot no processo e então o trava no arquivo, sem esperar"""
+        with self._lock:
+            if slot in self._slots:
+                return False
+            self._slots.add(slot)
+
+        try:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, slot)
+            return True
+        except OSError:
+            with self._lock:
+                self._slots.discard(slot)
+            return False
+
+    def _acquire(self, slot: int) -> Tuple[bool, bool]:
+        """
+        Trava o byte slot do arquivo de lock, esperando até self.timeout
+
+        A espera é por tentativas: uma thread, ou um greenlet do event loop,
+        nunca fica bloqueada dentro de um lock.
+
+        Retorna (obtido, esperou).
+        """
+        with self._lock:
+            if self._lock_fd is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+                self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        deadline = time.monotonic() + self.timeout
+        interval = 0.001
+        waited = False
+
+        while True:
+            if self._try_lock(slot):
+                return True, waited
+            if time.monotonic() >= deadline:
+                return False, True
+
+            waited = True
+            self._sleep(interval)
+            interval = min(interval * 2, LOCK_POLL_INTERVAL)
+
+    def stats(self) -> Dict:
+        """Totais e contadores por namespace, chamadas em andamento e a fração coalescida"""
+        with self._lock:
+            counters = dict(self._counters)
+            in_flight = len(self._calls)
+
+        namespaces: Dict[str, Dict[str, int]] = {}
+        for (namespace, outcome), count in sorted(counters.items()):
+            namespaces.setdefault(namespace, dict.fromkeys(OUTCOMES, 0))[outcome] = count
+
+        totals = {outcome: sum(counts[outcome] for counts in namespaces.values()) for outcome in OUTCOMES}
+        calls = totals['executed'] + totals['coalesced'] + totals['shared'] + totals['timeouts']
+        saved = totals['coalesced'] + totals['shared']
+
+        return dict(
+            totals,
+            in_flight=in_flight,
+            coalesced_ratio=round(saved / calls, 4) if calls else 0.0,
+            cross_process=bool(self.lock_path),
+            namespaces=namespaces,
+        )
@@ -0,0 +1,138 @@
+"""
+Atualização adiada dos resumos incrementais
+
+A gravação em lote (insert_rows) insere as linhas, acumula o rollup diário e
+registra as localidades na mesma transação. Os resumos que custam trabalho
+em Python por linha (DEFERRED: os sketches de dispositivos, os digests de
+métricas e as médias móveis da detecção de anomalias) ficam para depois do
+commit. As leituras combinam o que está gravado com as linhas ainda não
+incorporadas (id > last_id): o resultado é o mesmo antes e depois da
+atualização, então o ETag e o cache, chaveados pela versão dos dados,
+continuam válidos.
+
+SUMMARY_REFRESH escolhe quando atualizar:
+
+    - 'background' (padrão): numa thread do processo, SUMMARY_REFRESH_DELAY
+      segundos depois da gravação, em transação própria; os lotes gravados
+      nesse intervalo são incorporados juntos;
+    - 'inline': uma vez por lote, dentro da transação da gravação;
+    - 'manual': só por `flask refresh-summaries` (ex.: agendado no cron).
+
+A atualização abre a transação com BEGIN IMMEDIATE: entre workers, uma
+espera a outra e encontra as linhas já incorporadas.
+"""
+import threading
+from typing import Dict, Optional
+
+from flask import current_app
+
+from app.models import anomalies, device_sketches, metric_digests
+
+MODES = ('background', 'inline', 'manual')
+
+# Resumos atualizados fora da gravação em lote, na ordem de atualização
+DEFERRED = {
+    'device_sketches': device_sketches,
+    'metric_digests': metric_digests,
+    'anomalies': anomalies,
+}
+
+
+def refresh_summaries(cursor) -> Dict[str, int]:
+    """
+    Alcança os resumos adiados até o maior id gravado
+
+    Não faz commit: o chamador controla a transação.
+
+    Retorna {resumo: linhas novas incorporadas}.
+    """
+    return {name: module.refresh(cursor) for name, module in DEFERRED.items()}
+
+
+class SummaryRefresher:
+    """Extensão Flask: atualiza os resumos adiados depois das gravações em lote"""
+
+    def __init__(self, app=None):
+        self.mode = 'background'
+        self.delay = 1.0
+        self._timer: Optional[threading.Timer] = None
+        self._running = False
+        self._again = False
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        mode = app.config.get('SUMMARY_REFRESH', 'background')
+        if mode not in MODES:
+            raise ValueError(f"SUMMARY_REFRESH inválido: {mode}")
+
+        self.mode = mode
+        self.delay = app.config.get('SUMMARY_REFRESH_DELAY', 1.0)
+        app.extensions['summary_refresh'] = self
+
+    def after_fork(self) -> None:
+        """Worker recém-criado: o timer e o lock do mestre não vieram com o fork"""
+        self._timer = None
+        self._running = False
+        self._again = False
+        self._lock = threading.Lock()
+
+    def run(self) -> Dict[str, int]:
+        """Atualiza os resumos adiados numa transação própria; retorna {resumo: linhas incorporadas}"""
+        conn = current_app.extensions['sqlalchemy'].engine.raw_connection()
+        try:
+            cursor = conn.driver_connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                result = refresh_summaries(cursor)
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            return result
+        finally:
+            conn.close()
+
+    def schedule(self, app=None) -> None:
+        """
+        Gravação confirmada: agenda a atualização (modo 'background')
+
+        Com um timer pendente não agenda outro, e ele incorpora também este
+        lote; durante uma atualização, agenda a próxima para quando ela acabar.
+        """
+        if self.mode != 'background':
+            return
+
+        app = app or current_app._get_current_object()
+
+        with self._lock:
+            if self._running:
+                self._again = True
+                return
+            if self._timer is not None:
+                return
+
+            self._timer = timer = threading.Timer(self.delay, self._deferred_run, (app,))
+            timer.daemon = True
+
+        timer.start()
+
+    def _deferred_run(self, app) -> None:
+        with self._lock:
+            self._timer = None
+            self._running = True
+
+        try:
+            with app.app_context():
+                self.run()
+        except Exception:
+            app.logger.exception('Erro ao atualizar os resumos adiados')
+        finally:
+            with self._lock:
+                self._running = False
+                again, self._again = self._again, False
+
+        if again:
+            self.schedule(app)
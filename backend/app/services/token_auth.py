@@ -0,0 +1,181 @@
+"""
+Autenticação JWT centralizada
+
+Um único before_request verifica o token de todas as rotas, exceto as
+marcadas com @auth.public. Tokens já verificados ficam num LRU limitado,
+indexado pelo SHA-256 do token e válido até o `exp` do próprio token (ou
+AUTH_CACHE_TTL, o que vier antes), então o polling do dashboard não refaz a
+verificação HMAC a cada requisição.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+import jwt
+from flask import current_app, g, request
+
+from app.services.metrics import record_phase
+
+
+# Motivos de recusa: código -> mensagem devolvida com o 401
+REASONS = {
+    'missing': 'Token is missing',
+    'expired': 'Token has expired',
+    'invalid': 'Invalid token',
+}
+
+
+class AuthError(Exception):
+    """Token recusado; reason é uma das chaves de REASONS"""
+
+    def __init__(self, reason: str):
+        super().__init__(REASONS[reason])
+        self.reason = reason
+
+
+class TokenCache:
+    """LRU de claims já verificados, com expiração pelo `exp` do token"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[bytes, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: bytes) -> Optional[Dict]:
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+
+            if entry[0] <= now:
+                del self._entries[digest]
+                return None
+
+            self._entries.move_to_end(digest)
+            return entry[1]
+
+    def set(self, digest: bytes, claims: Dict) -> None:
+        expires_at = time.time() + self.ttl
+        if isinstance(claims.get('exp'), (int, float)):
+            expires_at = min(expires_at, claims['exp'])
+
+        with self._lock:
+            self._entries[digest] = (expires_at, claims)
+            self._entries.move_to_end(digest)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class TokenAuth:
+    """Extensão Flask que protege todas as rotas registradas na aplicação"""
+
+    def __init__(self, app=None):
+        self.secret = None
+        self.cache = TokenCache()
+        self._counters = {'requests': 0, 'hits': 0, 'verifications': 0, 'verification_seconds': 0.0}
+        self._rejections = {reason: 0 for reason in REASONS}
+        self._counters_lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.secret = app.config['SECRET_KEY']
+        self.cache = TokenCache(app.config.get('AUTH_CACHE_MAX_ENTRIES', 1024), app.config.get('AUTH_CACHE_TTL', 300))
+
+        app.before_request(self._authenticate)
+        app.extensions['token_auth'] = self
+
+    @staticmethod
+    def public(view: Callable) -> Callable:
+        """Decorator que libera a rota da verificação de token"""
+        view.auth_public = True
+        return view
+
+    def _count(self, counter: str, amount=1) -> None:
+        with self._counters_lock:
+            self._counters[counter] += amount
+
+    def _authenticate(self):
+        # Pré-requisições CORS e rotas inexistentes (404) não levam token
+        if request.method == 'OPTIONS' or request.endpoint is None:
+            return None
+
+        view = current_app.view_functions.get(request.endpoint)
+        if getattr(view, 'auth_public', False):
+            return None
+
+        started = time.perf_counter()
+        try:
+            g.auth_claims = self.verify(request.headers.get('Authorization'))
+        except AuthError as e:
+            with self._counters_lock:
+                self._rejections[e.reason] += 1
+            return {'message': str(e), 'reason': e.reason}, 401
+        finally:
+            record_phase('auth', time.perf_counter() - started)
+
+        return None
+
+    def verify(self, header: Optional[str]) -> Dict:
+        """
+        Verifica o token do header Authorization ('Bearer <token>' ou o token puro)
+
+        Retorna os claims do token; levanta AuthError com o motivo da recusa.
+        """
+        self._count('requests')
+
+        if not header:
+            raise AuthError('missing')
+
+        token = header[7:] if header.startswith('Bearer ') else header
+        if not token:
+            raise AuthError('missing')
+
+        digest = hashlib.sha256(token.encode('utf-8')).digest()
+        claims = self.cache.get(digest)
+        if claims is not None:
+            self._count('hits')
+            return claims
+
+        started = time.perf_counter()
+        try:
+            claims = jwt.decode(token, self.secret, algorithms=['HS256'])
+        except jwt.ExpiredSignatureError:
+            raise AuthError('expired')
+        except jwt.InvalidTokenError:
+            raise AuthError('invalid')
+        finally:
+            with self._counters_lock:
+                self._counters['verifications'] += 1
+                self._counters['verification_seconds'] += time.perf_counter() - started
+
+        self.cache.set(digest, claims)
+        return claims
+
+    def stats(self) -> Dict:
+        """Contadores do processo atual: acertos do cache, verificações e recusas"""
+        with self._counters_lock:
+            counters = dict(self._counters)
+            rejections = dict(self._rejections)
+
+        seconds = counters.pop('verification_seconds')
+        counters['hit_ratio'] = round(counters['hits'] / counters['requests'], 4) if counters['requests'] else 0.0
+        counters['avg_verification_ms'] = round(seconds * 1000 / counters['verifications'], 4) if counters['verifications'] else 0.0
+        counters['rejections'] = rejections
+        counters['entries'] = len(self.cache)
+        return counters
@@ -0,0 +1,121 @@
+"""
+Linguagem de filtros das leituras de diagnósticos
+
+Cada campo filtrável é um parâmetro da query string cujo valor é uma
+expressão 'operador:valor' (sem operador, vale o padrão do campo):
+
+    city=salv                    cidade contém 'salv' (sem acentos nem maiúsculas)
+    city=in:Salvador,Recife      cidade é uma das listadas
+    state=eq:BA                  estado é exatamente BA
+    device_id=in:DEV001,DEV002   dispositivo é um dos listados
+    latency_ms=gt:60             latência acima de 60 ms
+    packet_loss=between:1,5      perda entre 1% e 5% (inclusive)
+
+parse() transforma uma expressão numa condição (campo, operador, valores):
+uma tupla imutável, usada como está nas chaves de cache e no compilador de
+filtros (app.services.filter_compiler). Os termos de localidade já vêm
+dobrados por fold(), como a dimensão de localidades os compara.
+"""
+import math
+from datetime import date, timedelta
+from typing import Tuple
+
+from app.models.locations import fold
+
+# Campos filtráveis, na ordem das condições: campo -> tipo
+FILTER_FIELDS = {
+    'city': 'location',
+    'state': 'location',
+    'device_id': 'text',
+    'latency_ms': 'number',
+    'packet_loss': 'number',
+    'quality_of_service': 'number',
+}
+
+# Operadores aceitos por tipo; o primeiro é o padrão, sem prefixo
+OPERATORS = {
+    'location': ('contains', 'eq', 'in'),
+    'text': ('eq', 'in'),
+    'number': ('eq', 'gt', 'gte', 'lt', 'lte', 'between'),
+}
+
+# Operadores com lista de valores separados por vírgula
+LIST_OPERATORS = ('in', 'between')
+
+# Valores máximos de uma lista
+MAX_VALUES = 50
+
+Condition = Tuple[str, str, Tuple]
+
+Filters = Tuple[Condition, ...]
+
+
+def parse(field: str, expression: str) -> Condition:
+    """
+    Condição (campo, operador, valores) de uma expressão de filtro
+
+    Lança ValueError, com a mensagem para o cliente, se a expressão é inválida.
+    """
+    kind = FILTER_FIELDS[field]
+    operator, separator, rest = expression.partition(':')
+
+    if separator and operator in OPERATORS[kind]:
+        expression = rest
+    else:
+        operator = OPERATORS[kind][0]
+
+    if operator in LIST_OPERATORS:
+        values = tuple(value.strip() for value in expression.split(','))
+    else:
+        values = (expression.strip(),)
+
+    if not all(values):
+        raise ValueError(f"O parâmetro '{field}' tem valores vazios")
+    if len(values) > MAX_VALUES:
+        raise ValueError(f"O parâmetro '{field}' aceita no máximo {MAX_VALUES} valores")
+    if operator == 'between' and len(values) != 2:
+        raise ValueError(f"O operador 'between' de '{field}' requer dois valores (ex.: between:1,5)")
+
+    if kind == 'location':
+        values = tuple(dict.fromkeys(fold(value) for value in values))
+    elif kind == 'number':
+        values = tuple(_number(field, value) for value in values)
+        if operator == 'between' and values[0] > values[1]:
+            raise ValueError(f"O intervalo de '{field}' deve ser crescente (between:mínimo,máximo)")
+    elif operator == 'in':
+        values = tuple(dict.fromkeys(values))
+
+    return field, operator, values
+
+
+def _number(field: str, value: str) -> float:
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"O parâmetro '{field}' deve ser numérico")
+
+    if not math.isfinite(number):
+        raise ValueError(f"O parâmetro '{field}' deve ser um número finito")
+
+    return number
+
+
+def day_bound(value: str, days: int = 0) -> str:
+    """Retorna o dia (YYYY-MM-DD) de value deslocado de days dias"""
+    return (date.fromisoformat(value[:10]) + timedelta(days=days)).isoformat()
+
+
+def without(filters: Filters, *fields: str) -> Filters:
+    """filters sem as condições dos campos informados"""
+    return tuple(item for item in filters if item[0] not in fields)
+
+
+def location_filters(filters: Filters) -> Filters:
+    """Só as condições de localidade de filters"""
+    return tuple(item for item in filters if FILTER_FIELDS[item[0]] == 'location')
+
+
+def only_locations(filters: Filters) -> bool:
+    """Indica se todas as condições são de localidade (chaves dos resumos por dia)"""
+    return location_filters(filters) == filters
+
@@ -0,0 +1,80 @@
+"""
+HyperLogLog para contagem aproximada de valores distintos
+
+Cada sketch tem 2^PRECISION registradores de um byte. Sketches são
+combináveis (máximo registrador a registrador), então contagens por dia podem
+ser somadas em qualquer intervalo sem reler as linhas. O erro padrão relativo
+é 1.04 / sqrt(2^PRECISION), cerca de 1,6% com PRECISION = 12. Até
+2,5 × 2^PRECISION (~10 mil) valores a estimativa usa linear counting, quase
+exata em poucas centenas; perto dessa transição o erro chega a ~3%.
+"""
+import hashlib
+import math
+from typing import Iterable, Optional, Tuple
+
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+STANDARD_ERROR = 1.04 / math.sqrt(REGISTERS)
+
+_HASH_BITS = 64
+_RANK_BITS = _HASH_BITS - PRECISION
+_RANK_MASK = (1 << _RANK_BITS) - 1
+_ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(_RANK_BITS + 2)]
+
+
+def position(value: str) -> Tuple[int, int]:
+    """
+    Retorna (registrador, rank) de um valor
+
+    O hash é estável entre processos (blake2b), ao contrário de hash().
+    """
+    digest = int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+    return digest >> _RANK_BITS, _RANK_BITS - (digest & _RANK_MASK).bit_length() + 1
+
+
+class HyperLogLog:
+    """Sketch HyperLogLog com registradores densos"""
+
+    __slots__ = ('registers',)
+
+    def __init__(self, registers: Optional[bytes] = None):
+        if registers is not None and len(registers) != REGISTERS:
+            raise ValueError(f'Sketch com {len(registers)} registradores; esperado {REGISTERS}')
+
+        self.registers = bytearray(registers) if registers is not None else bytearray(REGISTERS)
+
+    def add(self, value: str) -> None:
+        self.add_position(*position(value))
+
+    def add_position(self, index: int, rank: int) -> None:
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    @classmethod
+    def union(cls, sketches: Iterable[bytes]) -> 'HyperLogLog':
+        """Combina vários sketches serializados numa única passada"""
+        sketches = list(sketches)
+
+        if not sketches:
+            return cls()
+
+        if len(sketches) == 1:
+            return cls(sketches[0])
+
+        return cls(bytes(map(max, *sketches)))
+
+    def count(self) -> int:
+        zeros = self.registers.count(0)
+        estimate = _ALPHA * REGISTERS * REGISTERS / math.fsum(map(_INVERSE_POWERS.__getitem__, self.registers))
+
+        if estimate <= 2.5 * REGISTERS and zeros:
+            estimate = REGISTERS * math.log(REGISTERS / zeros)
+
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
@@ -0,0 +1,47 @@
+import base64
+import json
+from typing import Optional, Tuple
+
+from app.utils.validators import ValidationError
+
+
+CURSOR_NEXT = 'next'
+CURSOR_PREV = 'prev'
+
+
+def encode_cursor(date: str, diagnostic_id: int, direction: str) -> str:
+    """
+    Gera um cursor opaco a partir da chave de ordenação (date, id)
+
+    Args:
+        date: Data do registro de referência
+        diagnostic_id: ID do registro de referência
+        direction: Direção da navegação ('next' ou 'prev')
+    """
+    payload = json.dumps([str(date), int(diagnostic_id), direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[str, int, str]]:
+    """
+    Decodifica um cursor gerado por encode_cursor
+
+    Args:
+        cursor: Cursor opaco recebido na requisição
+    """
+    if cursor is None or cursor.strip() == '':
+        return None
+
+    try:
+        padded = cursor.strip() + '=' * (-len(cursor.strip()) % 4)
+        date, diagnostic_id, direction = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValidationError("O parâmetro 'cursor' é inválido")
+
+    if not isinstance(date, str) or not isinstance(diagnostic_id, int) or isinstance(diagnostic_id, bool):
+        raise ValidationError("O parâmetro 'cursor' é inválido")
+
+    if direction not in (CURSOR_NEXT, CURSOR_PREV):
+        raise ValidationError("O parâmetro 'cursor' é inválido")
+
+    return date, diagnostic_id, direction
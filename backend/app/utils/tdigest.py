@@ -0,0 +1,174 @@
+"""
+t-digest para estimativa de percentis
+
+Um digest resume uma distribuição em cerca de COMPRESSION / 2 centróides
+(média, peso), mais finos nas caudas, e pode ser combinado com outros
+digests. O erro de rank dos percentis fica abaixo de ~0,5% (menor nas
+caudas); grupos pequenos (até ~100 valores) guardam os próprios valores e o
+resultado coincide com o exato.
+"""
+import math
+from array import array
+from typing import Iterable, List, Optional, Tuple
+
+COMPRESSION = 200
+
+# Valores acumulados antes de cada compressão
+_BUFFER_SIZE = 5 * COMPRESSION
+
+
+def _scale(q: float) -> float:
+    """Função de escala k1: limita o tamanho dos centróides perto das caudas"""
+    return COMPRESSION / (2 * math.pi) * math.asin(2 * q - 1)
+
+
+def _inverse_scale(k: float) -> float:
+    if k >= COMPRESSION / 4:
+        return 1.0
+    return (math.sin(k * 2 * math.pi / COMPRESSION) + 1) / 2
+
+
+class TDigest:
+    """t-digest com fusão em lote (merging digest)"""
+
+    __slots__ = ('centroids', 'buffer', 'min', 'max')
+
+    def __init__(self):
+        self.centroids: List[Tuple[float, float]] = []
+        self.buffer: List[Tuple[float, float]] = []
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, value: float) -> None:
+        self.add_many((value,))
+
+    def add_many(self, values: Iterable[float]) -> None:
+        values = [float(value) for value in values]
+        if not values:
+            return
+
+        low, high = min(values), max(values)
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+        self.buffer.extend((value, 1.0) for value in values)
+        if len(self.buffer) > _BUFFER_SIZE:
+            self._compress()
+
+    def merge(self, other: 'TDigest') -> None:
+        if other.min is None:
+            return
+
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+        self.buffer.extend(other.centroids)
+        self.buffer.extend(other.buffer)
+        if len(self.buffer) > _BUFFER_SIZE:
+            self._compress()
+
+    def _compress(self) -> None:
+        items = self.centroids + self.buffer
+        self.buffer = []
+
+        if not items:
+            return
+
+        items.sort()
+        total = math.fsum(weight for _, weight in items)
+        merged = []
+        mean, weight = items[0]
+        weight_before = 0.0
+        limit = total * _inverse_scale(_scale(0.0) + 1)
+
+        for item_mean, item_weight in items[1:]:
+            if weight_before + weight + item_weight <= limit:
+                weight += item_weight
+                mean += (item_mean - mean) * item_weight / weight
+            else:
+                merged.append((mean, weight))
+                weight_before += weight
+                limit = total * _inverse_scale(_scale(weight_before / total) + 1)
+                mean, weight = item_mean, item_weight
+
+        merged.append((mean, weight))
+        self.centroids = merged
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Retorna o valor no quantil q (0 a 1)
+
+        Interpola entre os centros dos centróides; centróides de peso 1 são
+        valores exatos, então grupos pequenos coincidem com a interpolação
+        linear entre as posições vizinhas (como numpy.percentile).
+        """
+        if self.buffer:
+            self._compress()
+
+        if not self.centroids:
+            return None
+
+        centroids = self.centroids
+        total = math.fsum(weight for _, weight in centroids)
+
+        if len(centroids) == 1 or total == 1:
+            return centroids[0][0]
+
+        # Posição alvo no mesmo referencial de numpy: 0 .. total - 1
+        target = q * (total - 1)
+        cumulative = 0.0
+        previous_center = None
+        previous_mean = None
+
+        for mean, weight in centroids:
+            center = cumulative + (weight - 1) / 2
+
+            if target <= center:
+                if previous_center is None:
+                    return self._interpolate(self.min, mean, 0.0, center, target)
+                return self._interpolate(previous_mean, mean, previous_center, center, target)
+
+            previous_center, previous_mean = center, mean
+            cumulative += weight
+
+        return self._interpolate(previous_mean, self.max, previous_center, total - 1, target)
+
+    @staticmethod
+    def _interpolate(low: float, high: float, low_position: float, high_position: float, target: float) -> float:
+        if high_position <= low_position:
+            return high
+        return low + (high - low) * (target - low_position) / (high_position - low_position)
+
+    def to_bytes(self) -> bytes:
+        if self.buffer:
+            self._compress()
+
+        values = array('d', (self.min or 0.0, self.max or 0.0))
+        for mean, weight in self.centroids:
+            values.append(mean)
+            values.append(weight)
+
+        return values.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'TDigest':
+        values = array('d')
+        values.frombytes(data)
+
+        digest = cls()
+        if len(values) > 2:
+            digest.min, digest.max = values[0], values[1]
+            digest.centroids = list(zip(values[2::2], values[3::2]))
+
+        return digest
+
+
+def exact_quantile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Quantil exato com interpolação linear entre posições (como numpy.percentile)"""
+    if not sorted_values:
+        return None
+
+    position = q * (len(sorted_values) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
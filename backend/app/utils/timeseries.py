@@ -0,0 +1,134 @@
+"""
+Buckets de tempo e redução de séries para gráficos
+
+Os buckets são intervalos de largura fixa em segundos, alinhados a partir de
+EPOCH_ORIGIN (segunda-feira, 1970-01-05 00:00 UTC): buckets de dia começam à
+meia-noite e os de semana na segunda-feira, como as partições semanais. O
+bucket de um instante é (epoch - origem) // largura * largura + origem.
+
+Quando o intervalo pedido teria mais pontos que max_points, a série é
+reduzida de uma das formas:
+    - pick_bucket(): escolhe um bucket mais largo (agregação exata);
+    - lttb(): Largest-Triangle-Three-Buckets, mantém os pontos que preservam
+      a forma visual da série;
+    - min_max(): mantém o menor e o maior valor de cada faixa de pontos,
+      preservando picos e vales.
+lttb() e min_max() retornam os índices dos pontos mantidos, em ordem.
+"""
+import math
+from typing import List, Sequence
+
+# Larguras aceitas pelo parâmetro bucket de /aggregate, em segundos
+BUCKETS = {'5m': 300, '15m': 900, '1h': 3600, '1d': 86400, '1w': 604800}
+
+# 1970-01-05 00:00 UTC, primeira segunda-feira após a época Unix
+EPOCH_ORIGIN = 345600
+
+DOWNSAMPLE_METHODS = ('merge', 'lttb', 'minmax')
+
+_UNITS = (('w', 604800), ('d', 86400), ('h', 3600), ('m', 60), ('s', 1))
+
+
+def bucket_label(seconds: int) -> str:
+    """Rótulo de uma largura na maior unidade exata (ex.: 7200 -> '2h')"""
+    for unit, size in _UNITS:
+        if seconds % size == 0:
+            return f'{seconds // size}{unit}'
+    return f'{seconds}s'
+
+
+def bucket_count(seconds: int, first: int, last: int) -> int:
+    """Quantidade de buckets de seconds segundos entre os instantes first e last (inclusive)"""
+    return (last - EPOCH_ORIGIN) // seconds - (first - EPOCH_ORIGIN) // seconds + 1
+
+
+def pick_bucket(seconds: int, first: int, last: int, max_points: int) -> int:
+    """
+    Menor largura, a partir de seconds, com no máximo max_points buckets
+
+    Tenta as larguras de BUCKETS maiores que seconds e, depois delas,
+    múltiplos de semana.
+    """
+    if bucket_count(seconds, first, last) <= max_points:
+        return seconds
+
+    for candidate in sorted(BUCKETS.values()):
+        if candidate > seconds and bucket_count(candidate, first, last) <= max_points:
+            return candidate
+
+    week = BUCKETS['1w']
+    weeks = max(math.ceil((last - first + 1) / (week * max_points)), 2)
+    while bucket_count(weeks * week, first, last) > max_points:
+        weeks += 1
+
+    return weeks * week
+
+
+def lttb(xs: Sequence[float], ys: Sequence[float], threshold: int) -> List[int]:
+    """
+    Índices de até threshold pontos escolhidos pelo Largest-Triangle-Three-Buckets
+
+    O primeiro e o último pontos são mantidos; os demais são divididos em
+    threshold - 2 faixas e, de cada uma, fica o ponto que forma o maior
+    triângulo com o ponto mantido na faixa anterior e a média da seguinte.
+    threshold deve ser ao menos 3.
+    """
+    size = len(xs)
+    if threshold >= size:
+        return list(range(size))
+
+    every = (size - 2) / (threshold - 2)
+    kept = [0]
+    a = 0
+
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+
+        # Média da faixa seguinte (o último ponto, na última faixa)
+        next_start = end
+        next_end = min(int((i + 2) * every) + 1, size)
+        count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / count
+        avg_y = sum(ys[next_start:next_end]) / count
+
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+
+        kept.append(best)
+        a = best
+
+    kept.append(size - 1)
+    return kept
+
+
+def min_max(ys: Sequence[float], threshold: int) -> List[int]:
+    """
+    Índices de até threshold pontos: o menor e o maior de cada faixa
+
+    Os pontos são divididos em threshold // 2 faixas consecutivas; de cada
+    uma ficam os pontos de menor e de maior valor, na ordem original.
+    """
+    size = len(ys)
+    if threshold >= size:
+        return list(range(size))
+
+    ranges = threshold // 2
+    every = size / ranges
+    kept = []
+
+    for i in range(ranges):
+        start = int(i * every)
+        end = int((i + 1) * every)
+        if start >= end:
+            continue
+
+        low = min(range(start, end), key=ys.__getitem__)
+        high = max(range(start, end), key=ys.__getitem__)
+        kept.extend(sorted({low, high}))
+
+    return kept
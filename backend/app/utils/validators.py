@@ -1,4 +1,9 @@
-from typing import Tuple, Optional
+from app.models.anomalies import SCOPES
+from app.utils.filters import FILTER_FIELDS, Filters, parse
+from app.utils.timeseries import BUCKETS, DOWNSAMPLE_METHODS
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple, Optional
+import math
 
 
 class ValidationError(Exception):
@@ -6,6 +11,24 @@ class ValidationError(Exception):
     pass
 
 
+# Colunas de texto de um diagnóstico e seus tamanhos máximos
+DIAGNOSTIC_TEXT_FIELDS = (('device_id', 50), ('city', 100), ('state', 50))
+
+# Colunas numéricas de um diagnóstico e seus intervalos válidos
+DIAGNOSTIC_NUMERIC_FIELDS = (
+    ('latency_ms', 0.0, None),
+    ('packet_loss', 0.0, 100.0),
+    ('quality_of_service', 0.0, 100.0),
+)
+
+
+def _naive_utc_isoformat(value: Optional[datetime]) -> Optional[str]:
+    """Converte datas com fuso para UTC sem fuso, no formato ISO 8601"""
+    if value is None:
+        return None
+    return value.astimezone(timezone.utc).replace(tzinfo=None).isoformat()
+
+
 class RequestValidator:
     """Validador de parâmetros de requisição"""
     
@@ -35,31 +58,117 @@ class RequestValidator:
         return page, limit
     
     @staticmethod
-    def validate_filter_params(city: Optional[str] = None, state: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    def validate_filters(args) -> Filters:
+        """
+        Valida os parâmetros de filtro (app.utils.filters)
+        
+        Args:
+            args: Parâmetros da requisição; cada campo de FILTER_FIELDS presente
+                  é uma expressão 'operador:valor' (valores vazios são ignorados)
+        """
+        limits = dict(DIAGNOSTIC_TEXT_FIELDS)
+        conditions = []
+        
+        for field in FILTER_FIELDS:
+            expression = (args.get(field) or '').strip()
+            if not expression:
+                continue
+            
+            try:
+                condition = parse(field, expression)
+            except ValueError as e:
+                raise ValidationError(str(e))
+            
+            # Cada termo de texto cabe na coluna filtrada
+            if field in limits and any(len(value) > limits[field] for value in condition[2]):
+                raise ValidationError(f"O parâmetro '{field}' não pode ter mais de {limits[field]} caracteres")
+            
+            conditions.append(condition)
+        
+        return tuple(conditions)
+    
+    @staticmethod
+    def validate_location_query(q: Optional[str], limit: int) -> Tuple[str, int]:
+        """
+        Valida os parâmetros do autocompletar de localidades
+        
+        Args:
+            q: Termo buscado na cidade ou no estado (obrigatório)
+            limit: Quantidade máxima de localidades (entre 1 e 50)
+        """
+        q = (q or '').strip()
+        
+        if len(q) == 0:
+            raise ValidationError("O parâmetro 'q' é obrigatório")
+        
+        if len(q) > 100:
+            raise ValidationError("O parâmetro 'q' não pode ter mais de 100 caracteres")
+        
+        if limit < 1:
+            raise ValidationError("O parâmetro 'limit' deve ser maior ou igual a 1")
+        
+        if limit > 50:
+            raise ValidationError("O parâmetro 'limit' não pode ser maior que 50")
+        
+        return q, limit
+    
+    @staticmethod
+    def validate_anomaly_params(scope: str, min_z: float, min_samples: int, limit: int) -> Tuple[str, float, int, int]:
+        """
+        Valida os parâmetros do ranking de anomalias
+        
+        Args:
+            scope: 'all', 'device' ou 'location'
+            min_z: |z| mínimo da última leitura (maior ou igual a 0)
+            min_samples: Leituras mínimas do grupo (maior ou igual a 1)
+            limit: Quantidade máxima de grupos (entre 1 e 100)
+        """
+        valid_options = ('all',) + tuple(SCOPES)
+        
+        if scope not in valid_options:
+            raise ValidationError(
+                f"O parâmetro 'scope' deve ser um dos seguintes: {', '.join(valid_options)}"
+            )
+        
+        if not math.isfinite(min_z) or min_z < 0:
+            raise ValidationError("O parâmetro 'min_z' deve ser um número maior ou igual a 0")
+        
+        if min_samples < 1:
+            raise ValidationError("O parâmetro 'min_samples' deve ser maior ou igual a 1")
+        
+        if limit < 1:
+            raise ValidationError("O parâmetro 'limit' deve ser maior ou igual a 1")
+        
+        if limit > 100:
+            raise ValidationError("O parâmetro 'limit' não pode ser maior que 100")
+        
+        return scope, min_z, min_samples, limit
+    
+    @staticmethod
+    def validate_date_params(start_date: Optional[str] = None, end_date: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
         """
-        Valida parâmetros de filtro
+        Valida e normaliza os filtros de data para o formato YYYY-MM-DD
         
         Args:
-            city: Filtro de cidade
-            state: Filtro de estado
+            start_date: Data inicial (YYYY-MM-DD ou data/hora ISO 8601)
+            end_date: Data final (YYYY-MM-DD ou data/hora ISO 8601)
         """
-        # Validar city
-        if city is not None:
-            city = city.strip()
-            if len(city) > 100:
-                raise ValidationError("O parâmetro 'city' não pode ter mais de 100 caracteres")
-            if len(city) == 0:
-                city = None
+        dates = []
         
-        # Validar state
-        if state is not None:
-            state = state.strip()
-            if len(state) > 50:
-                raise ValidationError("O parâmetro 'state' não pode ter mais de 50 caracteres")
-            if len(state) == 0:
-                state = None
+        for name, value in (('start_date', start_date), ('end_date', end_date)):
+            if value is not None:
+                value = value.strip()
+            
+            if not value:
+                dates.append(None)
+                continue
+            
+            try:
+                dates.append(datetime.fromisoformat(value).date().isoformat())
+            except ValueError:
+                raise ValidationError(f"O parâmetro '{name}' deve estar no formato YYYY-MM-DD")
         
-        return city, state
+        return dates[0], dates[1]
     
     @staticmethod
     def validate_group_by(group_by: str) -> str:
@@ -77,4 +186,308 @@ class RequestValidator:
             )
         
         return group_by
-
+    
+    @staticmethod
+    def validate_group_by_list(group_by: str) -> Tuple[str, ...]:
+        """
+        Valida a lista de agrupamentos separados por vírgula (ex.: 'day,state')
+        
+        Args:
+            group_by: Critérios de agrupamento, sem repetição
+        """
+        values = []
+        
+        for item in group_by.split(','):
+            item = RequestValidator.validate_group_by(item.strip())
+            if item not in values:
+                values.append(item)
+        
+        return tuple(values)
+    
+    @staticmethod
+    def validate_percentiles(percentiles: Optional[str]) -> Optional[Tuple[float, ...]]:
+        """
+        Valida a lista de percentis separados por vírgula (ex.: '50,95,99')
+        
+        Args:
+            percentiles: Percentis entre 0 e 100 (no máximo 10)
+        """
+        if percentiles is None or not percentiles.strip():
+            return None
+        
+        values = []
+        
+        for item in percentiles.split(','):
+            try:
+                value = float(item)
+            except ValueError:
+                raise ValidationError("O parâmetro 'percentiles' deve ser uma lista de números separados por vírgula")
+            
+            if not 0 <= value <= 100:
+                raise ValidationError("Os percentis devem estar entre 0 e 100")
+            
+            if value not in values:
+                values.append(value)
+        
+        if len(values) > 10:
+            raise ValidationError("O parâmetro 'percentiles' aceita no máximo 10 valores")
+        
+        return tuple(values)
+    
+    @staticmethod
+    def validate_bucket(bucket: str) -> int:
+        """
+        Valida a largura dos buckets de tempo
+        
+        Args:
+            bucket: '5m', '15m', '1h', '1d' ou '1w'
+        
+        Retorna a largura em segundos.
+        """
+        if bucket not in BUCKETS:
+            raise ValidationError(
+                f"O parâmetro 'bucket' deve ser um dos seguintes: {', '.join(BUCKETS)}"
+            )
+        
+        return BUCKETS[bucket]
+    
+    @staticmethod
+    def validate_max_points(max_points: int) -> int:
+        """
+        Valida a quantidade máxima de pontos de uma série
+        
+        Args:
+            max_points: Pontos por série (entre 3 e 10000)
+        """
+        if max_points < 3:
+            raise ValidationError("O parâmetro 'max_points' deve ser maior ou igual a 3")
+        
+        if max_points > 10000:
+            raise ValidationError("O parâmetro 'max_points' não pode ser maior que 10000")
+        
+        return max_points
+    
+    @staticmethod
+    def validate_downsample(downsample: str) -> str:
+        """
+        Valida o modo de redução de séries acima de max_points
+        
+        Args:
+            downsample: 'merge' (bucket mais largo), 'lttb' ou 'minmax'
+        """
+        if downsample not in DOWNSAMPLE_METHODS:
+            raise ValidationError(
+                f"O parâmetro 'downsample' deve ser um dos seguintes: {', '.join(DOWNSAMPLE_METHODS)}"
+            )
+        
+        return downsample
+    
+    @staticmethod
+    def validate_boolean(value: str, name: str) -> bool:
+        """
+        Valida um parâmetro booleano ('true'/'false', '1'/'0')
+        
+        Args:
+            value: Valor recebido
+            name: Nome do parâmetro (para a mensagem de erro)
+        """
+        value = value.strip().lower()
+        
+        if value in ('true', '1'):
+            return True
+        
+        if value in ('false', '0'):
+            return False
+        
+        raise ValidationError(f"O parâmetro '{name}' deve ser 'true' ou 'false'")
+    
+    @staticmethod
+    def validate_count_mode(count: str) -> str:
+        """
+        Valida o modo de contagem do total de registros
+        
+        Args:
+            count: Modo de contagem ('exact', 'estimate' ou 'none')
+        """
+        valid_options = ['exact', 'estimate', 'none']
+        
+        if count not in valid_options:
+            raise ValidationError(
+                f"O parâmetro 'count' deve ser um dos seguintes: {', '.join(valid_options)}"
+            )
+        
+        return count
+    
+    @staticmethod
+    def validate_distinct_mode(distinct: str) -> str:
+        """
+        Valida o modo de contagem de valores distintos
+        
+        Args:
+            distinct: Modo de contagem ('approx' ou 'exact')
+        """
+        valid_options = ['approx', 'exact']
+        
+        if distinct not in valid_options:
+            raise ValidationError(
+                f"O parâmetro 'distinct' deve ser um dos seguintes: {', '.join(valid_options)}"
+            )
+        
+        return distinct
+    
+    @staticmethod
+    def validate_response_format(response_format: str) -> str:
+        """
+        Valida o formato das listas na resposta
+        
+        Args:
+            response_format: 'records' (lista de objetos) ou 'columnar' (um array por campo)
+        """
+        valid_options = ['records', 'columnar']
+        
+        if response_format not in valid_options:
+            raise ValidationError(
+                f"O parâmetro 'format' deve ser um dos seguintes: {', '.join(valid_options)}"
+            )
+        
+        return response_format
+    
+    @staticmethod
+    def validate_export_params(export_format: str, compress: str) -> Tuple[str, str]:
+        """
+        Valida o formato e a compressão da exportação
+        
+        Args:
+            export_format: Formato do arquivo ('ndjson' ou 'csv')
+            compress: Compressão da resposta ('gzip' ou 'none')
+        """
+        valid_formats = ['ndjson', 'csv']
+        valid_compressions = ['gzip', 'none']
+        
+        if export_format not in valid_formats:
+            raise ValidationError(
+                f"O parâmetro 'format' deve ser um dos seguintes: {', '.join(valid_formats)}"
+            )
+        
+        if compress not in valid_compressions:
+            raise ValidationError(
+                f"O parâmetro 'compress' deve ser um dos seguintes: {', '.join(valid_compressions)}"
+            )
+        
+        return export_format, compress
+    
+    @staticmethod
+    def validate_chunk_size(chunk_size: int) -> int:
+        """
+        Valida o tamanho dos blocos de ingestão
+        
+        Args:
+            chunk_size: Linhas por bloco de executemany
+        """
+        if chunk_size < 1:
+            raise ValidationError("O parâmetro 'chunk_size' deve ser maior ou igual a 1")
+        
+        if chunk_size > 100000:
+            raise ValidationError("O parâmetro 'chunk_size' não pode ser maior que 100000")
+        
+        return chunk_size
+    
+    @staticmethod
+    def validate_diagnostic_rows(rows: List[Any], offset: int = 0) -> Tuple[List[Tuple], List[Dict]]:
+        """
+        Valida um lote de diagnósticos coluna a coluna
+        
+        Cada coluna é verificada de uma vez para o lote inteiro; uma linha
+        inválida é rejeitada sem afetar as demais.
+        
+        Args:
+            rows: Lista de objetos recebidos no corpo da requisição
+            offset: Posição da primeira linha no lote (para lotes em partes)
+        
+        Retorna as linhas válidas como tuplas na ordem das colunas de
+        inserção e a lista de rejeições no formato {'index', 'error'}.
+        """
+        errors: Dict[int, str] = {}
+        
+        for i, row in enumerate(rows):
+            if not isinstance(row, dict):
+                errors[i] = 'O diagnóstico deve ser um objeto JSON'
+        
+        def column(field):
+            if not errors:
+                return [row.get(field) for row in rows]
+            return [row.get(field) if isinstance(row, dict) else None for row in rows]
+        
+        columns = []
+        
+        # Cada coluna passa primeiro por uma verificação em bloco (tipos,
+        # mínimos e máximos); só colunas com algum valor inválido são
+        # percorridas linha a linha para identificar as rejeições.
+        for field, max_length in DIAGNOSTIC_TEXT_FIELDS:
+            values = column(field)
+            
+            if set(map(type, values)) == {str}:
+                values = [value.strip() for value in values]
+                lengths = list(map(len, values))
+                column_ok = min(lengths) > 0 and max(lengths) <= max_length
+            else:
+                values = [value.strip() if isinstance(value, str) else value for value in values]
+                column_ok = False
+            
+            if not column_ok:
+                for i, value in enumerate(values):
+                    if not isinstance(value, str) or value == '':
+                        errors.setdefault(i, f"O campo '{field}' é obrigatório")
+                    elif len(value) > max_length:
+                        errors.setdefault(i, f"O campo '{field}' não pode ter mais de {max_length} caracteres")
+            
+            columns.append(values)
+        
+        for field, minimum, maximum in DIAGNOSTIC_NUMERIC_FIELDS:
+            values = column(field)
+            
+            column_ok = set(map(type, values)) <= {float, int}
+            if column_ok:
+                values = list(map(float, values))
+                lowest, highest = min(values), max(values)
+                column_ok = (
+                    math.isfinite(lowest) and math.isfinite(highest) and lowest >= minimum
+                    and (maximum is None or highest <= maximum)
+                    and not any(value != value for value in values)
+                )
+            
+            if not column_ok:
+                for i, value in enumerate(values):
+                    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                        errors.setdefault(i, f"O campo '{field}' deve ser numérico")
+                    elif value < minimum or (maximum is not None and value > maximum):
+                        limit = f"entre {minimum:g} e {maximum:g}" if maximum is not None else f"maior ou igual a {minimum:g}"
+                        errors.setdefault(i, f"O campo '{field}' deve ser {limit}")
+                values = [float(value) if i not in errors else None for i, value in enumerate(values)]
+            
+            columns.append(values)
+        
+        values = column('date')
+        try:
+            parsed = list(map(datetime.fromisoformat, values))
+        except (TypeError, ValueError):
+            parsed = []
+            for i, value in enumerate(values):
+                try:
+                    parsed.append(datetime.fromisoformat(value))
+                except (TypeError, ValueError):
+                    errors.setdefault(i, "O campo 'date' deve ser uma data/hora ISO 8601")
+                    parsed.append(None)
+        
+        columns.append([
+            value.isoformat() if value is not None and value.tzinfo is None else _naive_utc_isoformat(value)
+            for value in parsed
+        ])
+        
+        valid = list(zip(*columns))
+        if errors:
+            valid = [row for i, row in enumerate(valid) if i not in errors]
+        
+        rejected = [{'index': offset + i, 'error': errors[i]} for i in sorted(errors)]
+        
+        return valid, rejected
@@ -0,0 +1,13 @@
+"""
+Ponto de entrada ASGI
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Serve a aplicação de wsgi.py pelo adaptador de app.asgi (leituras pela
+conexão aiosqlite, limite de concorrência por endpoint); o banco é preparado
+antes por `flask --app wsgi init-db`.
+"""
+from wsgi import app as flask_app
+from app.asgi import create_asgi_app
+
+app = create_asgi_app(flask_app)
@@ -0,0 +1,11 @@
+"""
+Benchmarks do DiagnosticsService e dos endpoints HTTP
+
+Uso (a partir de backend/):
+
+    python -m benchmarks run --scales 10k,1m --output resultados.json
+    python -m benchmarks compare base.json resultados.json --threshold 0.2
+
+Os bancos de cada escala são gerados uma vez (semente fixa) e reaproveitados
+de benchmarks/data/.
+"""
@@ -0,0 +1,214 @@
+"""
+CLI dos benchmarks
+
+    python -m benchmarks run [--scales 10k,1m,10m] [--seed N] [--repeat N]
+                             [--max-seconds S] [--only prefixo] [--output arquivo.json]
+    python -m benchmarks compare base.json atual.json [--threshold 0.2]
+                             [--min-delta-ms 2] [--case-threshold caso=0.5 ...]
+
+Cada escala roda num subprocesso com DATABASE_URL apontando para o banco da
+escala (o Config é lido na importação) e o cache de leituras desligado.
+compare retorna código de saída 1 se algum p95 piorar além do limite.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Configurações registradas junto com os resultados
+REPORTED_CONFIG = ('ROLLUPS_ENABLED', 'ANALYTICS_ENGINE', 'CACHE_BACKEND', 'DB_JOURNAL_MODE', 'DB_READ_POOL_SIZE')
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scale(args) -> int:
+    """Mede todos os casos contra o banco de DATABASE_URL (executado no subprocesso)"""
+    from app import create_app
+    from benchmarks.cases import http_cases, measure, service_cases
+
+    app = create_app()
+    cases = []
+
+    for name, call in service_cases(args.rows):
+        def in_context(call=call):
+            with app.app_context():
+                return call()
+        cases.append((name, in_context))
+
+    cases.extend(http_cases(app.test_client(), args.rows))
+
+    results = {}
+    for name, call in cases:
+        if args.only and not any(name.startswith(prefix) for prefix in args.only):
+            continue
+
+        results[name] = measure(call, args.repeat, args.max_seconds)
+        print(f"    {name:<38} p50 {results[name]['p50_ms']:>10.2f} ms  p95 {results[name]['p95_ms']:>10.2f} ms", file=sys.stderr)
+
+    with open(args.output, 'w') as handle:
+        json.dump({
+            'cases': results,
+            'config': {key: app.config.get(key) for key in REPORTED_CONFIG},
+        }, handle)
+
+    return 0
+
+
+def run(args) -> int:
+    from benchmarks import datasets
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'environment': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'seed': args.seed,
+        'scales': {},
+    }
+
+    for scale in args.scales:
+        rows = datasets.parse_scale(scale)
+        path = datasets.dataset_path(rows, args.seed)
+
+        if not os.path.exists(path):
+            print(f'Gerando banco de {rows} linhas em {path}...', file=sys.stderr)
+            started = time.perf_counter()
+            datasets.build(rows, args.seed, path)
+            print(f'    pronto em {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+        print(f'Escala {scale} ({rows} linhas)', file=sys.stderr)
+
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as handle:
+            output = handle.name
+
+        command = [
+            sys.executable, '-m', 'benchmarks', '_scale',
+            '--rows', str(rows), '--repeat', str(args.repeat),
+            '--max-seconds', str(args.max_seconds), '--output', output,
+        ]
+        for prefix in args.only or []:
+            command += ['--only', prefix]
+
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}', CACHE_BACKEND='none')
+        try:
+            subprocess.run(command, cwd=BACKEND_DIR, env=env, check=True)
+            with open(output) as handle:
+                result = json.load(handle)
+        finally:
+            os.remove(output)
+
+        report['scales'][scale] = {'rows': rows, 'dataset': os.path.basename(path), **result}
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as handle:
+        json.dump(report, handle, indent=2)
+
+    print(f'Resultados em {output}', file=sys.stderr)
+    return 0
+
+
+def compare(args) -> int:
+    with open(args.baseline) as handle:
+        baseline = json.load(handle)
+    with open(args.current) as handle:
+        current = json.load(handle)
+
+    thresholds = dict(args.case_threshold or [])
+    regressions = 0
+    compared = 0
+
+    for scale, scale_result in current['scales'].items():
+        base_cases = baseline['scales'].get(scale, {}).get('cases', {})
+
+        for name, stats in scale_result['cases'].items():
+            base = base_cases.get(name)
+            if base is None:
+                print(f'  novo      {scale:>5} {name}')
+                continue
+
+            compared += 1
+            threshold = thresholds.get(name, args.threshold)
+            before, after = base['p95_ms'], stats['p95_ms']
+            change = (after - before) / before if before else 0.0
+            regressed = after > before * (1 + threshold) and after - before > args.min_delta_ms
+
+            if regressed:
+                regressions += 1
+            if regressed or args.verbose:
+                label = 'REGRESSÃO' if regressed else 'ok'
+                print(f'  {label:<9} {scale:>5} {name:<38} p95 {before:>10.2f} -> {after:>10.2f} ms ({change:+.1%}, limite {threshold:+.0%})')
+
+    print(f'{compared} casos comparados, {regressions} regressões de p95')
+    return 1 if regressions else 0
+
+
+def _case_threshold(value):
+    name, _, threshold = value.partition('=')
+    try:
+        return name, float(threshold)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Use caso=limite (ex.: service.statistics=0.5): {value}')
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmarks do serviço de diagnósticos')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Executa os benchmarks e grava o JSON de resultados')
+    run_parser.add_argument('--scales', type=lambda value: value.split(','), default=['10k'])
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--repeat', type=int, default=20, help='Amostras por caso (após 1 de aquecimento)')
+    run_parser.add_argument('--max-seconds', type=float, default=10, help='Tempo máximo por caso (mínimo de 3 amostras)')
+    run_parser.add_argument('--only', action='append', help='Mede apenas os casos com este prefixo (repetível)')
+    run_parser.add_argument('--output')
+
+    scale_parser = commands.add_parser('_scale')
+    scale_parser.add_argument('--rows', type=int, required=True)
+    scale_parser.add_argument('--repeat', type=int, required=True)
+    scale_parser.add_argument('--max-seconds', type=float, required=True)
+    scale_parser.add_argument('--only', action='append')
+    scale_parser.add_argument('--output', required=True)
+
+    compare_parser = commands.add_parser('compare', help='Compara dois resultados pelo p95 de cada caso')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=float(os.getenv('BENCH_P95_THRESHOLD', 0.2)),
+                                help='Piora relativa de p95 tolerada (default: 0.2 ou BENCH_P95_THRESHOLD)')
+    compare_parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                                help='Diferenças absolutas menores que isso não contam como regressão')
+    compare_parser.add_argument('--case-threshold', type=_case_threshold, action='append',
+                                help='Limite específico de um caso: nome=limite (repetível)')
+    compare_parser.add_argument('--verbose', action='store_true', help='Lista também os casos sem regressão')
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        return run(args)
+    if args.command == '_scale':
+        return run_scale(args)
+    return compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
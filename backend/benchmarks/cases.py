@@ -0,0 +1,124 @@
+"""
+Casos medidos em cada escala
+
+Os casos 'service.*' chamam o DiagnosticsService dentro de um app context
+(como uma requisição, a sessão é descartada a cada chamada); os 'http.*'
+passam pelo Flask test client, com autenticação, validação e serialização.
+"""
+import math
+import time
+from datetime import timedelta
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.datasets import END_DATE
+
+LIMIT = 10
+
+# Maior página aceita pela API (validate_pagination_params)
+MAX_HTTP_PAGE = 10000
+
+RECENT_WEEK = {
+    'start_date': (END_DATE - timedelta(days=6)).isoformat(),
+    'end_date': END_DATE.isoformat(),
+}
+
+FILTERS = {
+    'city': {'city': 'Salvador'},
+    'state': {'state': 'SP'},
+    'dates': RECENT_WEEK,
+    'all': {'city': 'Salvador', 'state': 'BA', **RECENT_WEEK},
+    'expression': {'city': 'in:Salvador,Recife', 'latency_ms': 'gt:60'},
+}
+
+
+def service_cases(rows: int) -> List[Tuple[str, Callable]]:
+    from app.services.diagnostics_service import DiagnosticsService
+    from app.utils.validators import RequestValidator
+
+    pages = max(math.ceil(rows / LIMIT), 1)
+    cases = [
+        ('service.paginated_first', lambda: DiagnosticsService.get_diagnostics_paginated(page=1, limit=LIMIT)),
+        ('service.paginated_middle', lambda: DiagnosticsService.get_diagnostics_paginated(page=max(pages // 2, 1), limit=LIMIT)),
+        ('service.paginated_deep', lambda: DiagnosticsService.get_diagnostics_paginated(page=pages, limit=LIMIT)),
+    ]
+
+    for name, params in FILTERS.items():
+        # Parâmetros da query string -> condições e datas, como nas rotas
+        filters = dict(
+            {key: value for key, value in params.items() if key in RECENT_WEEK},
+            filters=RequestValidator.validate_filters(params),
+        )
+        cases.append((f'service.paginated_filter_{name}', lambda f=filters: DiagnosticsService.get_diagnostics_paginated(page=1, limit=LIMIT, **f)))
+
+    for group_by in ('day', 'city', 'state'):
+        cases.append((f'service.aggregate_{group_by}', lambda g=group_by: DiagnosticsService.get_aggregated_by_day(group_by=g)))
+
+    cases.append(('service.buckets_1h', lambda: DiagnosticsService.get_time_buckets(bucket=3600, max_points=10000)))
+    cases.append(('service.buckets_5m_filter_dates', lambda: DiagnosticsService.get_time_buckets(bucket=300, max_points=10000, **RECENT_WEEK)))
+
+    cases.append(('service.statistics', lambda: DiagnosticsService.get_statistics()))
+    cases.append(('service.statistics_filter_dates', lambda: DiagnosticsService.get_statistics(**RECENT_WEEK)))
+    return cases
+
+
+def http_cases(client, rows: int) -> List[Tuple[str, Callable]]:
+    response = client.post('/api/auth/login', json={'username': 'admin', 'password': 'admin'})
+    headers = {'Authorization': f"Bearer {response.get_json()['token']}"}
+    pages = min(max(math.ceil(rows / LIMIT), 1), MAX_HTTP_PAGE)
+
+    def get(path):
+        def call():
+            response = client.get(path, headers=headers)
+            if response.status_code != 200:
+                raise RuntimeError(f'{path}: HTTP {response.status_code}')
+            return response.data
+        return call
+
+    return [
+        ('http.list_first', get(f'/api/diagnostics?page=1&limit={LIMIT}')),
+        ('http.list_deep', get(f'/api/diagnostics?page={pages}&limit={LIMIT}')),
+        ('http.list_columnar', get('/api/diagnostics?page=1&limit=100&format=columnar')),
+        ('http.list_filter_dates', get(f"/api/diagnostics?limit={LIMIT}&start_date={RECENT_WEEK['start_date']}&end_date={RECENT_WEEK['end_date']}")),
+        ('http.list_filter_expression', get(f'/api/diagnostics?limit={LIMIT}&city=in:Salvador,Recife&latency_ms=gt:60')),
+        ('http.detail', get(f'/api/diagnostics/{max(rows // 2, 1)}')),
+        ('http.aggregate_day', get('/api/diagnostics/aggregate?group_by=day')),
+        ('http.aggregate_city', get('/api/diagnostics/aggregate?group_by=city')),
+        ('http.aggregate_bucket_lttb', get('/api/diagnostics/aggregate?bucket=1h&max_points=500&downsample=lttb')),
+        ('http.statistics', get('/api/diagnostics/statistics')),
+        ('http.dashboard', get(f'/api/diagnostics/dashboard?group_by=day,city&limit={LIMIT}')),
+    ]
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Percentil por posição mais próxima (nearest rank)"""
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+
+def measure(func: Callable, repeat: int, max_seconds: float, min_samples: int = 3) -> Dict:
+    """
+    Executa func uma vez de aquecimento e depois até repeat vezes
+
+    Para antes de repeat se o caso já passou de max_seconds, desde que tenha
+    ao menos min_samples amostras.
+    """
+    func()
+
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < repeat:
+        begin = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - begin) * 1000)
+
+        if len(samples) >= min_samples and time.perf_counter() - started > max_seconds:
+            break
+
+    return {
+        'samples': len(samples),
+        'min_ms': round(min(samples), 3),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+        'p50_ms': round(percentile(samples, 0.50), 3),
+        'p95_ms': round(percentile(samples, 0.95), 3),
+        'max_ms': round(max(samples), 3),
+    }
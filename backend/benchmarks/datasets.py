@@ -0,0 +1,114 @@
+"""
+Bancos de benchmark por escala
+
+Cada escala é um arquivo SQLite com o schema completo (migrações, rollups,
+sketches e digests) e linhas geradas a partir de uma semente fixa, para que
+medições de versões diferentes usem exatamente os mesmos dados.
+"""
+import os
+import random
+import sqlite3
+from datetime import date, timedelta
+
+from app.models import schema
+from app.services.ingest_service import insert_rows
+from app.services.summary_refresh import refresh_summaries
+from create_and_populate_db import CITIES
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+SCALES = {
+    '10k': 10_000,
+    '1m': 1_000_000,
+    '10m': 10_000_000,
+}
+
+# Período coberto pelos dados: DAYS dias terminando em END_DATE
+END_DATE = date(2024, 12, 31)
+DAYS = 90
+DEVICES = 5000
+
+_CHUNK_SIZE = 50_000
+
+
+def parse_scale(value: str) -> int:
+    """Aceita um nome de SCALES ('1m') ou um número de linhas ('250000')"""
+    value = value.strip().lower()
+    if value in SCALES:
+        return SCALES[value]
+    if value.isdigit() and int(value) > 0:
+        return int(value)
+    raise ValueError(f"Escala inválida: {value} (use {', '.join(SCALES)} ou um número de linhas)")
+
+
+def dataset_path(rows: int, seed: int) -> str:
+    return os.path.join(DATA_DIR, f'diagnostics_{rows}_{seed}_v{len(schema.MIGRATIONS)}.db')
+
+
+def generate_rows(rows: int, seed: int):
+    """Gera as linhas (device_id, city, state, latency_ms, packet_loss, quality_of_service, date)"""
+    rng = random.Random(seed)
+    first_day = END_DATE - timedelta(days=DAYS - 1)
+
+    for _ in range(rows):
+        city, state = CITIES[rng.randrange(len(CITIES))]
+        day = first_day + timedelta(days=rng.randrange(DAYS))
+        latency = rng.uniform(30, 70)
+        loss = rng.uniform(0.1, 2.0)
+        quality = max(0, min(100, 100 - latency * 0.2 - loss * 5))
+
+        yield (
+            f'DEV{rng.randrange(DEVICES):05d}',
+            city,
+            state,
+            round(latency, 2),
+            round(loss, 2),
+            round(quality, 2),
+            f'{day.isoformat()}T{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}',
+        )
+
+
+def build(rows: int, seed: int, path: str) -> None:
+    """Cria o banco em path (via arquivo temporário, renomeado ao final)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = path + '.tmp'
+    if os.path.exists(temporary):
+        os.remove(temporary)
+
+    conn = sqlite3.connect(temporary)
+    try:
+        # Carga descartável: sem journal nem fsync até o arquivo ficar pronto
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        schema.reset(conn)
+        schema.migrate(conn)
+
+        cursor = conn.cursor()
+        chunk = []
+        for row in generate_rows(rows, seed):
+            chunk.append(row)
+            if len(chunk) >= _CHUNK_SIZE:
+                insert_rows(cursor, chunk, _CHUNK_SIZE)
+                conn.commit()
+                chunk = []
+
+        if chunk:
+            insert_rows(cursor, chunk, _CHUNK_SIZE)
+
+        # Os resumos adiados são calculados uma vez, sobre todas as linhas
+        refresh_summaries(cursor)
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+    os.replace(temporary, path)
+
+
+def ensure(rows: int, seed: int) -> str:
+    """Retorna o caminho do banco da escala, gerando-o se ainda não existir"""
+    path = dataset_path(rows, seed)
+    if not os.path.exists(path):
+        build(rows, seed, path)
+    return path
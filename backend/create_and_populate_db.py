@@ -5,6 +5,9 @@ import sqlite3
 import random
 import os
 from datetime import datetime, timedelta
+from app.models import schema
+from app.services.ingest_service import insert_rows
+from app.services.summary_refresh import refresh_summaries
 
 DB_NAME = "./instance/default.db"
 
@@ -25,22 +28,9 @@ REGISTROS_POR_CIDADE = 5
 DIAS = 7
 
 def create_table(conn):
-    """Cria a tabela de diagnósticos"""
-    cursor = conn.cursor()
-    cursor.execute("DROP TABLE IF EXISTS diagnostics")
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS diagnostics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            device_id TEXT NOT NULL,
-            city TEXT NOT NULL,
-            state TEXT NOT NULL,
-            latency_ms REAL NOT NULL,
-            packet_loss REAL NOT NULL,
-            quality_of_service REAL NOT NULL,
-            date TEXT NOT NULL
-        );
-    """)
-    conn.commit()
+    """Cria a tabela de diagnósticos e seus índices"""
+    schema.reset(conn)
+    schema.migrate(conn)
 
 
 def populate(conn):
@@ -48,6 +38,8 @@ def populate(conn):
 
     cursor.execute("""DELETE FROM diagnostics""")
 
+    rows = []
+
     for dia in range(DIAS):
         data_base = datetime.now() - timedelta(days=dia)
 
@@ -68,11 +60,7 @@ def populate(conn):
                     second=random.randint(0, 59)
                 )
 
-                cursor.execute("""
-                    INSERT INTO diagnostics 
-                    (device_id, city, state, latency_ms, packet_loss, quality_of_service, date)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
+                rows.append((
                     device_id,
                     city,
                     state,
@@ -82,6 +70,8 @@ def populate(conn):
                     data_registro.isoformat()
                 ))
 
+    insert_rows(cursor, rows, chunk_size=5000)
+    refresh_summaries(cursor)
     conn.commit()
 
 
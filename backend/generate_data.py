@@ -0,0 +1,372 @@
+"""
+Gerador de dados sintéticos em grande escala
+
+Gera diagnósticos realistas de forma determinística (mesmos argumentos e
+semente produzem as mesmas linhas, qualquer que seja o número de processos):
+
+    - a atividade dos dispositivos segue uma distribuição de Zipf: poucos
+      dispositivos concentram a maior parte das medições, e cada um pertence
+      a uma cidade;
+    - as medições se concentram nos horários de uso e a latência e a perda de
+      pacotes acompanham a carga do horário (pico à noite, vale de madrugada),
+      com picos ocasionais de latência.
+
+As linhas são geradas com NumPy em blocos independentes (um gerador aleatório
+por bloco) distribuídos entre processos. No formato sqlite o processo
+principal grava os blocos em ordem com executemany, com journal e fsync
+desligados e sem os índices e triggers de diagnostics, recriados ao final
+junto com o rollup, as localidades, os sketches, os digests e as médias
+móveis. Nos formatos csv e parquet cada processo grava seus próprios arquivos (shards).
+
+Uso: python generate_data.py [--scale SF | --rows N] [--days N] [--cities N]
+                             [--devices N] [--seed N] [--end-date AAAA-MM-DD]
+                             [--workers N] [--chunk-size N]
+                             [--format sqlite|csv|parquet] [--output CAMINHO]
+                             [--force] [--skip-summaries]
+
+Requer numpy; o formato parquet requer também pyarrow.
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+from app.models import anomalies, device_sketches, locations, metric_digests, schema
+from app.services.ingest_service import INSERT_SQL
+from create_and_populate_db import CITIES
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - dependência opcional
+    np = None
+
+# Linhas por unidade de --scale
+ROWS_PER_SCALE = 1_000_000
+
+# Último dia padrão dos dados: fixo, para que os argumentos padrão gerem
+# sempre o mesmo conjunto (--end-date substitui)
+END_DATE = date(2024, 12, 31)
+
+# Cidades disponíveis para --cities, além das de create_and_populate_db
+EXTRA_CITIES = [
+    ("Manaus", "AM"),
+    ("Belém", "PA"),
+    ("Goiânia", "GO"),
+    ("Campinas", "SP"),
+    ("São Luís", "MA"),
+    ("Maceió", "AL"),
+    ("Natal", "RN"),
+    ("Teresina", "PI"),
+    ("João Pessoa", "PB"),
+    ("Florianópolis", "SC"),
+    ("Vitória", "ES"),
+    ("Cuiabá", "MT"),
+    ("Campo Grande", "MS"),
+    ("Aracaju", "SE"),
+    ("Porto Velho", "RO"),
+    ("Macapá", "AP"),
+    ("Rio Branco", "AC"),
+    ("Boa Vista", "RR"),
+    ("Palmas", "TO"),
+    ("Vitória da Conquista", "BA"),
+]
+
+CATALOG = CITIES + EXTRA_CITIES
+
+# Carga relativa de cada hora do dia (0 = madrugada ociosa, 1 = pico noturno)
+HOURLY_LOAD = (
+    0.30, 0.18, 0.10, 0.06, 0.05, 0.08, 0.20, 0.42,
+    0.58, 0.62, 0.60, 0.62, 0.70, 0.66, 0.62, 0.62,
+    0.66, 0.74, 0.84, 0.94, 1.00, 0.97, 0.80, 0.52,
+)
+
+# Expoentes de Zipf da atividade dos dispositivos e do tamanho das cidades
+DEVICE_SKEW = 0.8
+CITY_SKEW = 0.6
+
+# Aumento da latência no pico em relação à hora ociosa
+LATENCY_PEAK = 0.8
+# Fração das medições com pico de latência (3x a 8x)
+SPIKE_RATE = 0.005
+
+FORMATS = ('sqlite', 'csv', 'parquet')
+
+COLUMNS = ('device_id', 'city', 'state', 'latency_ms', 'packet_loss', 'quality_of_service', 'date')
+
+_SECONDS_PER_DAY = 86400
+
+
+def _zipf_weights(count: int, skew: float, rng) -> 'np.ndarray':
+    """Pesos de Zipf (1/rank^skew) em ordem aleatória, somando 1"""
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+class Generator:
+    """
+    Modelo dos dados e geração dos blocos
+
+    O modelo (cidades, dispositivos e seus pesos) depende só da semente; o
+    bloco k usa o próprio gerador aleatório (semente, k) e cobre as linhas
+    [k * chunk_size, (k + 1) * chunk_size) em ordem de data: a linha j cai no
+    dia j * days // rows.
+    """
+
+    def __init__(self, rows: int, days: int, cities: int, devices: int, seed: int, end_date: date, chunk_size: int):
+        self.rows = rows
+        self.days = days
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.first_day = np.datetime64(end_date - timedelta(days=days - 1), 's')
+
+        rng = np.random.default_rng([seed, 0xC171])
+        self.cities = np.array([city for city, _ in CATALOG[:cities]], dtype=object)
+        self.states = np.array([state for _, state in CATALOG[:cities]], dtype=object)
+        self.city_latency = rng.uniform(25, 60, cities)
+
+        width = max(5, len(str(devices - 1)))
+        self.device_ids = np.array([f'DEV{index:0{width}d}' for index in range(devices)], dtype=object)
+        self.device_city = rng.choice(cities, devices, p=_zipf_weights(cities, CITY_SKEW, rng))
+        self.device_cdf = np.cumsum(_zipf_weights(devices, DEVICE_SKEW, rng))
+
+        load = np.array(HOURLY_LOAD)
+        self.hour_load = load
+        self.hour_cdf = np.cumsum((0.15 + load) / (0.15 + load).sum())
+
+    @property
+    def chunks(self) -> int:
+        return -(-self.rows // self.chunk_size)
+
+    def chunk(self, index: int):
+        """Colunas do bloco index, na ordem de COLUMNS (textos como arrays object)"""
+        start = index * self.chunk_size
+        stop = min(start + self.chunk_size, self.rows)
+        size = stop - start
+        rng = np.random.default_rng([self.seed, index])
+
+        # Dia determinado pela posição; hora pela curva de uso
+        day = np.arange(start, stop, dtype=np.int64) * self.days // self.rows
+        hour = np.minimum(np.searchsorted(self.hour_cdf, rng.random(size)), 23)
+        seconds = day * _SECONDS_PER_DAY + hour * 3600 + rng.integers(0, 3600, size)
+        seconds.sort()
+        hour = seconds % _SECONDS_PER_DAY // 3600
+        load = self.hour_load[hour]
+
+        device = np.minimum(np.searchsorted(self.device_cdf, rng.random(size)), len(self.device_ids) - 1)
+        city = self.device_city[device]
+
+        latency = self.city_latency[city] * (1 + LATENCY_PEAK * load) * rng.lognormal(0.0, 0.25, size)
+        spikes = rng.random(size) < SPIKE_RATE
+        latency[spikes] *= rng.uniform(3, 8, int(spikes.sum()))
+        loss = np.minimum(rng.gamma(1.5, (0.2 + load) / 1.5), 100.0)
+        quality = np.clip(100 - latency * 0.2 - loss * 5, 0, 100)
+
+        dates = np.datetime_as_string(self.first_day + seconds.astype('timedelta64[s]'), unit='s')
+
+        return (
+            self.device_ids[device],
+            self.cities[city],
+            self.states[city],
+            latency.round(2),
+            loss.round(2),
+            quality.round(2),
+            dates,
+        )
+
+    def chunk_rows(self, index: int):
+        """Bloco index como lista de tuplas na ordem de INSERT_SQL"""
+        return list(zip(*(column.tolist() for column in self.chunk(index))))
+
+
+# Gerador de cada processo do pool (criado pelo initializer)
+_generator = None
+
+
+def _init_worker(options: dict) -> None:
+    global _generator
+    _generator = Generator(**options)
+
+
+def _rows(index: int):
+    return _generator.chunk_rows(index)
+
+
+def _write_csv(args):
+    index, directory = args
+    path = os.path.join(directory, f'diagnostics-{index:05d}.csv')
+    rows = _generator.chunk_rows(index)
+
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+
+    return len(rows)
+
+
+def _write_parquet(args):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    index, directory = args
+    path = os.path.join(directory, f'diagnostics-{index:05d}.parquet')
+    columns = _generator.chunk(index)
+
+    table = pa.table({name: pa.array(column.tolist() if column.dtype == object else column) for name, column in zip(COLUMNS, columns)})
+    pq.write_table(table, path)
+
+    return table.num_rows
+
+
+class Progress:
+    """Linhas gravadas e taxa, a cada 5% do total (stderr)"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.started = time.perf_counter()
+        self._next = 0
+
+    def add(self, rows: int) -> None:
+        self.done += rows
+        if self.done >= self._next or self.done == self.total:
+            elapsed = time.perf_counter() - self.started
+            print(f'    {self.done:>13,} / {self.total:,} linhas  ({self.done / max(elapsed, 1e-9):,.0f} linhas/s)', file=sys.stderr)
+            self._next = self.done + max(self.total // 20, 1)
+
+
+def load_sqlite(path: str, generator: Generator, pool, skip_summaries: bool) -> None:
+    """Cria o banco em path (via arquivo temporário, renomeado ao final)"""
+    temporary = path + '.tmp'
+    if os.path.exists(temporary):
+        os.remove(temporary)
+
+    conn = sqlite3.connect(temporary)
+    try:
+        # Carga descartável: sem journal nem fsync até o arquivo ficar pronto
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("PRAGMA locking_mode = EXCLUSIVE")
+        conn.execute("PRAGMA cache_size = -262144")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        schema.reset(conn)
+        schema.migrate(conn)
+
+        # Índices e triggers da tabela são recriados depois da carga
+        deferred = conn.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE tbl_name = 'diagnostics' AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+        ).fetchall()
+        for kind, name, _ in deferred:
+            conn.execute(f'DROP {kind.upper()} "{name}"')
+        conn.commit()
+
+        progress = Progress(generator.rows)
+        cursor = conn.cursor()
+        for rows in pool.imap(_rows, range(generator.chunks)):
+            cursor.executemany(INSERT_SQL, rows)
+            conn.commit()
+            progress.add(len(rows))
+
+        started = time.perf_counter()
+        for _, _, sql in deferred:
+            conn.execute(sql)
+        conn.commit()
+        print(f'Índices e triggers recriados em {time.perf_counter() - started:.1f}s', file=sys.stderr)
+
+        started = time.perf_counter()
+        schema.rebuild_rollups(conn)
+        # Os filtros de cidade e estado dependem da dimensão de localidades
+        locations.rebuild(conn)
+        if not skip_summaries:
+            device_sketches.rebuild(conn)
+            metric_digests.rebuild(conn)
+            anomalies.rebuild(conn)
+        conn.execute("ANALYZE")
+        conn.commit()
+        print(f'Rollups{"" if skip_summaries else ", sketches, digests e médias móveis"} calculados em {time.perf_counter() - started:.1f}s', file=sys.stderr)
+    finally:
+        conn.close()
+
+    os.replace(temporary, path)
+
+
+def write_shards(directory: str, generator: Generator, pool, file_format: str) -> None:
+    os.makedirs(directory, exist_ok=True)
+    writer = _write_csv if file_format == 'csv' else _write_parquet
+
+    progress = Progress(generator.rows)
+    for rows in pool.imap_unordered(writer, [(index, directory) for index in range(generator.chunks)]):
+        progress.add(rows)
+
+
+def _positive(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('Deve ser maior ou igual a 1')
+    return number
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Gera diagnósticos sintéticos em grande escala')
+    parser.add_argument('--scale', type=float, default=1.0, help=f'Fator de escala: {ROWS_PER_SCALE:,} linhas por unidade')
+    parser.add_argument('--rows', type=_positive, help='Quantidade exata de linhas (substitui --scale)')
+    parser.add_argument('--days', type=_positive, default=30)
+    parser.add_argument('--cities', type=_positive, default=len(CITIES), help=f'Até {len(CATALOG)}')
+    parser.add_argument('--devices', type=_positive, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--end-date', type=date.fromisoformat, default=END_DATE, help=f'Último dia dos dados (padrão: {END_DATE})')
+    parser.add_argument('--workers', type=_positive, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=_positive, default=100_000)
+    parser.add_argument('--format', choices=FORMATS, default='sqlite')
+    parser.add_argument('--output', help='Banco (sqlite) ou diretório dos shards (csv/parquet)')
+    parser.add_argument('--force', action='store_true', help='Substitui o banco de saída, se existir')
+    parser.add_argument('--skip-summaries', action='store_true',
+                        help='Não calcula sketches, digests e médias móveis (rode depois flask --app run rebuild-rollups)')
+    args = parser.parse_args()
+
+    if np is None:
+        parser.error('requer o pacote numpy (pip install numpy)')
+    if args.cities > len(CATALOG):
+        parser.error(f'--cities deve ser no máximo {len(CATALOG)}')
+    if args.format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error('--format parquet requer o pacote pyarrow (pip install pyarrow)')
+
+    rows = args.rows or int(args.scale * ROWS_PER_SCALE)
+    if rows < 1:
+        parser.error('--scale deve gerar ao menos uma linha')
+
+    output = args.output or ('./instance/default.db' if args.format == 'sqlite' else './instance/shards')
+    if args.format == 'sqlite' and os.path.exists(output) and not args.force:
+        parser.error(f'{output} já existe (use --force para substituir)')
+
+    options = {
+        'rows': rows, 'days': args.days, 'cities': args.cities, 'devices': args.devices,
+        'seed': args.seed, 'end_date': args.end_date, 'chunk_size': args.chunk_size,
+    }
+    generator = Generator(**options)
+
+    print(f'Gerando {rows:,} linhas ({args.days} dias até {args.end_date}, {args.cities} cidades, '
+          f'{args.devices} dispositivos, semente {args.seed}) em {output} com {args.workers} processo(s)', file=sys.stderr)
+    started = time.perf_counter()
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with multiprocessing.Pool(args.workers, initializer=_init_worker, initargs=(options,)) as pool:
+        if args.format == 'sqlite':
+            load_sqlite(output, generator, pool, args.skip_summaries)
+        else:
+            write_shards(output, generator, pool, args.format)
+
+    print(f'Concluído em {time.perf_counter() - started:.1f}s', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
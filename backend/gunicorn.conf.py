@@ -0,0 +1,100 @@
+"""
+Configuração do gunicorn (produção)
+
+    flask --app wsgi init-db
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Um worker por núcleo disponível para o processo (GUNICORN_WORKERS). Com
+GUNICORN_THREADS=1 (padrão) os workers são 'sync': cada um termina a conexão
+atual antes de sair, então a reciclagem não derruba requisições; acima de 1,
+'gthread', que atende mais conexões lentas por worker mas descarta as que
+ainda estavam na fila do worker reciclado. preload_app carrega a aplicação
+uma vez no mestre; when_ready aquece o estado compartilhado antes do fork dos
+workers e post_fork descarta as conexões herdadas (app.lifecycle).
+
+Reciclagem gradual: cada worker é substituído depois de GUNICORN_MAX_REQUESTS
+requisições, com um desvio aleatório de até GUNICORN_MAX_REQUESTS_JITTER, para
+que não reiniciem todos juntos; o substituto nasce do mestre já aquecido.
+SIGHUP troca todos os workers de forma graciosa (cada um termina as
+requisições em andamento em até GUNICORN_GRACEFUL_TIMEOUT segundos). Com
+preload_app o código não é recarregado pelo SIGHUP: para publicar código
+novo, USR2 inicia um mestre novo ao lado do atual e QUIT encerra o antigo.
+
+/api/metrics soma as métricas de todos os workers pelo diretório
+METRICS_MULTIPROC_DIR (padrão: um por mestre, em /dev/shm ou no diretório
+temporário), limpo quando o mestre inicia; os contadores dos workers
+reciclados continuam somados.
+"""
+import os
+import tempfile
+
+_shared_memory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# Antes de importar a aplicação, cuja configuração é lida na importação
+metrics_dir = os.environ.setdefault(
+    'METRICS_MULTIPROC_DIR',
+    os.path.join(_shared_memory or tempfile.gettempdir(), f'net-diagnostics-metrics-{os.getpid()}')
+)
+
+from app import lifecycle  # noqa: E402
+
+
+def available_cores() -> int:
+    """Núcleos em que o processo pode rodar (afinidade/cpuset), ou os da máquina"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+
+workers = int(os.getenv('GUNICORN_WORKERS', 0)) or available_cores()
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Heartbeat dos workers em memória, quando disponível (evita travas de disco em contêineres)
+if _shared_memory:
+    worker_tmp_dir = _shared_memory
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+
+def on_starting(server):
+    """Mestre iniciando: limpa o diretório das métricas dos workers"""
+    lifecycle.reset_metrics(metrics_dir)
+
+
+def when_ready(server):
+    """Mestre pronto, antes do fork dos workers: aquece o estado compartilhado"""
+    if server.cfg.preload_app:
+        lifecycle.warm_up(server.app.wsgi())
+        server.log.info('Aplicação pré-carregada e aquecida; iniciando %s workers', server.cfg.workers)
+
+
+def post_fork(server, worker):
+    """Worker recém-criado: descarta as conexões herdadas do mestre"""
+    if server.cfg.preload_app:
+        lifecycle.after_fork(server.app.wsgi())
+
+
+def worker_exit(server, worker):
+    """Worker saindo: publica as últimas métricas"""
+    # Também é chamado no mestre para workers que já não existem
+    app = getattr(worker, 'wsgi', None)
+    if worker.pid == os.getpid() and app is not None:
+        lifecycle.before_exit(app)
+
+
+def child_exit(server, worker):
+    """Worker encerrado (no mestre): os contadores dele entram nos acumulados"""
+    lifecycle.worker_exited(metrics_dir, worker.pid)
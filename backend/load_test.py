@@ -0,0 +1,157 @@
+"""
+Teste de carga com tráfego misto contra um servidor em execução
+
+Cada worker mantém uma conexão HTTP persistente e sorteia requisições
+segundo os pesos do seu perfil: os clientes de API (--workers) fazem
+consultas baratas por id e listagens (MIX); os dashboards (--dashboards)
+repetem agregações e estatísticas caras (DASHBOARD_MIX). Ao final mostra
+requisições por segundo e latências (p50/p95/p99) por tipo.
+
+Para comparar os modos, rode contra cada servidor com o mesmo banco:
+
+    python run.py                                   # WSGI (porta 5000)
+    uvicorn asgi:app --port 5001                    # ASGI
+
+    python load_test.py --url http://localhost:5000 --duration 30
+    python load_test.py --url http://localhost:5001 --duration 30
+
+Uso: python load_test.py [--url URL] [--duration S] [--workers N] [--dashboards N]
+                         [--mix nome=peso,...] [--dashboard-mix nome=peso,...]
+"""
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Requisições do tráfego misto: nome -> caminho ({id} é sorteado)
+REQUESTS = {
+    'detail': '/api/diagnostics/{id}',
+    'list': '/api/diagnostics?limit=20&page={page}',
+    'aggregate': '/api/diagnostics/aggregate?group_by=day',
+    'aggregate_city': '/api/diagnostics/aggregate?group_by=city',
+    'statistics': '/api/diagnostics/statistics?distinct=exact',
+}
+
+MIX = 'detail=90,list=10'
+DASHBOARD_MIX = 'aggregate=2,aggregate_city=1,statistics=1'
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in REQUESTS:
+            raise argparse.ArgumentTypeError(f'Requisição desconhecida: {name}')
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def login(url):
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+    conn.request('POST', '/api/auth/login', json.dumps({'username': 'admin', 'password': 'admin'}), {'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    token = json.loads(response.read())['token']
+    conn.close()
+    return token
+
+
+def total_rows(url, headers):
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+    conn.request('GET', '/api/diagnostics?limit=1&count=estimate', headers=headers)
+    total = json.loads(conn.getresponse().read())['pagination']['total']
+    conn.close()
+    return max(total, 1)
+
+
+def worker(url, headers, mix, rows, deadline, results, seed):
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=120)
+
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        path = REQUESTS[name].format(id=rng.randint(1, rows), page=rng.randint(1, max(rows // 20, 1)))
+
+        started = time.perf_counter()
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            ok = response.status < 500
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=120)
+            ok = False
+
+        results.append((name, time.perf_counter() - started, ok))
+
+    conn.close()
+
+
+def percentile(values, q):
+    return values[min(int(q * len(values)), len(values) - 1)] * 1000 if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Teste de carga com tráfego misto')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--dashboards', type=int, default=4)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(MIX))
+    parser.add_argument('--dashboard-mix', type=parse_mix, default=parse_mix(DASHBOARD_MIX))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='Imprime o resumo em JSON')
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    headers = {'Authorization': f'Bearer {login(url)}'}
+    rows = total_rows(url, headers)
+
+    results = []
+    deadline = time.perf_counter() + args.duration
+    profiles = [args.mix] * args.workers + [args.dashboard_mix] * args.dashboards
+    threads = [
+        threading.Thread(target=worker, args=(url, headers, mix, rows, deadline, results, args.seed + index))
+        for index, mix in enumerate(profiles)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    summary = {'url': args.url, 'workers': args.workers, 'dashboards': args.dashboards, 'seconds': round(elapsed, 2), 'requests': {}}
+    for name in {**args.mix, **args.dashboard_mix}:
+        latencies = sorted(latency for kind, latency, _ in results if kind == name)
+        summary['requests'][name] = {
+            'count': len(latencies),
+            'errors': sum(1 for kind, _, ok in results if kind == name and not ok),
+            'p50_ms': round(percentile(latencies, 0.50), 1),
+            'p95_ms': round(percentile(latencies, 0.95), 1),
+            'p99_ms': round(percentile(latencies, 0.99), 1),
+        }
+    summary['total'] = len(results)
+    summary['errors'] = sum(1 for _, _, ok in results if not ok)
+    summary['rps'] = round(len(results) / elapsed, 1)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"{args.url}: {summary['total']} requisições em {summary['seconds']}s, "
+              f"{summary['rps']} req/s, {summary['errors']} erros")
+        for name, stats in summary['requests'].items():
+            print(f"  {name:<15} {stats['count']:>7}  p50 {stats['p50_ms']:>8} ms  "
+                  f"p95 {stats['p95_ms']:>8} ms  p99 {stats['p99_ms']:>8} ms  erros {stats['errors']}")
+
+    return 1 if summary['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,20 +1,24 @@
-from app import create_app
-import os
-import sqlite3
-from create_and_populate_db import create_table, populate, DB_NAME
-
-print("Verificando banco de dados...")
-os.makedirs("./instance", exist_ok=True)
+"""
+Servidor de desenvolvimento
 
-db_already_exists = os.path.exists(DB_NAME)
+    python run.py
 
-if not db_already_exists:
-    conn = sqlite3.connect(DB_NAME)
-    create_table(conn)
-    populate(conn)
+Prepara o banco (como `flask --app run init-db --sample`) e sobe o servidor
+do Flask com o reloader e o debugger, que só aqui são ligados por padrão
+(FLASK_DEBUG=False desliga). Em produção use gunicorn.conf.py (wsgi.py), com
+o banco preparado antes por `flask init-db`.
+"""
+from app import create_app
+from app.commands import init_database
+import os
 
 app = create_app()
 
 if __name__ == '__main__':
+    print("Verificando banco de dados...")
+    with app.app_context():
+        init_database(sample=True)
+
     port = int(os.getenv('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    debug = os.getenv('FLASK_DEBUG', 'True') == 'True'
+    app.run(host='0.0.0.0', port=port, debug=debug)
@@ -0,0 +1,86 @@
+"""
+Fixtures comuns dos testes
+
+Cada aplicação usa um banco SQLite próprio num diretório temporário, com as
+migrações aplicadas e, por padrão, os dados de exemplo de
+create_and_populate_db. As extensões de app.extensions são globais: vale
+sempre a aplicação criada por último, então cada teste (ou módulo) cria a
+sua e a descarta ao final.
+"""
+import sqlite3
+
+import pytest
+
+from app import create_app
+from app.extensions import db, database
+from create_and_populate_db import create_table, populate
+
+
+def create_database(path, sample: bool = True) -> None:
+    """Cria o banco com o schema atual e, com sample, os dados de exemplo"""
+    conn = sqlite3.connect(path)
+    try:
+        create_table(conn)
+        if sample:
+            populate(conn)
+        conn.execute('ANALYZE')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def make_app(path, **config):
+    """Aplicação sobre o banco path, sem cache de leituras (config substitui o restante)"""
+    return create_app(dict({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'CACHE_BACKEND': 'none',
+        'TESTING': True,
+    }, **config))
+
+
+def dispose(app) -> None:
+    """Fecha as conexões abertas pela aplicação"""
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+        if database.read_engine is not None:
+            database.read_engine.dispose()
+
+
+def login(client) -> dict:
+    """Cabeçalhos com o token do usuário padrão"""
+    response = client.post('/api/auth/login', json={'username': 'admin', 'password': 'admin'})
+    return {'Authorization': f"Bearer {response.get_json()['token']}"}
+
+
+@pytest.fixture
+def app_factory(tmp_path):
+    """Cria aplicações sobre bancos novos (make_app) e as descarta ao final do teste"""
+    apps = []
+
+    def factory(sample: bool = True, **config):
+        path = tmp_path / f'diagnostics-{len(apps)}.db'
+        create_database(path, sample)
+        app = make_app(path, **config)
+        apps.append(app)
+        return app
+
+    yield factory
+
+    for app in apps:
+        dispose(app)
+
+
+@pytest.fixture
+def app(app_factory):
+    return app_factory()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def auth_headers(client):
+    return login(client)
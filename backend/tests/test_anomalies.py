@@ -0,0 +1,220 @@
+"""
+Médias móveis da detecção de anomalias (app.models.anomalies)
+
+A matemática do EWMA por grupo, a atualização incremental contra o recálculo
+completo e o ranking de /api/diagnostics/anomalies com a atualização adiada
+(app.services.summary_refresh) pendente e já executada.
+"""
+import math
+import random
+import sqlite3
+import statistics
+import time
+
+import pytest
+
+from app.extensions import summaries
+from app.models import anomalies
+from app.models.anomalies import ALPHA, MIN_STD, _Group
+from conftest import login
+
+DAY = '2026-10-01'
+
+
+def reference(values):
+    """Média e variância de referência da última leitura, pela recorrência da documentação"""
+    mean = variance = 0.0
+    for n, value in enumerate(values[:-1], start=1):
+        weight = max(ALPHA, 1 / n)
+        diff = value - mean
+        mean += weight * diff
+        variance = (1 - weight) * (variance + weight * diff * diff)
+    return mean, variance
+
+
+def make_row(index, device_id='DEV001', city='Recife', state='PE', latency=50.0, loss=1.0, quality=90.0):
+    return {
+        'device_id': device_id, 'city': city, 'state': state,
+        'latency_ms': latency, 'packet_loss': loss, 'quality_of_service': quality,
+        'date': f'{DAY}T{index // 3600 % 24:02d}:{index // 60 % 60:02d}:{index % 60:02d}',
+    }
+
+
+def random_rows(count, seed):
+    rng = random.Random(seed)
+    cities = [('Recife', 'PE'), ('Salvador', 'BA'), ('Curitiba', 'PR')]
+    rows = []
+    for index in range(count):
+        city, state = rng.choice(cities)
+        rows.append(make_row(
+            index, f'DEV{rng.randrange(8):03d}', city, state,
+            latency=round(rng.gauss(50, 5) + (80 if rng.random() < 0.02 else 0), 2),
+            loss=round(abs(rng.gauss(1, 0.3)), 2),
+            quality=round(rng.uniform(80, 95), 2),
+        ))
+    return rows
+
+
+def ingest(client, headers, rows):
+    response = client.post('/api/diagnostics/batch', json=rows, headers=headers)
+    assert response.status_code == 201, response.get_json()
+
+
+def ewma_tables(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {
+            table: conn.execute(f"SELECT * FROM {table} ORDER BY 1, 2").fetchall()
+            for table, _, _ in anomalies.SCOPES.values()
+        }
+    finally:
+        conn.close()
+
+
+def database_path(app):
+    return app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+
+
+def test_first_readings_use_the_simple_mean_and_variance():
+    values = [52.0, 48.5, 51.0, 49.0, 50.5, 47.0, 53.0, 50.0, 49.5, 75.0]
+    group = _Group()
+    for index, value in enumerate(values, start=1):
+        group.add(index, DAY, (value, 1.0, 90.0))
+
+    last, mean, variance, z = group.metrics[0]
+    previous = values[:-1]
+
+    assert group.samples == len(values)
+    assert last == values[-1]
+    assert mean == pytest.approx(statistics.fmean(previous))
+    assert variance == pytest.approx(statistics.pvariance(previous))
+    assert z == pytest.approx((values[-1] - mean) / math.sqrt(variance))
+
+
+def test_long_sequences_follow_the_exponential_recurrence():
+    rng = random.Random(7)
+    values = [rng.gauss(50, 4) for _ in range(200)] + [90.0]
+    group = _Group()
+    for index, value in enumerate(values, start=1):
+        group.add(index, DAY, (value, 1.0, 90.0))
+
+    mean, variance = reference(values)
+    last, stored_mean, stored_variance, z = group.metrics[0]
+
+    assert stored_mean == pytest.approx(mean)
+    assert stored_variance == pytest.approx(variance)
+    assert z == pytest.approx((90.0 - mean) / max(math.sqrt(variance), MIN_STD[0]))
+    assert z > 5
+
+
+def test_constant_metrics_use_the_minimum_deviation():
+    group = _Group()
+    for index in range(1, 31):
+        group.add(index, DAY, (50.0, 0.0, 90.0))
+    group.add(31, DAY, (50.0, 0.5, 90.0))
+
+    assert group.metrics[1][3] == pytest.approx(0.5 / MIN_STD[1])
+    assert group.to_row()[-1] == pytest.approx(0.5 / MIN_STD[1])
+
+
+def test_incremental_refresh_matches_rebuild(app_factory):
+    app = app_factory(sample=False, SUMMARY_REFRESH='manual')
+    client = app.test_client()
+    headers = login(client)
+    rows = random_rows(600, seed=1)
+
+    for start in range(0, len(rows), 150):
+        ingest(client, headers, rows[start:start + 150])
+        with app.app_context():
+            summaries.run()
+
+    path = database_path(app)
+    incremental = ewma_tables(path)
+
+    conn = sqlite3.connect(path)
+    anomalies.rebuild(conn)
+    conn.close()
+
+    assert incremental == ewma_tables(path)
+    assert incremental['diagnostics_device_ewma']
+
+
+@pytest.mark.parametrize('scope', ['all', 'device', 'location'])
+def test_ranking_is_the_same_before_and_after_the_deferred_refresh(app_factory, scope):
+    app = app_factory(sample=False, SUMMARY_REFRESH='manual')
+    client = app.test_client()
+    headers = login(client)
+    url = f'/api/diagnostics/anomalies?scope={scope}&min_z=0&min_samples=5&limit=5'
+
+    ingest(client, headers, random_rows(400, seed=2))
+    with app.app_context():
+        summaries.run()
+
+    # Lote novo com uma leitura fora da curva, ainda não incorporado
+    ingest(client, headers, random_rows(100, seed=3) + [make_row(4000, 'DEV001', latency=400.0)])
+    pending = client.get(url, headers=headers).get_json()
+
+    with app.app_context():
+        assert summaries.run()['anomalies'] == 101
+    refreshed = client.get(url, headers=headers).get_json()
+
+    assert pending == refreshed
+    assert len(refreshed['data']) == (3 if scope == 'location' else 5)
+    # A leitura fora da curva lidera o ranking do dispositivo e o da localidade
+    top = refreshed['data'][0]
+    assert top['metrics']['latency_ms']['value'] == 400.0
+    assert top.get('device_id', 'DEV001') == 'DEV001' and top.get('city', 'Recife') == 'Recife'
+
+
+def test_deleted_rows_are_replayed_before_the_refresh(app_factory):
+    app = app_factory(sample=False, SUMMARY_REFRESH='manual')
+    client = app.test_client()
+    headers = login(client)
+    url = '/api/diagnostics/anomalies?min_z=0&min_samples=1&limit=100'
+
+    ingest(client, headers, random_rows(300, seed=4) + [make_row(4000, 'DEV001', latency=400.0)])
+    with app.app_context():
+        summaries.run()
+
+    conn = sqlite3.connect(database_path(app))
+    conn.execute("DELETE FROM diagnostics WHERE latency_ms = 400.0")
+    conn.commit()
+    conn.close()
+
+    pending = client.get(url, headers=headers).get_json()
+    with app.app_context():
+        summaries.run()
+
+    assert pending == client.get(url, headers=headers).get_json()
+    assert all(item['metrics']['latency_ms']['value'] != 400.0 for item in pending['data'])
+
+
+def test_inline_mode_refreshes_within_the_batch(app_factory):
+    app = app_factory(sample=False, SUMMARY_REFRESH='inline')
+    client = app.test_client()
+    ingest(client, login(client), random_rows(50, seed=5))
+
+    conn = sqlite3.connect(database_path(app))
+    try:
+        last_id, max_id = conn.execute(
+            "SELECT last_id, (SELECT MAX(id) FROM diagnostics) FROM diagnostics_ewma_state"
+        ).fetchone()
+    finally:
+        conn.close()
+
+    assert last_id == max_id == 50
+
+
+def test_background_mode_refreshes_after_the_commit(app_factory):
+    app = app_factory(sample=False, SUMMARY_REFRESH='background', SUMMARY_REFRESH_DELAY=0.01)
+    client = app.test_client()
+    ingest(client, login(client), random_rows(50, seed=6))
+
+    conn = sqlite3.connect(database_path(app))
+    try:
+        deadline = time.monotonic() + 5
+        while conn.execute("SELECT last_id FROM diagnostics_ewma_state").fetchone()[0] < 50:
+            assert time.monotonic() < deadline, 'atualização adiada não rodou'
+            time.sleep(0.01)
+    finally:
+        conn.close()
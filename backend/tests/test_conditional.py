@@ -0,0 +1,146 @@
+"""
+GET condicional (app.services.conditional)
+
+O ETag pela versão dos dados e pelos parâmetros normalizados, o 304 sem
+executar a consulta e a troca do ETag a cada inserção, alteração ou remoção
+(e não a cada atualização dos resumos adiados).
+"""
+import sqlite3
+
+import pytest
+
+from app.extensions import summaries
+from app.services.diagnostics_service import DiagnosticsService
+from conftest import login
+
+STATISTICS = '/api/diagnostics/statistics'
+
+ROW = {
+    'device_id': 'DEV001', 'city': 'Recife', 'state': 'PE',
+    'latency_ms': 50.0, 'packet_loss': 1.0, 'quality_of_service': 90.0, 'date': '2026-10-01T12:00:00',
+}
+
+
+@pytest.fixture
+def app(app_factory):
+    return app_factory(SUMMARY_REFRESH='manual')
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = login(client)['Authorization']
+    return client
+
+
+@pytest.fixture
+def executions(monkeypatch):
+    calls = []
+    get_statistics = DiagnosticsService.get_statistics
+
+    def counted(*args, **kwargs):
+        calls.append(1)
+        return get_statistics(*args, **kwargs)
+
+    monkeypatch.setattr(DiagnosticsService, 'get_statistics', staticmethod(counted))
+    return calls
+
+
+def etag(client, url, **params):
+    response = client.get(url, query_string=params)
+    assert response.status_code == 200
+    return response.headers['ETag']
+
+
+def execute(app, sql, *params):
+    conn = sqlite3.connect(app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):])
+    try:
+        conn.execute(sql, params)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_matching_if_none_match_is_a_304_without_running_the_query(client, executions):
+    first = client.get(STATISTICS)
+    tag = first.headers['ETag']
+
+    assert first.status_code == 200 and tag.startswith('W/"')
+    assert len(executions) == 1
+
+    for header in (tag, tag[2:], f'"outro", {tag}'):
+        response = client.get(STATISTICS, headers={'If-None-Match': header})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == tag
+
+    assert len(executions) == 1
+    assert client.get(STATISTICS, headers={'If-None-Match': 'W/"outro"'}).status_code == 200
+    assert len(executions) == 2
+
+
+def test_etag_follows_the_normalized_parameters(client):
+    base = etag(client, STATISTICS, city='Recife', state='PE')
+
+    assert etag(client, STATISTICS, state='PE', city='Recife') == base
+    assert etag(client, STATISTICS, city=' RECIFE ', state='pe') == base
+    assert etag(client, STATISTICS, city='Recife') != base
+    assert etag(client, '/api/diagnostics', city='Recife', state='PE') != base
+
+
+def test_etag_changes_with_the_data(app, client):
+    tags = [etag(client, STATISTICS)]
+
+    assert client.post('/api/diagnostics/batch', json=[ROW]).status_code == 201
+    tags.append(etag(client, STATISTICS))
+
+    execute(app, "UPDATE diagnostics SET latency_ms = latency_ms + 1 WHERE id = 1")
+    tags.append(etag(client, STATISTICS))
+
+    execute(app, "DELETE FROM diagnostics WHERE id = 2")
+    tags.append(etag(client, STATISTICS))
+
+    assert len(set(tags)) == 4
+    assert client.get(STATISTICS, headers={'If-None-Match': tags[0]}).status_code == 200
+
+
+def test_deferred_summary_refresh_keeps_the_etag(app, client):
+    assert client.post('/api/diagnostics/batch', json=[ROW] * 3).status_code == 201
+    url = '/api/diagnostics/aggregate'
+    tag = etag(client, url, group_by='city', percentiles='50,95')
+
+    with app.app_context():
+        summaries.run()
+
+    response = client.get(url, query_string={'group_by': 'city', 'percentiles': '50,95'}, headers={'If-None-Match': tag})
+    assert response.status_code == 304
+
+
+def test_errors_are_not_tagged(client):
+    response = client.get(STATISTICS, query_string={'latency_ms': 'between:5,1'})
+
+    assert response.status_code == 400
+    assert 'ETag' not in response.headers
+
+
+def test_cache_control_is_sent_with_200_and_304(app_factory):
+    app = app_factory(HTTP_CACHE_CONTROL='private, max-age=30')
+    client = app.test_client()
+    headers = login(client)
+
+    first = client.get(STATISTICS, headers=headers)
+    second = client.get(STATISTICS, headers=dict(headers, **{'If-None-Match': first.headers['ETag']}))
+
+    assert second.status_code == 304
+    assert first.headers['Cache-Control'] == second.headers['Cache-Control'] == 'private, max-age=30'
+
+
+def test_disabled_etags(app_factory):
+    app = app_factory(ETAG_ENABLED=False)
+    client = app.test_client()
+    headers = login(client)
+
+    response = client.get(STATISTICS, headers=dict(headers, **{'If-None-Match': '*'}))
+
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
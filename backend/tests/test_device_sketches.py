@@ -0,0 +1,103 @@
+"""
+Sketches HyperLogLog de dispositivos (app.utils.hyperloglog, app.models.device_sketches)
+
+O erro da estimativa contra o erro padrão documentado, a combinação de
+sketches como união dos conjuntos e a contagem de dispositivos de
+/api/diagnostics/statistics com a atualização adiada dos sketches pendente e
+já executada.
+"""
+import random
+
+import pytest
+
+from app.extensions import summaries
+from app.utils.hyperloglog import REGISTERS, STANDARD_ERROR, HyperLogLog
+from conftest import login
+
+
+def sketch_of(values):
+    sketch = HyperLogLog()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+
+def devices(start, stop):
+    return [f'DEV{index:07d}' for index in range(start, stop)]
+
+
+# Fora da transição do linear counting para o estimador bruto (~2,5 × REGISTERS)
+@pytest.mark.parametrize('count', [1000, 5000, 50000, 200000])
+def test_estimate_is_within_three_standard_errors(count):
+    estimate = sketch_of(devices(0, count)).count()
+
+    assert abs(estimate - count) <= 3 * STANDARD_ERROR * count
+
+
+def test_small_sets_are_nearly_exact():
+    for count in (0, 1, 10, 100):
+        assert abs(sketch_of(devices(0, count)).count() - count) <= max(1, count // 50)
+
+
+def test_repeated_values_do_not_change_the_sketch():
+    values = devices(0, 3000)
+    sketch = sketch_of(values * 3)
+
+    assert sketch.registers == sketch_of(values).registers
+
+
+def test_merge_is_the_union_of_the_sets():
+    first, second = devices(0, 30000), devices(20000, 60000)
+    merged = sketch_of(first)
+    merged.merge(sketch_of(second))
+    union = HyperLogLog.union([sketch_of(first).to_bytes(), sketch_of(second).to_bytes()])
+
+    assert merged.registers == union.registers == sketch_of(first + second).registers
+    assert abs(merged.count() - 60000) <= 3 * STANDARD_ERROR * 60000
+
+
+def test_serialized_sketch_round_trips():
+    sketch = sketch_of(devices(0, 500))
+
+    assert HyperLogLog(sketch.to_bytes()).registers == sketch.registers
+    assert HyperLogLog.union([]).count() == 0
+    with pytest.raises(ValueError):
+        HyperLogLog(bytes(REGISTERS - 1))
+
+
+@pytest.mark.parametrize('query', ['', 'city=Recife'])
+def test_device_count_is_the_same_before_and_after_the_deferred_refresh(app_factory, query):
+    app = app_factory(sample=False, SUMMARY_REFRESH='manual')
+    client = app.test_client()
+    headers = login(client)
+    rng = random.Random(8)
+    cities = [('Recife', 'PE'), ('Salvador', 'BA')]
+
+    def batch(first_device, days):
+        return [
+            {
+                'device_id': f'DEV{first_device + rng.randrange(300):04d}', 'city': city, 'state': state,
+                'latency_ms': 50.0, 'packet_loss': 1.0, 'quality_of_service': 90.0,
+                'date': f'2026-10-{day:02d}T{rng.randrange(24):02d}:00:00',
+            }
+            for day in days for city, state in cities for _ in range(100)
+        ]
+
+    url = f'/api/diagnostics/statistics?distinct=approx&{query}'
+    assert client.post('/api/diagnostics/batch', json=batch(0, range(1, 4)), headers=headers).status_code == 201
+    with app.app_context():
+        summaries.run()
+
+    # Dispositivos novos e repetidos, em dias novos e já resumidos
+    assert client.post('/api/diagnostics/batch', json=batch(150, range(3, 6)), headers=headers).status_code == 201
+    pending = client.get(url, headers=headers).get_json()
+
+    with app.app_context():
+        assert summaries.run()['device_sketches'] == 600
+    refreshed = client.get(url, headers=headers).get_json()
+    exact = client.get(url.replace('approx', 'exact'), headers=headers).get_json()
+
+    assert pending == refreshed
+    assert refreshed['data']['total_diagnostics'] == exact['data']['total_diagnostics'] == (600 if query else 1200)
+    count = exact['data']['total_devices']
+    assert abs(refreshed['data']['total_devices'] - count) <= 3 * STANDARD_ERROR * count
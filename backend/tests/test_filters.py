@@ -0,0 +1,207 @@
+"""
+Linguagem de filtros (app.utils.filters) e compilador (app.services.filter_compiler)
+
+A leitura das expressões 'operador:valor', o SQL canônico por forma de filtro
+com o cache de planos e a contagem de /api/diagnostics e /statistics com
+filtros contra a mesma condição avaliada em Python.
+"""
+import random
+
+import pytest
+
+from app.models.locations import fold
+from app.services.filter_compiler import FilterCompiler
+from app.utils.filters import MAX_VALUES, location_filters, only_locations, parse, without
+from conftest import create_database, dispose, login, make_app
+
+
+@pytest.mark.parametrize('field, expression, condition', [
+    ('city', 'salv', ('city', 'contains', ('salv',))),
+    ('city', 'eq:São Paulo', ('city', 'eq', ('sao paulo',))),
+    ('city', 'in: Salvador , RECIFE,salvador', ('city', 'in', ('salvador', 'recife'))),
+    ('state', 'eq:ba', ('state', 'eq', ('ba',))),
+    ('device_id', 'DEV001', ('device_id', 'eq', ('DEV001',))),
+    ('device_id', 'in:DEV002,DEV001,DEV002', ('device_id', 'in', ('DEV002', 'DEV001'))),
+    ('latency_ms', '60', ('latency_ms', 'eq', (60.0,))),
+    ('latency_ms', 'gt:60.5', ('latency_ms', 'gt', (60.5,))),
+    ('packet_loss', 'between:1, 5', ('packet_loss', 'between', (1.0, 5.0))),
+    ('quality_of_service', 'lte:-0', ('quality_of_service', 'lte', (0.0,))),
+])
+def test_expressions_become_conditions(field, expression, condition):
+    assert parse(field, expression) == condition
+
+
+def test_unknown_operators_are_part_of_the_value():
+    # 'gt' não é operador de texto nem 'foo' de localidade: o valor é a expressão inteira
+    assert parse('device_id', 'gt:5') == ('device_id', 'eq', ('gt:5',))
+    assert parse('city', 'foo:bar') == ('city', 'contains', ('foo:bar',))
+
+
+@pytest.mark.parametrize('field, expression, message', [
+    ('city', 'in:Recife,,Salvador', 'valores vazios'),
+    ('city', 'eq: ', 'valores vazios'),
+    ('device_id', 'in:' + ','.join(f'D{index}' for index in range(MAX_VALUES + 1)), f'no máximo {MAX_VALUES}'),
+    ('latency_ms', 'between:1', 'dois valores'),
+    ('latency_ms', 'between:1,2,3', 'dois valores'),
+    ('latency_ms', 'between:5,1', 'crescente'),
+    ('latency_ms', 'gt:rápido', 'numérico'),
+    ('latency_ms', 'inf', 'finito'),
+    ('packet_loss', 'nan', 'finito'),
+])
+def test_invalid_expressions_are_rejected(field, expression, message):
+    with pytest.raises(ValueError, match=message):
+        parse(field, expression)
+
+
+def test_condition_helpers():
+    filters = (parse('city', 'rec'), parse('device_id', 'DEV001'), parse('state', 'pe'))
+
+    assert without(filters, 'device_id') == (filters[0], filters[2])
+    assert location_filters(filters) == (filters[0], filters[2])
+    assert not only_locations(filters) and only_locations(without(filters, 'device_id'))
+    assert only_locations(())
+
+
+def resolve_stub(field, operator, values):
+    return [len(value) for value in values]
+
+
+def test_sql_depends_only_on_the_filter_shape():
+    compiler = FilterCompiler()
+    first = (parse('device_id', 'in:DEV001,DEV002'), parse('latency_ms', 'between:1,5'))
+    second = (parse('device_id', 'in:DEV009'), parse('latency_ms', 'between:10,50'))
+
+    sql, params = compiler.compile(first, resolve_stub, '2026-10-01', '2026-10-31')
+    other_sql, other_params = compiler.compile(second, resolve_stub, '2026-09-01', '2026-09-30')
+
+    assert sql == other_sql
+    assert '2026' not in sql and 'DEV' not in sql
+    assert params == {
+        'device_id': '["DEV001", "DEV002"]', 'latency_ms_low': 1.0, 'latency_ms_high': 5.0,
+        'start_date': '2026-10-01', 'end_date': '2026-11-01',
+    }
+    assert other_params['device_id'] == '["DEV009"]'
+    assert (compiler.stats()['hits'], compiler.stats()['misses']) == (1, 1)
+
+
+def test_shapes_differ_by_operator_dates_and_date_column():
+    compiler = FilterCompiler()
+    gt = (parse('latency_ms', 'gt:5'),)
+
+    sqls = {
+        compiler.compile(gt, resolve_stub)[0],
+        compiler.compile((parse('latency_ms', 'lt:5'),), resolve_stub)[0],
+        compiler.compile(gt, resolve_stub, start_date='2026-10-01')[0],
+        compiler.compile(gt, resolve_stub, end_date='2026-10-01')[0],
+        compiler.compile(gt, resolve_stub, '2026-10-01', date_column='day')[0],
+    }
+
+    assert len(sqls) == 5
+    assert compiler.stats()['entries'] == 5
+
+
+def test_location_conditions_use_the_resolved_ids():
+    compiler = FilterCompiler()
+    calls = []
+
+    def resolve(field, operator, values):
+        calls.append((field, operator, values))
+        return [3, 7]
+
+    sql, params = compiler.compile((parse('city', 'in:Recife,Salvador'),), resolve)
+
+    assert calls == [('city', 'in', ('recife', 'salvador'))]
+    assert params == {'city': '[3, 7]'}
+    assert 'diagnostics_locations' in sql
+
+
+def test_plan_cache_evicts_the_least_recently_used_shape():
+    compiler = FilterCompiler()
+    compiler.max_plans = 2
+    shapes = [(parse(field, '1'),) for field in ('latency_ms', 'packet_loss', 'quality_of_service')]
+
+    compiler.compile(shapes[0], resolve_stub)
+    compiler.compile(shapes[1], resolve_stub)
+    compiler.compile(shapes[0], resolve_stub)
+    compiler.compile(shapes[2], resolve_stub)
+    compiler.compile(shapes[0], resolve_stub)
+
+    stats = compiler.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['entries']) == (2, 3, 1, 2)
+    assert stats['hit_ratio'] == 0.4
+
+
+CITIES = [('Recife', 'PE'), ('Salvador', 'BA'), ('São Paulo', 'SP'), ('São José', 'SC'), ('Feira de Santana', 'BA')]
+
+
+def matches(row, field, operator, values):
+    """Condição avaliada em Python, como a documentação a descreve"""
+    value = row[field]
+    if field in ('city', 'state'):
+        value = fold(value)
+        if operator == 'contains':
+            return any(term in value for term in values)
+        return value in values
+    if operator == 'in' or operator == 'eq':
+        return value in values
+    if operator == 'between':
+        return values[0] <= value <= values[1]
+    return {'gt': value > values[0], 'gte': value >= values[0], 'lt': value < values[0], 'lte': value <= values[0]}[operator]
+
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory):
+    path = tmp_path_factory.mktemp('filters') / 'diagnostics.db'
+    create_database(path, sample=False)
+    app = make_app(path)
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = login(client)['Authorization']
+
+    rng = random.Random(9)
+    rows = []
+    for index in range(400):
+        city, state = rng.choice(CITIES)
+        rows.append({
+            'device_id': f'DEV{rng.randrange(12):03d}', 'city': city, 'state': state,
+            'latency_ms': round(rng.uniform(20, 120), 1), 'packet_loss': round(rng.uniform(0, 6), 1),
+            'quality_of_service': round(rng.uniform(60, 100), 1),
+            'date': f'2026-10-{1 + index % 20:02d}T{index % 24:02d}:00:00',
+        })
+    assert client.post('/api/diagnostics/batch', json=rows).status_code == 201
+
+    yield client, rows
+    dispose(app)
+
+
+@pytest.mark.parametrize('query', [
+    {'city': 'sao'},
+    {'city': 'in:salvador,RECIFE'},
+    {'city': 'eq:São Paulo'},
+    {'state': 'ba'},
+    {'state': 'in:sp,sc', 'city': 'jose'},
+    {'device_id': 'in:DEV001,DEV005'},
+    {'latency_ms': 'gt:100'},
+    {'latency_ms': 'between:40,60', 'packet_loss': 'lte:2.5'},
+    {'quality_of_service': 'gte:90', 'state': 'eq:BA', 'device_id': 'DEV003'},
+])
+def test_endpoint_counts_match_the_conditions(dataset, query):
+    client, rows = dataset
+    conditions = [parse(field, expression) for field, expression in query.items()]
+    expected = [row for row in rows if all(matches(row, *condition) for condition in conditions)]
+    assert expected
+
+    listing = client.get('/api/diagnostics', query_string=dict(query, limit=100, count='exact')).get_json()
+    statistics = client.get('/api/diagnostics/statistics', query_string=dict(query, distinct='exact')).get_json()
+
+    assert listing['pagination']['total'] == len(expected)
+    assert {item['device_id'] for item in listing['data']} <= {row['device_id'] for row in expected}
+    assert statistics['data']['total_diagnostics'] == len(expected)
+    assert statistics['data']['total_devices'] == len({row['device_id'] for row in expected})
+
+
+def test_endpoint_rejects_invalid_filters(dataset):
+    client, _ = dataset
+    response = client.get('/api/diagnostics', query_string={'latency_ms': 'between:5,1'})
+
+    assert response.status_code == 400
+    assert 'crescente' in response.get_json()['error']
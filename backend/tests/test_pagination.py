@@ -0,0 +1,116 @@
+"""
+Paginação por cursor (app.utils.pagination)
+
+A codificação dos cursores opacos, a rejeição de cursores adulterados e a
+navegação de /api/diagnostics por next_cursor e prev_cursor contra a
+paginação por página, com várias leituras na mesma data.
+"""
+import base64
+import json
+
+import pytest
+
+from app.utils.pagination import CURSOR_NEXT, CURSOR_PREV, decode_cursor, encode_cursor
+from app.utils.validators import ValidationError
+from conftest import login
+
+
+def raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+
+
+@pytest.mark.parametrize('date, diagnostic_id, direction', [
+    ('2026-10-01T12:00:00', 1, CURSOR_NEXT),
+    ('2026-10-01T12:00:00.123456', 2 ** 53, CURSOR_PREV),
+    ('São Paulo ~?/+', 0, CURSOR_NEXT),
+])
+def test_cursor_round_trips(date, diagnostic_id, direction):
+    cursor = encode_cursor(date, diagnostic_id, direction)
+
+    assert decode_cursor(cursor) == (date, diagnostic_id, direction)
+    assert decode_cursor(f'  {cursor} ') == (date, diagnostic_id, direction)
+    # Seguro em URL sem escapar
+    assert not set(cursor) & set('+/=')
+
+
+@pytest.mark.parametrize('cursor', [None, '', '   '])
+def test_missing_cursor_is_the_first_page(cursor):
+    assert decode_cursor(cursor) is None
+
+
+@pytest.mark.parametrize('cursor', [
+    'não-é-base64',
+    'abc',
+    raw_cursor({'date': '2026-10-01', 'id': 1}),
+    raw_cursor(['2026-10-01', 1]),
+    raw_cursor(['2026-10-01', '1', CURSOR_NEXT]),
+    raw_cursor(['2026-10-01', 1.5, CURSOR_NEXT]),
+    raw_cursor(['2026-10-01', True, CURSOR_NEXT]),
+    raw_cursor([20261001, 1, CURSOR_NEXT]),
+    raw_cursor(['2026-10-01', 1, 'up']),
+    base64.urlsafe_b64encode(b'\xff\xfe').decode('ascii'),
+])
+def test_tampered_cursors_are_rejected(cursor):
+    with pytest.raises(ValidationError, match="'cursor'"):
+        decode_cursor(cursor)
+
+
+@pytest.fixture
+def client(app_factory):
+    app = app_factory(sample=False)
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = login(client)['Authorization']
+
+    # 23 leituras em 5 datas: páginas de 4 cortam grupos de datas iguais
+    rows = [
+        {
+            'device_id': f'DEV{index:03d}', 'city': 'Recife', 'state': 'PE',
+            'latency_ms': 50.0, 'packet_loss': 1.0, 'quality_of_service': 90.0,
+            'date': f'2026-10-0{1 + index % 5}T12:00:00',
+        }
+        for index in range(23)
+    ]
+    assert client.post('/api/diagnostics/batch', json=rows).status_code == 201
+    return client
+
+
+def test_cursor_pages_match_offset_pages(client):
+    expected = client.get('/api/diagnostics?page=1&limit=100').get_json()['data']
+    pages = []
+    cursor = ''
+
+    while True:
+        body = client.get(f'/api/diagnostics?pagination=cursor&limit=4&cursor={cursor}').get_json()
+        pages.append(body['data'])
+        assert body['pagination']['has_prev'] == (len(pages) > 1)
+        if not body['pagination']['has_next']:
+            assert body['pagination']['next_cursor'] is None
+            break
+        cursor = body['pagination']['next_cursor']
+
+    assert [len(page) for page in pages] == [4, 4, 4, 4, 4, 3]
+    assert [item['id'] for page in pages for item in page] == [item['id'] for item in expected]
+    assert expected == sorted(expected, key=lambda item: (item['date'], item['id']), reverse=True)
+
+
+def test_prev_cursor_returns_the_previous_page(client):
+    pages = [client.get('/api/diagnostics?pagination=cursor&limit=4').get_json()]
+    for _ in range(3):
+        cursor = pages[-1]['pagination']['next_cursor']
+        pages.append(client.get(f'/api/diagnostics?limit=4&cursor={cursor}').get_json())
+
+    body = pages[-1]
+    for previous in reversed(pages[:-1]):
+        body = client.get(f"/api/diagnostics?limit=4&cursor={body['pagination']['prev_cursor']}").get_json()
+        assert body['data'] == previous['data']
+        assert body['pagination']['has_next']
+
+    assert not body['pagination']['has_prev']
+    assert body['pagination']['prev_cursor'] is None
+
+
+def test_invalid_cursor_is_a_bad_request(client):
+    response = client.get('/api/diagnostics?limit=4&cursor=' + raw_cursor(['2026-10-01', 1, 'up']))
+
+    assert response.status_code == 400
+    assert 'cursor' in response.get_json()['error']
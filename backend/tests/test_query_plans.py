@@ -0,0 +1,173 @@
+"""
+Planos de execução (EXPLAIN QUERY PLAN) das consultas do DiagnosticsService
+
+Cada método de leitura do serviço roda com todas as combinações de filtros,
+com e sem o rollup diário, sobre o banco de exemplo e sobre uma cópia com as
+linhas seladas em partições semanais (app.models.partitions). O SQL emitido é
+capturado e cada plano deve respeitar as regras:
+
+- consultas à tabela bruta (e a cada partição) com limite de data (cursor ou
+  epoch) fazem SEARCH por um índice;
+- listagens ordenadas e a exportação não usam B-tree temporária para o ORDER BY,
+  exceto com uma lista de dispositivos (device_id=in:...): o SEARCH por
+  (device_id, date) já seleciona poucas linhas, que a ordenação intercala;
+- nenhuma consulta varre a tabela inteira, exceto agregações sobre o conjunto
+  completo sem predicado indexável (listadas em FULL_SCAN_SHAPES).
+"""
+import itertools
+import re
+import sqlite3
+from collections import namedtuple
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.extensions import db, database
+from app.models import partitions
+from app.services.diagnostics_service import DiagnosticsService
+from app.utils.filters import FILTER_FIELDS, parse
+from app.utils.pagination import CURSOR_NEXT, CURSOR_PREV
+from conftest import create_database, dispose, make_app
+
+# Faixas numéricas (latency_ms=gt:60...) ficam de fora: sem índice, não mudam
+# o caminho de acesso, só filtram as linhas que ele lê
+FILTERS = {
+    'city': 'salv',
+    'state': 'ba',
+    'device_id': 'in:DEV001,DEV002',
+    'start_date': '2024-01-01',
+    'end_date': '2024-01-31',
+}
+
+# Com partições o intervalo de datas cruza as partições dos dias populados
+PARTITIONED_FILTERS = dict(
+    FILTERS,
+    start_date=(date.today() - timedelta(days=3)).isoformat(),
+    end_date=date.today().isoformat(),
+)
+
+# Agregações que precisam ler todas as linhas quando não há limite de data:
+# sem predicado indexável, a varredura completa é o plano ótimo.
+FULL_SCAN_SHAPES = ('aggregate_day', 'statistics', 'percentiles_exact', 'dashboard')
+
+# (id, forma, chamada com os filtros)
+SHAPES = [
+    ('paginated', 'paginated', lambda f: DiagnosticsService.get_diagnostics_paginated(page=50, limit=10, **f)),
+    ('cursor_next', 'cursor_next', lambda f: DiagnosticsService.get_diagnostics_by_cursor(limit=10, cursor=('2024-01-15', 100, CURSOR_NEXT), **f)),
+    ('cursor_prev', 'cursor_prev', lambda f: DiagnosticsService.get_diagnostics_by_cursor(limit=10, cursor=('2024-01-15', 100, CURSOR_PREV), **f)),
+]
+for _group_by in ('day', 'city', 'state'):
+    SHAPES += [
+        (f'aggregate_{_group_by}', f'aggregate_{_group_by}', lambda f, g=_group_by: DiagnosticsService.get_aggregated_by_day(group_by=g, **f)),
+        (f'aggregate_{_group_by}-percentiles', f'aggregate_{_group_by}', lambda f, g=_group_by: DiagnosticsService.get_aggregated_by_day(group_by=g, percentiles=(50, 95, 99), **f)),
+        (f'percentiles_exact-{_group_by}', 'percentiles_exact', lambda f, g=_group_by: DiagnosticsService.get_aggregated_by_day(group_by=g, percentiles=(50, 95, 99), exact=True, **f)),
+    ]
+SHAPES += [
+    ('buckets-1h', 'buckets', lambda f: DiagnosticsService.get_time_buckets(bucket=3600, max_points=10000, **f)),
+    ('buckets-5m', 'buckets', lambda f: DiagnosticsService.get_time_buckets(bucket=300, max_points=50, **f)),
+    ('buckets-15m-lttb', 'buckets', lambda f: DiagnosticsService.get_time_buckets(bucket=900, max_points=50, downsample='lttb', **f)),
+    ('statistics', 'statistics', lambda f: DiagnosticsService.get_statistics(**f)),
+    ('statistics-exact', 'statistics', lambda f: DiagnosticsService.get_statistics(distinct='exact', **f)),
+    ('dashboard', 'dashboard', lambda f: DiagnosticsService.get_dashboard(group_by=('day',), **f)),
+    ('dashboard-all-exact', 'dashboard', lambda f: DiagnosticsService.get_dashboard(group_by=('day', 'city', 'state'), distinct='exact', **f)),
+    ('export', 'export', lambda f: list(DiagnosticsService.iter_diagnostics(chunk_size=1000, **f))),
+]
+
+# Todas as combinações dos campos de FILTERS, da nenhuma à completa
+FILTER_KEYS = [keys for size in range(len(FILTERS) + 1) for keys in itertools.combinations(FILTERS, size)]
+
+PlanDatabase = namedtuple('PlanDatabase', 'app path values captured')
+
+
+def build_filters(keys, values):
+    """Argumentos do serviço para os campos keys, como as rotas os montam"""
+    filters = {key: values[key] for key in keys if key not in FILTER_FIELDS}
+    filters['filters'] = tuple(parse(key, values[key]) for key in keys if key in FILTER_FIELDS)
+    return filters
+
+
+def explain(path, statement, parameters):
+    """Linhas de detalhe do EXPLAIN QUERY PLAN da consulta"""
+    conn = sqlite3.connect(path)
+    try:
+        return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + statement, parameters)]
+    finally:
+        conn.close()
+
+
+def check_plan(name, statement, plan):
+    """Lista de violações de um plano"""
+    problems = []
+    has_date_bound = any(f':{param}' in statement for param in ('start_date', 'end_date', 'cursor_date', 'start_epoch', 'first_epoch'))
+    is_listing = 'LIMIT' in statement or name == 'export'
+    # O rollup tem uma linha por (dia, estado, cidade): varrê-lo é barato
+    raw_tables = set(re.findall(r'\bFROM (diagnostics(?:_p\d+)?)\b', statement))
+
+    if has_date_bound and not all(any(line.startswith(f'SEARCH {table} USING') for line in plan) for table in raw_tables):
+        problems.append('limite de data sem SEARCH por índice')
+
+    by_devices = 'device_id IN' in statement and any('_device_date (device_id=?)' in line for line in plan)
+
+    if is_listing and not by_devices and any('TEMP B-TREE FOR ORDER BY' in line for line in plan):
+        problems.append('ORDER BY sem índice')
+
+    if any(f'SCAN {table}' in plan for table in raw_tables):
+        full_scan_allowed = name in FULL_SCAN_SHAPES and not has_date_bound and 'COUNT(*) as total FROM' not in statement
+        if not full_scan_allowed:
+            problems.append('varredura completa da tabela')
+
+    return problems
+
+
+@pytest.fixture(scope='module', params=[False, True], ids=['unpartitioned', 'partitioned'])
+def plan_database(request, tmp_path_factory):
+    """Banco de exemplo (ou com todas as linhas em partições) com o SQL das leituras capturado"""
+    partitioned = request.param
+    path = tmp_path_factory.mktemp('query_plans') / 'query_plans.db'
+    create_database(path)
+
+    if partitioned:
+        # Todas as linhas populadas vão para partições; diagnostics fica vazia
+        conn = sqlite3.connect(path)
+        partitions.seal(conn, 'week', date.today() + timedelta(days=7))
+        conn.close()
+
+    app = make_app(path)
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    # As leituras saem pelo pool somente leitura, quando habilitado
+    with app.app_context():
+        engines = [engine for engine in (db.engine, database.read_engine) if engine is not None]
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', capture)
+
+    yield PlanDatabase(app, path, PARTITIONED_FILTERS if partitioned else FILTERS, captured)
+
+    for engine in engines:
+        event.remove(engine, 'before_cursor_execute', capture)
+    dispose(app)
+
+
+@pytest.mark.parametrize('rollups', [True, False], ids=['rollups', 'raw'])
+@pytest.mark.parametrize('keys', FILTER_KEYS, ids=['+'.join(keys) or 'no_filters' for keys in FILTER_KEYS])
+@pytest.mark.parametrize('name, call', [shape[1:] for shape in SHAPES], ids=[shape[0] for shape in SHAPES])
+def test_query_plan(plan_database, name, call, keys, rollups):
+    plan_database.app.config['ROLLUPS_ENABLED'] = rollups
+
+    with plan_database.app.app_context():
+        plan_database.captured.clear()
+        call(build_filters(keys, plan_database.values))
+        statements = list(plan_database.captured)
+
+    assert statements, 'nenhuma consulta executada'
+
+    problems = []
+    for statement, parameters in statements:
+        plan = explain(plan_database.path, statement, parameters)
+        problems.extend(f"{problem}: {' | '.join(plan)}" for problem in check_plan(name, statement, plan))
+
+    assert not problems, '\n'.join(problems)
@@ -0,0 +1,210 @@
+"""
+Coalescência de leituras simultâneas (app.services.single_flight)
+
+Em threads (WSGI) e no event loop do modo ASGI, chamadas com a mesma chave
+executam o cálculo uma vez; com o arquivo de lock, chaves diferentes no mesmo
+byte não rodam juntas nem dentro do mesmo processo.
+"""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+from app.extensions import db
+from app.services import single_flight as single_flight_module
+from app.services.diagnostics_service import DiagnosticsService
+from app.services.single_flight import SingleFlight
+
+# Consulta que ocupa o SQLite por algumas centenas de milissegundos
+SLOW_SQL = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 1000000) SELECT COUNT(*) FROM n"
+
+
+def make_flights(**config) -> SingleFlight:
+    app = Flask(__name__)
+    app.config.update(config)
+    return SingleFlight(app)
+
+
+def run_threads(count, target):
+    threads = [threading.Thread(target=target, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return threads
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = make_flights()
+    release = threading.Event()
+    entered = threading.Semaphore(0)
+    executions = []
+    results = [None] * 5
+
+    def compute():
+        executions.append(1)
+        release.wait(5)
+        return {'total': 42}
+
+    def call(index):
+        entered.release()
+        results[index] = flights.do('statistics', 'key', compute)
+
+    def release_after_all_entered():
+        for _ in results:
+            entered.acquire()
+        time.sleep(0.1)
+        release.set()
+
+    releaser = threading.Thread(target=release_after_all_entered)
+    releaser.start()
+    run_threads(len(results), call)
+    releaser.join()
+
+    assert len(executions) == 1
+    assert results == [{'total': 42}] * 5
+    stats = flights.stats()
+    assert (stats['executed'], stats['coalesced'], stats['in_flight']) == (1, 4, 0)
+
+
+def test_followers_receive_the_leader_error():
+    flights = make_flights()
+    release = threading.Event()
+    errors = []
+
+    def compute():
+        release.wait(5)
+        raise ValueError('falhou')
+
+    def call(index):
+        if index:
+            time.sleep(0.1)
+            release.set()
+        try:
+            flights.do('statistics', 'key', compute)
+        except ValueError as e:
+            errors.append(e)
+
+    run_threads(2, call)
+
+    assert len(errors) == 2
+    assert errors[0] is errors[1]
+
+
+def test_follower_times_out_and_computes():
+    flights = make_flights(SINGLE_FLIGHT_TIMEOUT=0.05)
+    release = threading.Event()
+    results = [None, None]
+
+    def call(index):
+        if index:
+            time.sleep(0.02)
+            results[index] = flights.do('statistics', 'key', lambda: 'follower')
+            release.set()
+        else:
+            results[index] = flights.do('statistics', 'key', lambda: release.wait(5) and 'leader')
+
+    run_threads(2, call)
+
+    assert results == ['leader', 'follower']
+    assert flights.stats()['timeouts'] == 1
+
+
+def test_lock_slot_is_exclusive_between_threads(tmp_path, monkeypatch):
+    # Um byte só: todas as chaves disputam o mesmo lock
+    monkeypatch.setattr(single_flight_module, 'LOCK_SLOTS', 1)
+    flights = make_flights(SINGLE_FLIGHT_LOCK_PATH=str(tmp_path / 'single_flight.lock'))
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def compute():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+        return 'ok'
+
+    def call(index):
+        assert flights.do('statistics', f'key-{index}', compute) == 'ok'
+
+    run_threads(3, call)
+
+    assert max(peak) == 1
+    stats = flights.stats()
+    assert stats['executed'] == 3
+    assert stats['lock_waits'] == 2
+
+
+async def asgi_request(adapter, path, query='', method='GET', body=b'', headers=()):
+    """Executa uma requisição HTTP no callable ASGI; retorna (status, corpo)"""
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+        'headers': [(name.encode(), value.encode()) for name, value in headers],
+        'http_version': '1.1', 'scheme': 'http',
+    }
+    response = {'body': b''}
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        else:
+            response['body'] += message.get('body', b'')
+
+    await adapter(scope, receive, send)
+    return response['status'], response['body']
+
+
+def test_asgi_identical_requests_coalesce_without_blocking_the_loop(app_factory, monkeypatch):
+    pytest.importorskip('aiosqlite')
+    from app.asgi import create_asgi_app
+
+    app = app_factory(ASGI_HEAVY_CONCURRENCY=4, SINGLE_FLIGHT_TIMEOUT=10)
+    adapter = create_asgi_app(app)
+    executions = []
+    to_dict = DiagnosticsService._statistics_to_dict
+
+    def slow_to_dict(result):
+        # A consulta passa pelo aiosqlite: o líder devolve o loop enquanto ela roda
+        executions.append(1)
+        db.session.execute(db.text(SLOW_SQL)).scalar()
+        return to_dict(result)
+
+    monkeypatch.setattr(DiagnosticsService, '_statistics_to_dict', staticmethod(slow_to_dict))
+
+    async def scenario():
+        try:
+            status, body = await asgi_request(
+                adapter, '/api/auth/login', method='POST',
+                body=json.dumps({'username': 'admin', 'password': 'admin'}).encode(),
+                headers=[('content-type', 'application/json')],
+            )
+            headers = [('authorization', f"Bearer {json.loads(body)['token']}")]
+
+            started = time.monotonic()
+            responses = await asyncio.gather(*[
+                asgi_request(adapter, '/api/diagnostics/statistics', 'distinct=exact', headers=headers) for _ in range(3)
+            ])
+            return responses, time.monotonic() - started
+        finally:
+            if adapter.engine is not None:
+                await adapter.engine.dispose()
+            adapter.executor.shutdown(wait=False)
+
+    responses, elapsed = asyncio.run(scenario())
+
+    assert [status for status, _ in responses] == [200] * 3
+    assert len({body for _, body in responses}) == 1
+    assert len(executions) == 1
+    stats = app.extensions['single_flight'].stats()
+    assert (stats['coalesced'], stats['timeouts']) == (2, 0)
+    # Esperar num threading.Event travaria o loop até o timeout
+    assert elapsed < 10
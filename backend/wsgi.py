@@ -0,0 +1,11 @@
+"""
+Ponto de entrada WSGI de produção
+
+    flask --app wsgi init-db
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Só cria a aplicação: o banco é preparado antes, uma vez, por `flask init-db`.
+"""
+from app import create_app
+
+app = create_app()
@@ -27,22 +27,26 @@ function DiagnosticsCharts() {
   });
   const [groupBy, setGroupBy] = useState('day');
 
-  const fetchAggregatedData = async () => {
+  const fetchDashboard = async () => {
     setLoading(true);
     setError('');
 
+    // Estatísticas e agregação numa só requisição; a página de diagnósticos
+    // que acompanha a resposta não é exibida aqui
     const params = {
       group_by: groupBy,
+      limit: 1,
       ...(appliedFilters.city && { city: appliedFilters.city }),
       ...(appliedFilters.state && { state: appliedFilters.state }),
       ...(appliedFilters.startDate && { start_date: appliedFilters.startDate }),
       ...(appliedFilters.endDate && { end_date: appliedFilters.endDate }),
     };
 
-    const result = await diagnosticsService.getAggregatedData(params);
+    const result = await diagnosticsService.getDashboard(params);
 
     if (result.success) {
-      setData(result.data);
+      setData(result.data.aggregates[groupBy]);
+      setStats(result.data.statistics);
     } else {
       setError(result.message);
       setData([]);
@@ -51,24 +55,8 @@ function DiagnosticsCharts() {
     setLoading(false);
   };
 
-  const fetchStatistics = async () => {
-    const params = {
-      ...(appliedFilters.city && { city: appliedFilters.city }),
-      ...(appliedFilters.state && { state: appliedFilters.state }),
-      ...(appliedFilters.startDate && { start_date: appliedFilters.startDate }),
-      ...(appliedFilters.endDate && { end_date: appliedFilters.endDate }),
-    };
-
-    const result = await diagnosticsService.getStatistics(params);
-    
-    if (result.success) {
-      setStats(result.data);
-    }
-  };
-
   useEffect(() => {
-    fetchAggregatedData();
-    fetchStatistics();
+    fetchDashboard();
   }, [appliedFilters, groupBy]);
 
   const handleApplyFilters = (filters) => {
@@ -69,6 +69,22 @@ class DiagnosticsService {
       };
     }
   }
+
+  async getDashboard(params = {}) {
+    try {
+      const response = await api.get('/diagnostics/dashboard', { params });
+      return {
+        success: true,
+        data: response.data.data,
+        pagination: response.data.pagination,
+      };
+    } catch (error) {
+      return {
+        success: false,
+        message: error.response?.data?.error || 'Erro ao buscar painel',
+      };
+    }
+  }
 }
 
 export default new DiagnosticsService();